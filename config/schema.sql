@@ -1,31 +1,138 @@
 Database schema: 
 
 CREATE TABLE top_tweets ( 
-  tweet_id varchar PRIMARY KEY, 
-  score integer DEFAULT 0, 
+  query_id varchar NOT NULL,
+  time_window varchar NOT NULL,
+  metric varchar NOT NULL DEFAULT 'score',
+  rank integer NOT NULL,
+  tweet_id bigint NOT NULL, 
+  score double precision DEFAULT 0, 
   likes integer DEFAULT 0, 
   retweets integer DEFAULT 0, 
+  replies integer DEFAULT 0,
   quotes integer DEFAULT 0, 
+  partial boolean DEFAULT false,
+  tweet text,
+  updated_at timestamp,
+  PRIMARY KEY (query_id, time_window, metric, rank));
+
+Snapshots of every publish, one partition per day (partitions are created and dropped by storage.py):
+
+CREATE TABLE top_tweets_history (
+  captured_at timestamp NOT NULL,
+  query_id varchar NOT NULL,
+  time_window varchar NOT NULL,
+  metric varchar NOT NULL DEFAULT 'score',
+  rank integer NOT NULL,
+  tweet_id bigint NOT NULL,
+  score double precision DEFAULT 0,
+  likes integer DEFAULT 0,
+  retweets integer DEFAULT 0,
   replies integer DEFAULT 0,
-  updated_at timestamp);
+  quotes integer DEFAULT 0,
+  partial boolean DEFAULT false) PARTITION BY RANGE (captured_at);
+CREATE INDEX top_tweets_history_query ON top_tweets_history (query_id, time_window, metric, captured_at);
+CREATE TABLE top_tweets_history_20220120 PARTITION OF top_tweets_history FOR VALUES FROM ('2022-01-20') TO ('2022-01-21');
       
-Example insert:
+Example upsert (only ranks whose Tweet or metrics changed are written):
   
-  INSERT INTO top_tweets (tweet_id,score,likes,retweets,replies,quotes,updated_at) VALUES (1484265578202382336,129,121,4,3,1,2022-01-20 17:40:30.764571);
+  INSERT INTO top_tweets (query_id,time_window,metric,rank,tweet_id,score,likes,retweets,replies,quotes,partial,updated_at)
+    VALUES ('default','24h','score',1,1484265578202382336,129,121,4,3,1,false,'2022-01-20 17:40:30')
+    ON CONFLICT (query_id, time_window, metric, rank) DO UPDATE SET tweet_id = EXCLUDED.tweet_id, ...;
+
+Reading one ranking:
+
+  SELECT * FROM top_tweets WHERE query_id = 'default' AND time_window = '24h' AND metric = 'score' ORDER BY rank;
+
+Metrics: 'score' (the scoring formula, optionally time-decayed); with --windows, 'likes', 'retweets', 'replies'
+and 'quotes' (see --metrics), and with --snapshots, 'rising' (engagement velocity per hour). The
+score column holds the value ranked by.
+
+With --two-phase, the tweet column holds each top Tweet as looked up (the requested fields, with
+expansions inlined), as JSON text; it is NULL otherwise. It is not kept in top_tweets_history.
+
+Top authors, hashtags, mentions and media (with --aggregates), replaced whole on each publish:
+
+CREATE TABLE top_entities (
+  query_id varchar NOT NULL,
+  time_window varchar NOT NULL,
+  dimension varchar NOT NULL,
+  rank integer NOT NULL,
+  entity varchar NOT NULL,
+  label varchar,
+  tweets integer DEFAULT 0,
+  engagement double precision DEFAULT 0,
+  updated_at timestamp,
+  PRIMARY KEY (query_id, time_window, dimension, rank));
+
+Dimensions: 'authors' (entity is the author ID, label the username), 'hashtags', 'mentions' and
+'media' (entity is the media key, label its URL or type).
 
 
 Notes:
 
+  Moving from the single-ranking table (keyed by tweet_id)? Keep the old rows aside and let storage.py create the new table:
+
+  ALTER TABLE top_tweets RENAME TO top_tweets_v1;
+
+  storage.py does this itself (logging a warning) when it finds a top_tweets table without the query_id, time_window
+  and metric columns, and stops with an error if top_tweets_v1 is already taken. To keep the rows of a table keyed
+  by (query_id, time_window, rank) in place instead, add the metric column as below before upgrading.
+
+  Adding metrics to rankings keyed by (query_id, time_window, rank):
+
+  ALTER TABLE top_tweets ADD COLUMN metric varchar NOT NULL DEFAULT 'score';
+  ALTER TABLE top_tweets DROP CONSTRAINT top_tweets_pkey, ADD PRIMARY KEY (query_id, time_window, metric, rank);
+  ALTER TABLE top_tweets_history ADD COLUMN metric varchar NOT NULL DEFAULT 'score';
+
   Need to change the Type? 
 
   ALTER TABLE top_tweets ALTER COLUMN updated_at TYPE timestamp;
+
+  Flagging rankings from collection cycles cut short by their time budget (--time-budget)?
+
+  ALTER TABLE top_tweets ADD COLUMN partial boolean DEFAULT false;
+
+  Keeping the hydrated Tweets of --two-phase rankings (storage.py adds this column if it is missing):
+
+  ALTER TABLE top_tweets ADD COLUMN tweet text;
   
-  Persisting other 'top Tweet' metadata? 
+  Per-cycle stats, one row per query per collection cycle (written by top_tweets.py and snowbot_retweets.py):
   
   CREATE TABLE top_tweet_stats (
-    tweet_volume_cycle integer DEFAULT 0,
     search_query varchar,
+    query_id varchar,
+    time_window varchar,
+    tweet_volume_cycle integer DEFAULT 0,
+    candidates_cycle integer DEFAULT 0,
+    top_tweets_cycle integer DEFAULT 0,
+    pages_cycle integer DEFAULT 0,
     requests_cycle integer DEFAULT 0,
-    updated_at timestamp;
-    );
+    retries_cycle integer DEFAULT 0,
+    bytes_cycle bigint DEFAULT 0,
+    partial boolean DEFAULT false,
+    collect_seconds real,
+    rank_seconds real,
+    hydrate_seconds real,
+    publish_seconds real,
+    cycle_seconds real,
+    updated_at timestamp);
+
+  Adding the newer columns to an existing top_tweet_stats table:
+
+  ALTER TABLE top_tweet_stats ADD COLUMN query_id varchar, ADD COLUMN time_window varchar,
+    ADD COLUMN candidates_cycle integer DEFAULT 0, ADD COLUMN top_tweets_cycle integer DEFAULT 0,
+    ADD COLUMN pages_cycle integer DEFAULT 0, ADD COLUMN retries_cycle integer DEFAULT 0,
+    ADD COLUMN bytes_cycle bigint DEFAULT 0, ADD COLUMN partial boolean DEFAULT false,
+    ADD COLUMN collect_seconds real, ADD COLUMN rank_seconds real, ADD COLUMN hydrate_seconds real,
+    ADD COLUMN publish_seconds real, ADD COLUMN cycle_seconds real;
+
+
+  Tweets already surfaced by the bot, per query (created on first use by storage.py):
 
+  CREATE TABLE surfaced_tweets (
+    query_id varchar NOT NULL,
+    tweet_id bigint NOT NULL,
+    surfaced_at bigint NOT NULL,
+    PRIMARY KEY (query_id, tweet_id));
+  CREATE INDEX surfaced_tweets_surfaced_at ON surfaced_tweets (surfaced_at);
@@ -1,9 +1,60 @@
 # Copyright 2020 Twitter, Inc.
 # Licensed under the MIT License
 # https://opensource.org/licenses/MIT
-from .result_stream import ResultStream, collect_results
-from .api_utils import *
-from .credentials import *
-from .utils import *
+"""
+Submodules are imported when one of their names is first used (PEP 562), so
+``import searchtweets`` is cheap and a script only pays for the subsystems it
+uses: yaml only with config files, multiprocessing only with workers, and so
+on.
+"""
+import importlib
+
 from ._version import VERSION
 __version__ = VERSION
+
+# Submodule -> the names it exports (its __all__), in the order they were star-imported.
+_EXPORTS = {"result_stream": ["ResultStream", "collect_results"],
+            "lookup": ["hydrate_tweets", "LOOKUP_BATCH_SIZE"],
+            "query": ["parse_query", "split_query", "Query", "QUERY_LENGTH_LIMIT", "MATCH_TWEET_FIELDS",
+                      "MATCH_EXPANSIONS"],
+            "ranking": ["TopK", "RollingTopK", "WindowedTopK", "EarlyStop", "engagement_score", "snowflake_seconds"],
+            "decay": ["HalfLifeDecay", "GravityDecay", "DecayedRanking", "make_decay"],
+            "multi_query": ["QueryBatch", "plan_query_batches", "MultiQueryCollector", "SplitQueryStream"],
+            "dedup": ["SeenIds", "BloomFilter", "dedupe_tweets", "original_tweet_id"],
+            "scoring": ["Scorer", "compile_formula", "DEFAULT_FORMULA"],
+            "filtered_stream": ["FilteredStream", "FILTERED_STREAM_ENDPOINT"],
+            "snapshots": ["MetricSnapshotStore", "SNAPSHOT_METRICS"],
+            "sketches": ["SpaceSaving", "CountMinSketch", "HeavyHitters"],
+            "aggregation": ["Aggregator", "KeyedCounter", "AGGREGATE_DIMENSIONS", "AGGREGATE_FIELDS"],
+            "external_sort": ["ExternalRanker"],
+            "batches": ["TweetBatch", "BATCH_COLUMNS"],
+            "archive": ["ArchiveWriter", "ColumnarArchive", "write_columnar", "read_archives", "ARCHIVE_SUFFIX"],
+            "counts": ["CountSeries", "CountsCollector", "GRANULARITY_SECONDS"],
+            "page_cache": ["PageCache"],
+            "api_utils": ["gen_request_parameters", "gen_params_from_config", "infer_endpoint",
+                          "change_to_count_endpoint", "change_to_lookup_endpoint", "validate_count_api",
+                          "convert_utc_time", "is_relative_time"],
+            "credentials": ["load_credentials"],
+            "utils": ["take", "partition", "merge_dicts", "write_result_stream", "read_config",
+                      "read_config_snapshot", "load_config_snapshot", "save_config_snapshot",
+                      "config_file_stat"]}
+
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = list(_MODULES)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return importlib.import_module("." + name, __name__)
+    module = _MODULES.get(name)
+    if module is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module("." + module, __name__), name)
+    # Cached, so later lookups don't come through here.
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
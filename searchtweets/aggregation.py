@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 Twitter, Inc.
+# Licensed under the MIT License
+# https://opensource.org/licenses/MIT
+"""
+One-pass aggregation of search results along several dimensions at once:
+top Tweets, and top authors, hashtags, mentions and media, from the same
+pages. Each Tweet is scored once, and every dimension is updated from that
+one read of it.
+
+Entity counts are kept in ``KeyedCounter``s, compact hash aggregations: a
+dict interns each key to a slot, and the per-key Tweet counts and engagement
+totals live in typed arrays rather than in a Python object per key. Where
+even that is too much (month-long backfills), ``sketch_epsilon`` swaps them
+for fixed-memory ``HeavyHitters`` sketches.
+"""
+
+import heapq
+import logging
+from array import array
+
+from .ranking import TopK, engagement_score
+from .sketches import HeavyHitters
+
+__all__ = ["Aggregator", "KeyedCounter", "AGGREGATE_DIMENSIONS", "AGGREGATE_FIELDS"]
+
+logger = logging.getLogger(__name__)
+
+AGGREGATE_DIMENSIONS = ("tweets", "authors", "hashtags", "mentions", "media")
+
+# What the search request needs for each dimension: tweet.fields, and expansions for labels.
+AGGREGATE_FIELDS = {"tweets": ("public_metrics", None),
+                    "authors": ("author_id", "author_id"),
+                    "hashtags": ("entities", None),
+                    "mentions": ("entities", None),
+                    "media": ("attachments", "attachments.media_keys")}
+
+
+class KeyedCounter:
+    """
+    Counts Tweets, and totals their engagement, per key (an author ID, a
+    hashtag, ...).
+
+    Example:
+        >>> counter = KeyedCounter()
+        >>> counter.add("snow", 12)
+        >>> counter.add("snow", 3)
+        >>> counter.top(1)
+        [('snow', 2, 15.0)]
+    """
+
+    def __init__(self):
+        self._slots = {}
+        self._keys = []
+        self.counts = array("q")
+        self.engagement = array("d")
+
+    def add(self, key, engagement=0):
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = len(self._keys)
+            self._keys.append(key)
+            self.counts.append(1)
+            self.engagement.append(engagement)
+            return
+        self.counts[slot] += 1
+        self.engagement[slot] += engagement
+
+    def top(self, k, by="count"):
+        """
+        The ``k`` top keys by Tweet ``count`` or total ``engagement``, as
+        ``(key, count, engagement)``, highest first; ties go to the other
+        measure.
+        """
+        counts, engagement = self.counts, self.engagement
+        if by == "count":
+            rank = lambda slot: (counts[slot], engagement[slot])
+        elif by == "engagement":
+            rank = lambda slot: (engagement[slot], counts[slot])
+        else:
+            raise ValueError("rank by 'count' or 'engagement', not '{}'".format(by))
+        return [(self._keys[slot], counts[slot], engagement[slot])
+                for slot in heapq.nlargest(k, range(len(self._keys)), key=rank)]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+
+class Aggregator:
+    """
+    Aggregates pages of search results along several dimensions in one pass,
+    and emits every result set at the end.
+
+    Args:
+        k (int): how many entries each result set keeps.
+        dimensions (iterable): any of ``AGGREGATE_DIMENSIONS``.
+        score_func (function): maps a Tweet to its score. Defaults to
+            ``engagement_score``.
+        by (str): rank authors, hashtags, mentions and media by Tweet
+            ``count`` or total ``engagement``.
+        sketch_epsilon (float): if set, count authors, hashtags, mentions and
+            media approximately, in fixed memory, with counts overestimated by
+            at most this fraction of the total (see ``HeavyHitters``).
+
+    Example:
+        >>> agg = Aggregator(10, dimensions=("tweets", "authors", "hashtags"))
+        >>> rs = ResultStream(output_format="r", **search_args)
+        >>> results = agg.consume(rs)
+        >>> results["hashtags"][0]
+        {'key': 'snow', 'label': 'snow', 'tweets': 412, 'engagement': 9800.0}
+    """
+
+    def __init__(self, k=10, dimensions=AGGREGATE_DIMENSIONS, score_func=engagement_score, by="count",
+                 sketch_epsilon=None):
+        dimensions = tuple(dimensions)
+        unknown = set(dimensions) - set(AGGREGATE_DIMENSIONS)
+        if unknown:
+            raise ValueError("unknown dimensions {}; use any of {}".format(
+                ", ".join(sorted(unknown)), ", ".join(AGGREGATE_DIMENSIONS)))
+        self.k = int(k)
+        self.dimensions = dimensions
+        self.score_func = score_func
+        self.by = by
+        self.n_tweets = 0
+        self.n_pages = 0
+        self.top_tweets = TopK(k, score_func) if "tweets" in dimensions else None
+        self.counters = {dimension: KeyedCounter() if sketch_epsilon is None else HeavyHitters(sketch_epsilon, by=by)
+                         for dimension in dimensions if dimension != "tweets"}
+        # Labels (usernames, media types and URLs) of counted keys, from the includes.
+        self.labels = {dimension: {} for dimension in ("authors", "media") if dimension in dimensions}
+
+    def add_tweets(self, tweets, includes=None, scores=None):
+        """
+        Aggregates a page of Tweets ('r' output format, or Tweets from it),
+        with the page's ``includes`` for labels. ``scores`` may pass in
+        scores already computed for the page.
+        """
+        self.n_pages += 1
+        if scores is None:
+            scores = [self.score_func(tweet) for tweet in tweets]
+        authors = self.counters.get("authors")
+        hashtags = self.counters.get("hashtags")
+        mentions = self.counters.get("mentions")
+        media = self.counters.get("media")
+
+        for tweet, score in zip(tweets, scores):
+            self.n_tweets += 1
+            if self.top_tweets is not None:
+                self.top_tweets.add(tweet, score)
+            if authors is not None and "author_id" in tweet:
+                authors.add(tweet["author_id"], score)
+            entities = tweet.get("entities")
+            if entities:
+                if hashtags is not None:
+                    # A tag repeated in one Tweet counts once.
+                    for tag in {hashtag["tag"].lower() for hashtag in entities.get("hashtags", ())}:
+                        hashtags.add(tag, score)
+                if mentions is not None:
+                    for username in {mention["username"].lower() for mention in entities.get("mentions", ())}:
+                        mentions.add(username, score)
+            if media is not None and "attachments" in tweet:
+                for media_key in tweet["attachments"].get("media_keys", ()):
+                    media.add(media_key, score)
+
+        if includes:
+            self._add_labels(includes)
+
+    def add_page(self, page):
+        """
+        Aggregates one response page ('r' output format).
+        """
+        self.add_tweets(page.get("data", []), page.get("includes"))
+
+    def consume(self, result_stream):
+        """
+        Aggregates every page of a ``ResultStream`` (or ``SplitQueryStream``)
+        set up with the 'r' output format, and returns ``results()``.
+        """
+        for page in result_stream.stream():
+            self.add_page(page)
+        return self.results()
+
+    def _add_labels(self, includes):
+        if "authors" in self.labels:
+            labels, counted = self.labels["authors"], self.counters["authors"]
+            for user in includes.get("users", ()):
+                if user["id"] in counted:
+                    labels[user["id"]] = user.get("username", user["id"])
+        if "media" in self.labels:
+            labels, counted = self.labels["media"], self.counters["media"]
+            for item in includes.get("media", ()):
+                if item["media_key"] in counted:
+                    labels[item["media_key"]] = item.get("url") or item.get("preview_image_url") or item.get("type")
+        # Sketches forget keys, so drop their labels too, to keep memory fixed.
+        for dimension, labels in self.labels.items():
+            counted = self.counters[dimension]
+            if len(labels) > 2 * len(counted) + 64:
+                self.labels[dimension] = {key: label for key, label in labels.items() if key in counted}
+
+    def results(self):
+        """
+        Every result set, by dimension. Tweets are ``{"id", "score"}`` dicts;
+        the other dimensions are ``{"key", "label", "tweets", "engagement"}``
+        dicts, ``label`` being the username for authors and the URL (or type)
+        for media.
+        """
+        results = {}
+        if self.top_tweets is not None:
+            results["tweets"] = [{"id": tweet["id"], "score": score} for score, tweet in self.top_tweets.ranked()]
+        for dimension, counter in self.counters.items():
+            labels = self.labels.get(dimension, {})
+            results[dimension] = [{"key": key, "label": labels.get(key, key), "tweets": count, "engagement": engagement}
+                                  for key, count, engagement in counter.top(self.k, self.by)]
+        return results
@@ -7,9 +7,9 @@ Module containing the various functions that are used for API calls,
 request payload generation, and related.
 """
 
+import re
 import datetime
 import os
-from dateutil.relativedelta import *
 import logging
 try:
     import ujson as json
@@ -20,11 +20,24 @@ __all__ = ["gen_request_parameters",
            "gen_params_from_config",
            "infer_endpoint",
            "change_to_count_endpoint",
+           "change_to_lookup_endpoint",
            "validate_count_api",
-           "convert_utc_time"]
+           "convert_utc_time",
+           "is_relative_time"]
 
 logger = logging.getLogger(__name__)
 
+# Times relative to now, as convert_utc_time takes them: '15m', '12h', '3d', '1.5d'.
+_RELATIVE_TIME_RE = re.compile(r"^\d+(\.\d+)?[mhd]$")
+
+
+def is_relative_time(datetime_str):
+    """
+    Whether a time is relative to now ('15m', '12h', '3d'), and so
+    resolves differently each time ``convert_utc_time`` is called.
+    """
+    return bool(datetime_str) and bool(_RELATIVE_TIME_RE.match(str(datetime_str).strip()))
+
 def convert_utc_time(datetime_str):
     """
     Handles datetime argument conversion to the Labs API format, which is
@@ -60,16 +73,17 @@ def convert_utc_time(datetime_str):
     if not datetime_str:
         return None
     try:
-        if len(datetime_str) <= 5:
+        if is_relative_time(datetime_str):
+            datetime_str = datetime_str.strip()
             _date = datetime.datetime.utcnow()
             #parse out numeric character.
             num = float(datetime_str[:-1])
-            if 'd' in datetime_str:
-                _date = (_date + relativedelta(days=-num))
-            elif 'h' in datetime_str:
-                _date = (_date + relativedelta(hours=-num))
-            elif 'm' in datetime_str:
-                _date = (_date + relativedelta(minutes=-num))
+            if datetime_str.endswith('d'):
+                _date = (_date + datetime.timedelta(days=-num))
+            elif datetime_str.endswith('h'):
+                _date = (_date + datetime.timedelta(hours=-num))
+            else:
+                _date = (_date + datetime.timedelta(minutes=-num))
         elif not set(['-', ':']) & set(datetime_str):
             _date = datetime.datetime.strptime(datetime_str, "%Y%m%d%H%M")
         elif 'T' in datetime_str:
@@ -88,7 +102,7 @@ def gen_request_parameters(query, granularity=None, results_per_call=None,
                            start_time=None, end_time=None, since_id=None, until_id=None,
                            tweet_fields=None, user_fields=None, media_fields=None,
                            place_fields=None, poll_fields=None,
-                           expansions=None,
+                           expansions=None, sort_order=None,
                            stringify=True):
 
     """
@@ -108,6 +122,7 @@ def gen_request_parameters(query, granularity=None, results_per_call=None,
         tweet_fields (string): comma-delimted list of Tweet JSON attributes wanted in endpoint responses. Default is "id,created_at,text").
         Also user_fields, media_fields, place_fields, poll_fields
         expansions (string): comma-delimited list of object expansions.
+        sort_order (string): 'recency' (the API default) or 'relevancy'.
         stringify (bool): specifies the return type, `dict`
             or json-formatted `str`.
 
@@ -152,6 +167,8 @@ def gen_request_parameters(query, granularity=None, results_per_call=None,
             payload["poll.fields"] = poll_fields
         if expansions:
             payload["expansions"] = expansions
+        if sort_order:
+            payload["sort_order"] = sort_order
 
     return json.dumps(payload) if stringify else payload
 
@@ -190,6 +207,21 @@ def change_to_count_endpoint(endpoint):
         endpoint = base[0] + 'tweets/counts/' + search_type
         return endpoint
 
+def change_to_lookup_endpoint(endpoint):
+    """Utility function to change a search or counts endpoint to the Tweet
+    lookup endpoint on the same host.
+    Args:
+        endpoint (str): your api endpoint
+    Returns:
+        str: the Tweet lookup endpoint.
+
+        Recent search Tweet endpoint:  https://api.twitter.com/2/tweets/search/recent
+        Tweet lookup endpoint:         https://api.twitter.com/2/tweets
+
+    """
+    base = endpoint.split('tweets')
+    return base[0] + 'tweets'
+
 def gen_params_from_config(config_dict):
     """
     Generates parameters for a ResultStream from a dictionary.
@@ -210,6 +242,12 @@ def gen_params_from_config(config_dict):
         else:
             return arg
 
+    def floatify(arg):
+        if not isinstance(arg, (int, float)) and arg is not None:
+            return float(arg)
+        else:
+            return arg
+
     # This numeric parameter comes in as a string when it's parsed
     results_per_call = intify(config_dict.get("results_per_call", None))
 
@@ -224,6 +262,8 @@ def gen_params_from_config(config_dict):
         config_dict['query'] = os.getenv('query', None)
     if 'tweet_fields' not in config_dict.keys():
         config_dict['tweet_fields'] = os.getenv('tweet_fields', None)
+    if config_dict.get('time_budget') is None:
+        config_dict['time_budget'] = os.getenv('time_budget', None)
 
 
     query = gen_request_parameters(query=config_dict["query"],
@@ -238,6 +278,7 @@ def gen_params_from_config(config_dict):
                             place_fields=config_dict.get("place_fields", None),
                             poll_fields=config_dict.get("poll_fields", None),
                             expansions=config_dict.get("expansions", None),
+                            sort_order=config_dict.get("sort_order", None),
                             results_per_call=results_per_call)
 
     _dict = {"endpoint": endpoint,
@@ -247,7 +288,11 @@ def gen_params_from_config(config_dict):
              "results_per_file": intify(config_dict.get("results_per_file")),
              "max_tweets": intify(config_dict.get("max_tweets")),
              "max_pages": intify(config_dict.get("max_pages", None)),
-             "output_format": config_dict.get("output_format")}
+             "output_format": config_dict.get("output_format"),
+             "time_budget": floatify(config_dict.get("time_budget")),
+             "reserve_seconds": floatify(config_dict.get("reserve_seconds")),
+             "workers": intify(config_dict.get("workers")),
+             "cache": config_dict.get("cache_dir")}
 
     return _dict
 
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 Twitter, Inc.
+# Licensed under the MIT License
+# https://opensource.org/licenses/MIT
+"""
+Columnar archive files of Tweets and their public metrics, a compact
+alternative to ndjson for keeping each cycle's results (say, hourly metric
+snapshots over weeks). A file is laid out as::
+
+    magic | column blocks, each 8-byte aligned | footer (JSON) | footer length (int64) | magic
+
+Columns are typed (int64 ``id`` and ``created_at`` in epoch milliseconds,
+int32 metrics), ``author_id`` is dictionary-encoded (int32 codes into an
+int64 dictionary), and Tweet texts, if kept, are one UTF-8 blob with
+offsets. The footer records where each column is and its min, max and sum.
+
+``ColumnarArchive`` memory-maps a file and reads only the columns asked for;
+with numpy they come out as arrays over the mapping, with no copy at all.
+``read_archives`` uses the column statistics to skip whole files.
+"""
+
+import os
+import sys
+import mmap
+import time
+import struct
+import logging
+from array import array
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .batches import TweetBatch, BATCH_COLUMNS
+
+__all__ = ["ArchiveWriter", "ColumnarArchive", "write_columnar", "read_archives", "ARCHIVE_SUFFIX"]
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIX = ".col"
+_MAGIC = b"TWCOL\x001\x00"
+_FOOTER_LENGTH = struct.Struct("<q")
+_ALIGN = 8
+
+# Tweets buffered as dicts before they are added to the batch being built.
+_BUFFERED_TWEETS = 1000
+
+
+def _dictionary_encode(values):
+    # Codes by first appearance; dicts keep insertion order, so the keys are the dictionary.
+    slots = {}
+    codes = array("i", [slots.setdefault(value, len(slots)) for value in values])
+    return codes, array("q", slots)
+
+
+def write_columnar(filename, batch, metadata=None, text=True):
+    """
+    Writes a ``TweetBatch`` to a columnar archive file.
+
+    Args:
+        filename (str): file to write; it is replaced if it exists.
+        batch (TweetBatch): the Tweets.
+        metadata (dict): anything JSON-serializable to keep in the footer,
+            such as the query.
+        text (bool): keep the Tweet texts; leave them out for metric
+            snapshots.
+
+    Returns:
+        int: the size of the file, in bytes.
+    """
+    blocks = []
+    for name in BATCH_COLUMNS:
+        values = batch.columns[name]
+        # Statistics are of the values themselves, so author_id's are of the IDs, not the codes.
+        stats = {"min": min(values), "max": max(values), "sum": sum(values)} if len(values) else {}
+        if name == "author_id":
+            codes, dictionary = _dictionary_encode(values)
+            blocks.append((name, codes, dict(stats, encoding="dictionary", dictionary="author_id.dictionary",
+                                             distinct=len(dictionary))))
+            blocks.append(("author_id.dictionary", dictionary, {}))
+        else:
+            blocks.append((name, values, stats))
+    if text:
+        blocks.append(("text", array("B", batch.text), {}))
+        blocks.append(("text.offsets", batch.text_offsets, {}))
+
+    columns = {}
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as f:
+        f.write(_MAGIC)
+        for name, values, info in blocks:
+            offset = f.tell()
+            f.write(values.tobytes())
+            columns[name] = dict(info, type=values.typecode, offset=offset, length=len(values))
+            f.write(bytes(-f.tell() % _ALIGN))
+        footer = json.dumps({"version": 1,
+                             "rows": len(batch),
+                             "byteorder": sys.byteorder,
+                             "written_at": int(time.time() * 1000),
+                             "metadata": metadata or {},
+                             "columns": columns}).encode("utf-8")
+        f.write(footer)
+        f.write(_FOOTER_LENGTH.pack(len(footer)))
+        f.write(_MAGIC)
+        size = f.tell()
+    os.replace(tmp_filename, filename)
+    logger.info("wrote {} Tweets ({} bytes) to {}".format(len(batch), size, filename))
+    return size
+
+
+class ArchiveWriter:
+    """
+    Collects Tweets and writes them to a columnar archive file on ``close``.
+    Takes what any ``ResultStream`` output format yields: Tweets (raw or
+    expanded), response pages, ``TweetBatch``es; the ``includes`` and
+    ``meta`` messages of the 'm' format are passed over.
+
+    Example:
+        >>> with ArchiveWriter("snow_2021-06-01T03.col", metadata={"query": "snow"}) as archive:
+        ...     for tweet in ResultStream(**search_args).stream():
+        ...         archive.add(tweet)
+    """
+
+    def __init__(self, filename, metadata=None, text=True):
+        self.filename = filename
+        self.metadata = metadata
+        self.text = text
+        self.batch = TweetBatch()
+        self._buffer = []
+
+    def add(self, item):
+        if isinstance(item, TweetBatch):
+            self._flush()
+            self.batch.append_batch(item)
+            return
+        if "data" in item:
+            self.add_tweets(item["data"])
+            return
+        if "id" not in item:
+            return
+        self._buffer.append(item)
+        if len(self._buffer) >= _BUFFERED_TWEETS:
+            self._flush()
+
+    def add_tweets(self, tweets):
+        for tweet in tweets:
+            self.add(tweet)
+
+    def _flush(self):
+        self.batch.extend(self._buffer)
+        self._buffer = []
+
+    def __len__(self):
+        return len(self.batch) + len(self._buffer)
+
+    def close(self):
+        """
+        Writes the file. Returns its size, in bytes.
+        """
+        self._flush()
+        return write_columnar(self.filename, self.batch, self.metadata, self.text)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+
+
+class ColumnarArchive:
+    """
+    A columnar archive file, memory-mapped; columns are read when asked for.
+
+    Attributes:
+        rows (int): how many Tweets are in the file.
+        metadata (dict): what the writer kept in the footer.
+        written_at (int): when the file was written, in epoch milliseconds.
+
+    Example:
+        >>> with ColumnarArchive("snow_2021-06-01T03.col") as archive:
+        ...     ids, likes = archive.column("id"), archive.column("likes")
+        ...     archive.stats("likes")
+        {'min': 0, 'max': 5123, 'sum': 81234}
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError("{} is empty, not a columnar archive".format(filename))
+        size = len(self._map)
+        tail = len(_MAGIC) + _FOOTER_LENGTH.size
+        if size < len(_MAGIC) + tail or self._map[:len(_MAGIC)] != _MAGIC or self._map[-len(_MAGIC):] != _MAGIC:
+            self.close()
+            raise ValueError("{} is not a columnar archive".format(filename))
+        footer_length, = _FOOTER_LENGTH.unpack_from(self._map, size - tail)
+        footer = json.loads(self._map[size - tail - footer_length:size - tail].decode("utf-8"))
+        if footer["byteorder"] != sys.byteorder:
+            self.close()
+            raise ValueError("{} was written on a {}-endian machine".format(filename, footer["byteorder"]))
+        self.rows = footer["rows"]
+        self.metadata = footer["metadata"]
+        self.written_at = footer["written_at"]
+        self._columns = footer["columns"]
+
+    @property
+    def columns(self):
+        """Names of the columns that can be read."""
+        return [name for name in self._columns if "." not in name]
+
+    def stats(self, name):
+        """
+        The ``min``, ``max`` and ``sum`` of a column, from the footer (no
+        data is read); None for an empty file.
+        """
+        column = self._columns[name]
+        return {stat: column.get(stat) for stat in ("min", "max", "sum")}
+
+    def _raw(self, name):
+        column = self._columns[name]
+        typecode, offset, length = column["type"], column["offset"], column["length"]
+        if np is not None:
+            return np.frombuffer(self._map, dtype=typecode, count=length, offset=offset)
+        values = array(typecode)
+        values.frombytes(self._map[offset:offset + length * values.itemsize])
+        return values
+
+    def column(self, name):
+        """
+        A column: a numpy array over the mapped file if numpy is installed,
+        otherwise an ``array.array`` copied from it. ``author_id`` is
+        decoded from its dictionary, and ``text`` is a list of strings, as
+        from ``texts``.
+        """
+        if name not in self.columns:
+            raise KeyError("no column '{}' in {}; it has {}".format(name, self.filename, ", ".join(self.columns)))
+        if name == "text":
+            return self.texts()
+        values = self._raw(name)
+        if self._columns[name].get("encoding") == "dictionary":
+            dictionary = self._raw(self._columns[name]["dictionary"])
+            if np is not None:
+                return dictionary[values]
+            return array("q", [dictionary[code] for code in values])
+        return values
+
+    def read(self, names):
+        """The columns named, by name."""
+        return {name: self.column(name) for name in names}
+
+    def texts(self):
+        """Every Tweet's text, in order, if the file kept them."""
+        if "text" not in self._columns:
+            raise KeyError("{} was written without texts".format(self.filename))
+        text, offsets = self._columns["text"], self._raw("text.offsets")
+        start = text["offset"]
+        return [self._map[start + offsets[i]:start + offsets[i + 1]].decode("utf-8") for i in range(self.rows)]
+
+    def overlaps(self, name, low=None, high=None):
+        """
+        Whether any value of a column may be in ``[low, high]``, by its
+        statistics. False means the file can be skipped.
+        """
+        stats = self.stats(name)
+        if stats["min"] is None:
+            return False
+        return (low is None or stats["max"] >= low) and (high is None or stats["min"] <= high)
+
+    def close(self):
+        try:
+            self._map.close()
+        except BufferError:
+            # numpy columns still point into the mapping; it is unmapped once they are gone.
+            pass
+        self._file.close()
+
+    def __len__(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return "ColumnarArchive({!r}, {} Tweets)".format(self.filename, self.rows)
+
+
+def read_archives(filenames, names, where=None):
+    """
+    Reads columns from many archive files, as one concatenated column each,
+    plus a ``file`` column saying which of ``filenames`` a row came from.
+
+    Args:
+        filenames (list): archive files, e.g. a week of hourly snapshots.
+        names (list): columns to read.
+        where (dict): ``{column: (low, high)}`` ranges; files whose column
+            statistics rule out every range are skipped without being read.
+            Rows are not filtered.
+
+    Returns:
+        dict: column name -> numpy array if numpy is installed, otherwise a
+        list.
+    """
+    parts = {name: [] for name in list(names) + ["file"]}
+    for i, filename in enumerate(filenames):
+        with ColumnarArchive(filename) as archive:
+            if where and not all(archive.overlaps(name, low, high) for name, (low, high) in where.items()):
+                logger.debug("skipping {}, ruled out by its column statistics".format(filename))
+                continue
+            for name in names:
+                values = archive.column(name)
+                parts[name].append(values.copy() if np is not None else list(values))
+            parts["file"].append(np.full(archive.rows, i) if np is not None else [i] * archive.rows)
+    if np is not None:
+        return {name: np.concatenate(values) if values else np.zeros(0, "q") for name, values in parts.items()}
+    return {name: [value for values in part for value in values] for name, part in parts.items()}
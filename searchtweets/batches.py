@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 Twitter, Inc.
+# Licensed under the MIT License
+# https://opensource.org/licenses/MIT
+"""
+Columnar batches of Tweets, for consumers that work on whole arrays rather
+than one dict per Tweet: the 'c' output format of ``ResultStream`` and its
+``iter_batches``.
+
+A ``TweetBatch`` holds fixed-width typed columns (int64 IDs, creation times
+and author IDs, int32 public metrics) and the Tweet texts as one UTF-8
+buffer with int64 offsets. Columns are ``array.array``s, and ``column``
+hands them out as zero-copy numpy arrays when numpy is installed.
+"""
+
+import logging
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .ranking import SNOWFLAKE_EPOCH_MS
+
+__all__ = ["TweetBatch", "BATCH_COLUMNS"]
+
+logger = logging.getLogger(__name__)
+
+# Column name -> array typecode. created_at is in epoch milliseconds, read from the Tweet ID.
+BATCH_COLUMNS = {"id": "q",
+                 "created_at": "q",
+                 "author_id": "q",
+                 "likes": "i",
+                 "retweets": "i",
+                 "replies": "i",
+                 "quotes": "i"}
+
+_PUBLIC_METRICS = (("likes", "like_count"),
+                   ("retweets", "retweet_count"),
+                   ("replies", "reply_count"),
+                   ("quotes", "quote_count"))
+
+
+class TweetBatch:
+    """
+    A batch of Tweets as columns.
+
+    Attributes:
+        columns (dict): column name -> ``array.array``, see ``BATCH_COLUMNS``.
+            ``author_id`` is 0 where the Tweet has none.
+        text (bytearray): every Tweet's text, UTF-8, end to end.
+        text_offsets (array): where each text starts in ``text``, plus the
+            end of the last one.
+
+    Example:
+        >>> for batch in ResultStream(**search_args).iter_batches(5000):
+        ...     scores = batch.column("likes") + 3 * batch.column("retweets")
+        ...     print(batch.column("id")[scores.argmax()], batch.text_at(scores.argmax()))
+    """
+
+    def __init__(self, columns=None, text=b"", text_offsets=None):
+        self.columns = columns or {name: array(typecode) for name, typecode in BATCH_COLUMNS.items()}
+        self.text = bytearray(text)
+        self.text_offsets = text_offsets if text_offsets is not None else array("q", [0])
+
+    @classmethod
+    def from_tweets(cls, tweets):
+        """
+        Builds a batch from the ``data`` of a response page: raw Tweets, not
+        expanded ones.
+        """
+        batch = cls()
+        batch.extend(tweets)
+        return batch
+
+    def extend(self, tweets):
+        """
+        Appends raw Tweets to the batch, column by column.
+        """
+        tweets = list(tweets)
+        if not tweets:
+            return
+        ids = [int(tweet["id"]) for tweet in tweets]
+        columns = self.columns
+        columns["id"].extend(ids)
+        columns["created_at"].extend([(tweet_id >> 22) + SNOWFLAKE_EPOCH_MS for tweet_id in ids])
+        columns["author_id"].extend([int(tweet.get("author_id", 0)) for tweet in tweets])
+        metrics = [tweet.get("public_metrics") or {} for tweet in tweets]
+        for name, field in _PUBLIC_METRICS:
+            columns[name].extend([m.get(field, 0) for m in metrics])
+
+        texts = [tweet.get("text", "").encode("utf-8") for tweet in tweets]
+        offset = self.text_offsets[-1]
+        offsets = []
+        for text in texts:
+            offset += len(text)
+            offsets.append(offset)
+        self.text_offsets.extend(offsets)
+        self.text += b"".join(texts)
+
+    def column(self, name):
+        """
+        A column as a numpy array (a view, not a copy) if numpy is installed,
+        or as the ``array.array`` otherwise.
+        """
+        values = self.columns[name]
+        if np is not None:
+            return np.frombuffer(values, dtype=values.typecode) if len(values) else np.zeros(0, values.typecode)
+        return values
+
+    def text_at(self, i):
+        """The text of the ``i``th Tweet."""
+        return self.text[self.text_offsets[i]:self.text_offsets[i + 1]].decode("utf-8")
+
+    def texts(self):
+        """Every Tweet's text, in order."""
+        return [self.text_at(i) for i in range(len(self))]
+
+    def slice(self, start, stop):
+        """
+        A new batch of rows ``start`` to ``stop``.
+        """
+        stop = min(stop, len(self))
+        begin, end = self.text_offsets[start], self.text_offsets[stop]
+        return TweetBatch({name: values[start:stop] for name, values in self.columns.items()},
+                          self.text[begin:end],
+                          array("q", (offset - begin for offset in self.text_offsets[start:stop + 1])))
+
+    def append_batch(self, other):
+        """
+        Appends another batch's rows to this one.
+        """
+        for name, values in self.columns.items():
+            values.extend(other.columns[name])
+        shift = self.text_offsets[-1]
+        self.text_offsets.extend(offset + shift for offset in other.text_offsets[1:])
+        self.text += other.text
+
+    def to_dicts(self):
+        """
+        The batch as one ``{"id", "text", "likes", ...}`` dict per Tweet, for
+        consumers that need them after all.
+        """
+        names = list(self.columns)
+        rows = zip(*(self.columns[name] for name in names))
+        return [dict(zip(names, row), id=str(row[0]), text=self.text_at(i)) for i, row in enumerate(rows)]
+
+    def __len__(self):
+        return len(self.columns["id"])
+
+    def __repr__(self):
+        return "TweetBatch({} Tweets)".format(len(self))
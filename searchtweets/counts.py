@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 Twitter, Inc.
+# Licensed under the MIT License
+# https://opensource.org/licenses/MIT
+"""
+Tweet counts as time series. The counts endpoints return pages of
+``{start, end, tweet_count}`` buckets; ``CountsCollector`` pages through
+them, for many queries at once, and lays each query's buckets out as a
+``CountSeries``: one count per bucket, aligned to a common start, with empty
+buckets as zeros. Series resample from minutes to hours to days.
+
+Buckets that closed a while ago don't change any more, so with a
+``cache_dir`` they are kept on disk, and later requests over the same
+period only fetch the buckets they don't have yet (typically just the
+newest ones).
+"""
+
+import os
+import time
+import json
+import calendar
+import hashlib
+import logging
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .api_utils import convert_utc_time, change_to_count_endpoint
+from .result_stream import ResultStream
+
+__all__ = ["CountSeries", "CountsCollector", "GRANULARITY_SECONDS"]
+
+logger = logging.getLogger(__name__)
+
+GRANULARITY_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+
+# Buckets that ended this long ago are taken as final, and cached. Until then,
+# late-indexed and deleted Tweets can still move them.
+SETTLE_SECONDS = 3600
+
+# The API wants end_time at least 10 seconds in the past.
+_END_TIME_LAG = 30
+
+_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def _epoch(timestamp):
+    # "2021-06-01T03:00:00.000Z" (or without milliseconds) -> epoch seconds.
+    return calendar.timegm(time.strptime(timestamp[:19], "%Y-%m-%dT%H:%M:%S"))
+
+
+def _timestamp(epoch):
+    return time.strftime(_TIME_FORMAT, time.gmtime(epoch))
+
+
+def _step(granularity):
+    try:
+        return GRANULARITY_SECONDS[granularity]
+    except KeyError:
+        raise ValueError("granularity is one of {}, not '{}'".format(", ".join(GRANULARITY_SECONDS), granularity))
+
+
+class CountSeries:
+    """
+    Tweet counts of one query, one per bucket from ``start``.
+
+    Attributes:
+        start (int): start of the first bucket, in epoch seconds, aligned to
+            the granularity (UTC).
+        granularity (str): 'minute', 'hour' or 'day'.
+        counts (array): the counts, an ``array.array`` of int64.
+
+    Example:
+        >>> series = collector.collect({"snow": "#snow"}, "7d")["snow"]
+        >>> daily = series.resample("day")
+        >>> list(zip(daily.times(), daily.counts))
+    """
+
+    def __init__(self, start, granularity, counts=None):
+        self.step = _step(granularity)
+        if start % self.step:
+            raise ValueError("a {} series starts on a {} boundary".format(granularity, granularity))
+        self.start = int(start)
+        self.granularity = granularity
+        self.counts = counts if counts is not None else array("q")
+
+    @classmethod
+    def zeros(cls, start, end, granularity):
+        """
+        A series of zero counts covering ``start`` to ``end`` (epoch
+        seconds), ``start`` floored to the granularity.
+        """
+        step = _step(granularity)
+        start -= start % step
+        return cls(start, granularity, array("q", bytes(8 * max(0, -(-(int(end) - start) // step)))))
+
+    @property
+    def end(self):
+        """End of the last bucket, in epoch seconds."""
+        return self.start + len(self.counts) * self.step
+
+    def index(self, epoch):
+        """The bucket an epoch second falls in (may be out of range)."""
+        return (int(epoch) - self.start) // self.step
+
+    def times(self):
+        """Bucket start times, in epoch seconds."""
+        return range(self.start, self.end, self.step)
+
+    def values(self):
+        """The counts as a numpy array (a view) if numpy is installed."""
+        if np is not None:
+            return np.frombuffer(self.counts, dtype="q") if len(self.counts) else np.zeros(0, "q")
+        return self.counts
+
+    def total(self):
+        return sum(self.counts)
+
+    def window(self, start, end):
+        """
+        The buckets from ``start`` up to ``end`` (epoch seconds), as a new
+        series; buckets outside this one are zeros.
+        """
+        series = CountSeries.zeros(start, end, self.granularity)
+        series.fill(self)
+        return series
+
+    def fill(self, other):
+        """
+        Copies in the buckets of another series of the same granularity,
+        where they overlap this one.
+        """
+        if other.step != self.step:
+            raise ValueError("can't fill {} counts from {} counts".format(self.granularity, other.granularity))
+        first, last = max(self.start, other.start), min(self.end, other.end)
+        if first < last:
+            i, j, n = self.index(first), other.index(first), (last - first) // self.step
+            self.counts[i:i + n] = other.counts[j:j + n]
+
+    def resample(self, granularity):
+        """
+        The series summed into coarser buckets, aligned to UTC: minutes to
+        hours or days, hours to days. The first and last buckets may cover
+        only part of their period.
+        """
+        step = _step(granularity)
+        if step < self.step:
+            raise ValueError("can't resample {} counts to {}; only to coarser buckets".format(self.granularity,
+                                                                                            granularity))
+        start = self.start - self.start % step
+        counts = array("q")
+        # Bucket boundaries of the new series, as indexes into this one.
+        bounds = list(range(self.index(start + step), len(self.counts), step // self.step))
+        lower = 0
+        for upper in bounds + [len(self.counts)]:
+            counts.append(sum(self.counts[lower:upper]))
+            lower = upper
+        return CountSeries(start, granularity, counts if len(self.counts) else array("q"))
+
+    def to_dicts(self):
+        """The buckets as the API has them: ``{start, end, tweet_count}``."""
+        return [{"start": _timestamp(t), "end": _timestamp(t + self.step), "tweet_count": count}
+                for t, count in zip(self.times(), self.counts)]
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __repr__(self):
+        return "CountSeries({} {} buckets from {})".format(len(self), self.granularity, _timestamp(self.start))
+
+
+class CountsCollector:
+    """
+    Collects Tweet counts for many queries, concurrently, as aligned
+    ``CountSeries``.
+
+    Args:
+        granularity (str): 'minute', 'hour' or 'day'.
+        cache_dir (str): if set, settled buckets are cached here, one file
+            per query and granularity, and not fetched again.
+        settle_seconds (float): how long after a bucket ends it is taken as
+            final, and cached.
+        max_workers (int): queries fetched at once.
+        result_stream_args (dict): other ``ResultStream`` arguments, e.g.
+            ``endpoint`` (a search or counts endpoint) and ``bearer_token``.
+
+    Example:
+        >>> collector = CountsCollector("hour", cache_dir="~/.searchtweets/counts", **search_args)
+        >>> series = collector.collect({"snow": "#snow", "ski": "ski -is:retweet"}, start_time="7d")
+        >>> series["snow"].resample("day").counts
+        array('q', [1203, 998, 1450, 2210, 1876, 1320, 1104, 533])
+    """
+
+    def __init__(self, granularity="hour", cache_dir=None, settle_seconds=SETTLE_SECONDS, max_workers=4,
+                 **result_stream_args):
+        self.step = _step(granularity)
+        self.granularity = granularity
+        self.cache_dir = os.path.expanduser(cache_dir) if cache_dir else None
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        self.settle_seconds = settle_seconds
+        self.max_workers = max_workers
+        result_stream_args.pop("request_parameters", None)
+        self.result_stream_args = dict(result_stream_args, max_tweets=None, output_format="r")
+        self.endpoint = change_to_count_endpoint(result_stream_args["endpoint"])
+        self.n_requests = 0
+        self.n_cached_buckets = 0
+        self._lock = threading.Lock()
+
+    def collect(self, queries, start_time, end_time=None):
+        """
+        Counts for each query, from ``start_time`` (floored to the
+        granularity) to ``end_time`` (default: now).
+
+        Args:
+            queries (dict): query ID -> query string.
+            start_time, end_time (str or int): epoch seconds, or any format
+                ``convert_utc_time`` takes, e.g. "2021-06-01" or "7d".
+
+        Returns:
+            dict: query ID -> ``CountSeries``, all over the same buckets.
+        """
+        start, end = self._epoch_arg(start_time), self._epoch_arg(end_time)
+        end = min(end or time.time() - _END_TIME_LAG, time.time() - _END_TIME_LAG)
+        start -= start % self.step
+        with ThreadPoolExecutor(min(self.max_workers, len(queries)) or 1) as pool:
+            futures = {query_id: pool.submit(self.collect_query, query, start, end)
+                       for query_id, query in queries.items()}
+            return {query_id: future.result() for query_id, future in futures.items()}
+
+    def _epoch_arg(self, value):
+        if value is None or isinstance(value, (int, float)):
+            return value
+        return _epoch(convert_utc_time(value))
+
+    def collect_query(self, query, start, end):
+        """
+        Counts for one query, from ``start`` to ``end`` (epoch seconds), from
+        the cache where it has them.
+        """
+        series = CountSeries.zeros(start, end, self.granularity)
+        cached = self._read_cache(query)
+        ranges = [(start, end)]
+        if cached is not None and cached.start < end and start < cached.end:
+            series.fill(cached)
+            with self._lock:
+                self.n_cached_buckets += (min(cached.end, series.end) - max(cached.start, start)) // self.step
+            ranges = [(start, cached.start), (cached.end, end)]
+        complete = True
+        for fetch_start, fetch_end in ranges:
+            if fetch_start < fetch_end:
+                complete = self._fetch(query, series, fetch_start, fetch_end) and complete
+        if self.cache_dir and complete:
+            self._write_cache(query, series, cached, end)
+        return series
+
+    def _fetch(self, query, series, start, end):
+        params = {"query": query,
+                  "granularity": self.granularity,
+                  "start_time": _timestamp(start),
+                  "end_time": _timestamp(end)}
+        rs = ResultStream(request_parameters=params, **self.result_stream_args)
+        for page in rs.stream():
+            for bucket in page.get("data") or ():
+                i = series.index(_epoch(bucket["start"]))
+                if 0 <= i < len(series):
+                    series.counts[i] = bucket["tweet_count"]
+        with self._lock:
+            self.n_requests += rs.n_requests
+        logger.info("fetched {} {} buckets of {!r} in {} requests".format(rs.n_buckets, self.granularity,
+                                                                          query, rs.n_requests))
+        return not rs.partial
+
+    def _cache_path(self, query):
+        key = "\n".join([self.endpoint, " ".join(query.split()), self.granularity])
+        return os.path.join(self.cache_dir, hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest() + ".json")
+
+    def _read_cache(self, query):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._cache_path(query)) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return CountSeries(cached["start"], self.granularity, array("q", cached["counts"]))
+
+    def _write_cache(self, query, series, cached, end):
+        # Only whole buckets that have settled are kept (not one cut short by end): one run of them per query.
+        settled_end = int(min(end, time.time() - self.settle_seconds))
+        settled = series.window(series.start, settled_end - settled_end % self.step)
+        if not len(settled):
+            return
+        if cached is not None and cached.start <= settled.end and settled.start <= cached.end:
+            merged = cached.window(min(cached.start, settled.start), max(cached.end, settled.end))
+            merged.fill(settled)
+            settled = merged
+        elif cached is not None and cached.end > settled.end:
+            return  # A later, separate run is cached already; keep it.
+        path = self._cache_path(query)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"query": query, "granularity": self.granularity,
+                       "start": settled.start, "counts": settled.counts.tolist()}, f)
+        os.replace(path + ".tmp", path)
@@ -10,8 +10,6 @@ credentials in a YAML file, but the main function in this module,
 """
 import os
 import logging
-import yaml
-import requests
 import base64
 from .utils import merge_dicts
 
@@ -29,6 +27,7 @@ def _load_yaml_credentials(filename=None, yaml_key=None):
     Returns:
         dict: parsed credentials or {}
     """
+    import yaml  # Only needed for YAML credential files.
     try:
         with open(os.path.expanduser(filename)) as f:
             search_creds = yaml.safe_load(f)[yaml_key]
@@ -168,6 +167,7 @@ def _generate_bearer_token(consumer_key, consumer_secret):
     """
     Return the bearer token for a given pair of consumer key and secret values.
     """
+    import requests
     data = [('grant_type', 'client_credentials')]
     resp = requests.post(OAUTH_ENDPOINT,
                          data=data,
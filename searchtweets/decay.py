@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 Twitter, Inc.
+# Licensed under the MIT License
+# https://opensource.org/licenses/MIT
+"""
+Time-decayed ranking, so a fresh Tweet that is picking up engagement can
+outrank an older one with a bigger total.
+
+Two decays are supported:
+
+    half-life   score * 2 ** (-age / half_life)
+    gravity     score / (age_hours + offset) ** gravity
+
+Half-life decay scales every Tweet by the same factor as time passes, so
+their order never changes: Tweets are indexed by a time-invariant key and
+nothing is re-scored. Gravity decay does reorder Tweets over time, but only
+ever lowers scores, so a Tweet's last computed score is an upper bound on its
+current one. ``DecayedRanking`` keeps those bounds in a heap and, when asked
+for the top Tweets, re-scores only entries whose bound still competes.
+"""
+
+import math
+import time
+import heapq
+import logging
+
+from .ranking import engagement_score, snowflake_seconds
+
+__all__ = ["HalfLifeDecay", "GravityDecay", "DecayedRanking", "make_decay"]
+
+logger = logging.getLogger(__name__)
+
+
+class HalfLifeDecay:
+    """
+    Halves a Tweet's score every ``half_life_hours``.
+
+    Args:
+        half_life_hours (float): hours for a score to halve.
+    """
+
+    time_invariant = True
+
+    def __init__(self, half_life_hours):
+        if half_life_hours <= 0:
+            raise ValueError("half life must be positive")
+        self.half_life_hours = half_life_hours
+        self._rate = math.log(2) / (half_life_hours * 3600)
+
+    def key(self, score, created):
+        """
+        Ordering key that doesn't depend on the current time: the log of the
+        score as of time 0.
+        """
+        return math.log(score) + created * self._rate if score > 0 else -math.inf
+
+    def value(self, score, created, now):
+        return score * math.exp(-max(now - created, 0) * self._rate)
+
+    def __repr__(self):
+        return "HalfLifeDecay({})".format(self.half_life_hours)
+
+
+class GravityDecay:
+    """
+    Divides a Tweet's score by ``(age_hours + offset_hours) ** gravity``, as
+    Hacker News ranks stories.
+
+    Args:
+        gravity (float): how fast scores fall with age; 1.8 is the HN value.
+        offset_hours (float): added to the age, so new Tweets don't divide
+            by zero.
+    """
+
+    time_invariant = False
+
+    def __init__(self, gravity=1.8, offset_hours=2):
+        if gravity <= 0 or offset_hours <= 0:
+            raise ValueError("gravity and offset must be positive")
+        self.gravity = gravity
+        self.offset_hours = offset_hours
+
+    def value(self, score, created, now):
+        return score / (max(now - created, 0) / 3600 + self.offset_hours) ** self.gravity
+
+    def __repr__(self):
+        return "GravityDecay({}, {})".format(self.gravity, self.offset_hours)
+
+
+def make_decay(spec):
+    """
+    Builds a decay from a short spec: ``"half-life:6"`` (hours) or
+    ``"gravity:1.8"``. Returns None for an empty spec.
+
+    Example:
+        >>> make_decay("half-life:6")
+        HalfLifeDecay(6.0)
+    """
+    if not spec:
+        return None
+    name, _, value = spec.partition(":")
+    name = name.strip().lower().replace("_", "-")
+    if name in ("half-life", "halflife"):
+        return HalfLifeDecay(float(value or 6))
+    if name == "gravity":
+        return GravityDecay(float(value or 1.8))
+    raise ValueError("unknown decay '{}'; use half-life:HOURS or gravity:G".format(spec))
+
+
+class DecayedRanking:
+    """
+    Indexed, time-decayed ranking of Tweets. Tweets can be added and
+    updated (with newer metrics) at any time; ``ranked`` returns the top
+    ``k`` as of now, re-scoring as few Tweets as the decay allows. It can
+    stand in for ``RollingTopK``.
+
+    Args:
+        k (int): how many Tweets ``ranked`` returns.
+        decay (HalfLifeDecay or GravityDecay): how scores fall with age.
+        score_func (function): maps a Tweet to its undecayed score. Defaults
+            to ``engagement_score``.
+        window_seconds (float): Tweets created longer ago than this are
+            not added, and are dropped by ``expire``; defaults to no window.
+        max_candidates (int): Tweets kept in all; past this, the half with
+            the lowest decayed scores is dropped.
+
+    Attributes:
+        version (int): bumped whenever an added Tweet may change the top ``k``.
+        n_rescored (int): decayed scores computed by ``ranked`` so far.
+
+    Example:
+        >>> ranking = DecayedRanking(10, GravityDecay(1.8))
+        >>> for tweet in tweets:
+        ...     ranking.add(tweet)
+        >>> for score, tweet in ranking.ranked():
+        ...     print(score, tweet["id"])
+    """
+
+    def __init__(self, k, decay, score_func=engagement_score, window_seconds=None, max_candidates=100000):
+        self.k = int(k)
+        self.decay = decay
+        self.score_func = score_func
+        self.window_seconds = window_seconds
+        self.max_candidates = max_candidates
+        self.version = 0
+        self.n_seen = 0
+        self.n_rescored = 0
+        self._entries = {}  # Tweet ID -> (score, created, tweet, entry version)
+        self._heap = []  # (-key or -bound, Tweet ID, entry version, time scored)
+        self._created = []  # (created, Tweet ID) min-heap, for expiry
+        self._kth_value = None
+        self._counter = 0
+
+    def add(self, tweet, score=None, now=None):
+        """
+        Adds a Tweet, or updates it with newer metrics, as of ``now``
+        (defaults to the current time). Returns True if it may have changed
+        the top ``k``.
+        """
+        self.n_seen += 1
+        if score is None:
+            score = self.score_func(tweet)
+        tweet_id = int(tweet["id"])
+        created = snowflake_seconds(tweet_id)
+        now = time.time() if now is None else now
+        if tweet_id not in self._entries:
+            if self.window_seconds is not None and created < now - self.window_seconds:
+                return False
+            if len(self._entries) >= self.max_candidates:
+                self._prune(now)
+            heapq.heappush(self._created, (created, tweet_id))
+
+        self._counter += 1
+        self._entries[tweet_id] = (score, created, tweet, self._counter)
+        if self.decay.time_invariant:
+            heapq.heappush(self._heap, (-self.decay.key(score, created), tweet_id, self._counter, None))
+        else:
+            heapq.heappush(self._heap, (-self.decay.value(score, created, now), tweet_id, self._counter, now))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._compact()
+
+        if self._kth_value is None or self.decay.value(score, created, now) >= self._kth_value:
+            self.version += 1
+            return True
+        return False
+
+    def remove(self, tweet_id):
+        """
+        Drops a Tweet from the ranking. Its heap entries go stale and are
+        skipped.
+        """
+        self._entries.pop(int(tweet_id), None)
+
+    def expire(self, now=None):
+        """
+        Drops Tweets created before the window. Returns how many were dropped.
+        """
+        if self.window_seconds is None:
+            return 0
+        oldest = (time.time() if now is None else now) - self.window_seconds
+        dropped = 0
+        while self._created and self._created[0][0] < oldest:
+            _, tweet_id = heapq.heappop(self._created)
+            if self._entries.pop(tweet_id, None) is not None:
+                dropped += 1
+        if dropped:
+            self.version += 1
+        return dropped
+
+    def ranked(self, now=None):
+        """
+        Returns the top ``k`` Tweets as ``(decayed score, tweet)`` pairs, as of
+        ``now`` (defaults to the current time), highest first.
+        """
+        now = time.time() if now is None else now
+        top = []
+        while self._heap and len(top) < self.k:
+            item = heapq.heappop(self._heap)
+            _, tweet_id, entry_version, scored_at = item
+            entry = self._entries.get(tweet_id)
+            if entry is None or entry[3] != entry_version:
+                continue  # Superseded by an update, or dropped.
+            score, created, tweet, _ = entry
+
+            if self.decay.time_invariant or scored_at == now:
+                top.append((item, tweet))
+            else:
+                # The bound is stale: re-score, and put it back to compete with the other bounds.
+                self.n_rescored += 1
+                heapq.heappush(self._heap, (-self.decay.value(score, created, now), tweet_id, entry_version, now))
+
+        for item, _ in top:
+            heapq.heappush(self._heap, item)
+
+        ranked = []
+        for item, tweet in top:
+            score, created, _, _ = self._entries[item[1]]
+            ranked.append((self.decay.value(score, created, now), tweet))
+        self._kth_value = ranked[-1][0] if len(ranked) == self.k else None
+        return ranked
+
+    def _prune(self, now):
+        # Keep the half with the best decayed scores; the heaps skip IDs no longer held.
+        keep = heapq.nlargest(self.max_candidates // 2, self._entries.items(),
+                              key=lambda item: (self.decay.value(item[1][0], item[1][1], now), item[0]))
+        self._entries = dict(keep)
+        self._compact()
+        self.version += 1
+
+    def _compact(self):
+        self._heap = [item for item in self._heap
+                      if item[1] in self._entries and self._entries[item[1]][3] == item[2]]
+        heapq.heapify(self._heap)
+        self._created = [item for item in self._created if item[1] in self._entries]
+        heapq.heapify(self._created)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 Twitter, Inc.
+# Licensed under the MIT License
+# https://opensource.org/licenses/MIT
+"""
+De-duplication of Tweets seen across pages, shards, overlapping windows and
+queries. Tweet IDs are kept as int64s rather than strings: ``SeenIds`` is
+exact at 8 bytes per ID, ``BloomFilter`` is approximate at about 1.2 bytes
+per ID for a 1% false-positive rate.
+"""
+
+import math
+import heapq
+import bisect
+import logging
+from array import array
+from itertools import islice
+
+__all__ = ["SeenIds", "BloomFilter", "dedupe_tweets", "original_tweet_id"]
+
+logger = logging.getLogger(__name__)
+
+_MASK64 = (1 << 64) - 1
+
+# IDs moved at a time when merging runs, so only this many are ever boxed at once.
+_MERGE_CHUNK = 8192
+
+
+def _merge_runs(older, newer):
+    # Linear two-way merge of sorted runs into a new array. The runs hold no IDs in common.
+    merged = array("q")
+    merging = heapq.merge(older, newer)
+    chunk = list(islice(merging, _MERGE_CHUNK))
+    while chunk:
+        merged.extend(chunk)
+        chunk = list(islice(merging, _MERGE_CHUNK))
+    return merged
+
+
+class SeenIds:
+    """
+    Exact set of int64 Tweet IDs. New IDs collect in a small buffer, which is
+    sorted into a compact array once full; arrays of similar size are merged,
+    so there are only ever O(log n) of them to binary-search.
+
+    Args:
+        buffer_size (int): how many IDs to buffer before compacting.
+
+    Example:
+        >>> seen = SeenIds()
+        >>> seen.add("1484265578202382336")
+        True
+        >>> seen.add(1484265578202382336)
+        False
+    """
+
+    def __init__(self, buffer_size=65536):
+        self.buffer_size = buffer_size
+        self._buffer = set()
+        self._runs = []
+        self._length = 0
+
+    def add(self, tweet_id):
+        """
+        Adds an ID. Returns True if it had not been seen before.
+        """
+        tweet_id = int(tweet_id)
+        if tweet_id in self:
+            return False
+        self._buffer.add(tweet_id)
+        self._length += 1
+        if len(self._buffer) >= self.buffer_size:
+            self._compact()
+        return True
+
+    def __contains__(self, tweet_id):
+        tweet_id = int(tweet_id)
+        if tweet_id in self._buffer:
+            return True
+        for run in self._runs:
+            i = bisect.bisect_left(run, tweet_id)
+            if i < len(run) and run[i] == tweet_id:
+                return True
+        return False
+
+    def __len__(self):
+        return self._length
+
+    def _compact(self):
+        self._runs.append(array("q", sorted(self._buffer)))
+        self._buffer = set()
+        # Merge while the newer run is at least half the size of the one before,
+        # which keeps run sizes roughly doubling.
+        while len(self._runs) > 1 and len(self._runs[-2]) <= 2 * len(self._runs[-1]):
+            newer = self._runs.pop()
+            older = self._runs.pop()
+            self._runs.append(_merge_runs(older, newer))
+
+    def memory_bytes(self):
+        """
+        Approximate memory held by the compacted IDs (the buffer excluded).
+        """
+        return sum(run.itemsize * len(run) for run in self._runs)
+
+
+class BloomFilter:
+    """
+    Approximate set of int64 Tweet IDs in a fixed-size bit array, for when an
+    exact set won't fit. An ID never added can be reported as seen with
+    probability ``error_rate`` (so a few unique Tweets may be dropped); an ID
+    that was added always is.
+
+    Args:
+        capacity (int): how many IDs the filter is sized for.
+        error_rate (float): false-positive rate at ``capacity``.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.n_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.n_hashes = max(1, round(self.n_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.n_bits + 7) // 8)
+        self._length = 0
+
+    def _positions(self, tweet_id):
+        # Double hashing over two splitmix64 mixes of the ID.
+        h1 = _mix64(int(tweet_id))
+        h2 = _mix64(h1) | 1
+        return [((h1 + i * h2) & _MASK64) % self.n_bits for i in range(self.n_hashes)]
+
+    def add(self, tweet_id):
+        """
+        Adds an ID. Returns True if it (probably) had not been seen before.
+        """
+        new = False
+        for position in self._positions(tweet_id):
+            byte, bit = divmod(position, 8)
+            if not self._bits[byte] & (1 << bit):
+                self._bits[byte] |= 1 << bit
+                new = True
+        if new:
+            self._length += 1
+        return new
+
+    def __contains__(self, tweet_id):
+        for position in self._positions(tweet_id):
+            byte, bit = divmod(position, 8)
+            if not self._bits[byte] & (1 << bit):
+                return False
+        return True
+
+    def __len__(self):
+        return self._length
+
+    def memory_bytes(self):
+        return len(self._bits)
+
+
+def _mix64(x):
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+def original_tweet_id(tweet):
+    """
+    ID of the Tweet a Retweet points to, or None if the Tweet isn't a Retweet.
+    Needs ``tweet.fields=referenced_tweets``.
+    """
+    for referenced_tweet in tweet.get("referenced_tweets", []):
+        if referenced_tweet.get("type") == "retweeted":
+            return referenced_tweet["id"]
+    return None
+
+
+def dedupe_tweets(tweets, seen=None, collapse_retweets=False, includes=None):
+    """
+    Generator that drops Tweets already seen.
+
+    Args:
+        tweets (iterable): Tweets, e.g. from a ``ResultStream``.
+        seen (SeenIds or BloomFilter): IDs seen so far; share one between
+            streams to de-duplicate across them. Defaults to a new ``SeenIds``.
+        collapse_retweets (bool): count a Retweet as its original Tweet, and
+            pass on the original when it is available: expanded inline ('a'
+            output format) or in ``includes`` (needs the
+            ``referenced_tweets.id`` expansion).
+        includes (dict): the ``includes`` of the response the Tweets came from.
+
+    Example:
+        >>> seen = SeenIds()
+        >>> for stream in streams:
+        ...     for tweet in dedupe_tweets(stream.stream(), seen):
+        ...         ranker.add(tweet)
+    """
+    if seen is None:
+        seen = SeenIds()
+    included_tweets = {t["id"]: t for t in (includes or {}).get("tweets", [])}
+
+    for tweet in tweets:
+        original_id = original_tweet_id(tweet) if collapse_retweets else None
+        if original_id is None:
+            if seen.add(tweet["id"]):
+                yield tweet
+            continue
+
+        if not seen.add(original_id):
+            continue
+        original = included_tweets.get(original_id)
+        if original is None:
+            expanded = [t for t in tweet["referenced_tweets"] if t["id"] == original_id][0]
+            original = expanded if "public_metrics" in expanded else None
+        yield original if original is not None else tweet
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 Twitter, Inc.
+# Licensed under the MIT License
+# https://opensource.org/licenses/MIT
+"""
+External-sort ranking, for full ordered lists (say the top million Tweets of
+a quarter) that don't fit in memory. Scored Tweets are buffered up to a
+memory cap, sorted, and spilled to a temporary file as a run of fixed-width
+binary records; the runs are then k-way merged into one ranking, read back a
+block at a time.
+"""
+
+import os
+import heapq
+import struct
+import logging
+import tempfile
+
+__all__ = ["ExternalRanker"]
+
+logger = logging.getLogger(__name__)
+
+# score, Tweet ID, likes, Retweets, replies, quotes: 32 bytes a Tweet on disk.
+_RECORD = struct.Struct("<dq4i")
+RANKED_FIELDS = ("score", "id", "likes", "retweets", "replies", "quotes")
+
+# Rough size of one buffered Tweet in memory: a tuple of six numbers.
+_BUFFERED_BYTES = 200
+
+# Runs merged at once; past this, runs are first merged into bigger ones.
+MAX_MERGE_FANIN = 64
+
+_BLOCK_RECORDS = 4096
+
+
+def _sort_key(record):
+    # Highest score first; ties go to the newer (higher) Tweet ID, as in TopK.
+    return -record[0], -record[1]
+
+
+class ExternalRanker:
+    """
+    Ranks any number of scored Tweets in bounded memory.
+
+    Args:
+        memory_mb (float): memory the buffer of unsorted Tweets may take
+            before it is sorted and spilled (approximate).
+        temp_dir (str): where runs are spilled; defaults to the system temp
+            directory.
+
+    Example:
+        >>> ranker = ExternalRanker(memory_mb=256)
+        >>> for tweet in scored_tweets:      # {id, score, likes, ...}
+        ...     ranker.add(tweet)
+        >>> for tweet in ranker.ranked(limit=1000000):
+        ...     out.write(json.dumps(tweet) + "\\n")
+        >>> ranker.close()
+    """
+
+    def __init__(self, memory_mb=256, temp_dir=None):
+        self.max_buffered = max(1024, int(memory_mb * 1024 * 1024 / _BUFFERED_BYTES))
+        self.temp_dir = temp_dir
+        self.n_added = 0
+        self.n_spilled = 0
+        self._buffer = []
+        self._runs = []  # paths of sorted run files
+
+    def add(self, tweet, score=None):
+        """
+        Adds a scored Tweet ({id, score, likes, retweets, replies, quotes}).
+        """
+        self.n_added += 1
+        self._buffer.append((tweet["score"] if score is None else score, int(tweet["id"]),
+                             tweet.get("likes", 0), tweet.get("retweets", 0),
+                             tweet.get("replies", 0), tweet.get("quotes", 0)))
+        if len(self._buffer) >= self.max_buffered:
+            self._spill()
+
+    def _spill(self):
+        self._buffer.sort(key=_sort_key)
+        self._runs.append(self._write_run(self._buffer))
+        self.n_spilled += len(self._buffer)
+        logger.info("spilled a run of {} Tweets ({} runs)".format(len(self._buffer), len(self._runs)))
+        self._buffer = []
+
+    def _write_run(self, records):
+        fd, path = tempfile.mkstemp(prefix="rank-run-", suffix=".bin", dir=self.temp_dir)
+        pack = _RECORD.pack
+        with os.fdopen(fd, "wb", buffering=1024 * 1024) as f:
+            for record in records:
+                f.write(pack(*record))
+        return path
+
+    def _read_run(self, path):
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(_RECORD.size * _BLOCK_RECORDS)
+                if not block:
+                    return
+                yield from _RECORD.iter_unpack(block)
+
+    def _merge_runs(self):
+        # Keep the fan-in (and open files) bounded by merging runs into bigger runs first.
+        while len(self._runs) > MAX_MERGE_FANIN:
+            merging, self._runs = self._runs[:MAX_MERGE_FANIN], self._runs[MAX_MERGE_FANIN:]
+            merged = self._write_run(heapq.merge(*[self._read_run(path) for path in merging], key=_sort_key))
+            for path in merging:
+                os.remove(path)
+            self._runs.append(merged)
+
+    def ranked(self, limit=None):
+        """
+        Generator of the ranked Tweets, as {id, score, likes, retweets,
+        replies, quotes} dicts, best first. If nothing was spilled, this is
+        an in-memory sort.
+        """
+        if self._runs and self._buffer:
+            self._spill()
+        self._merge_runs()
+        if self._runs:
+            records = heapq.merge(*[self._read_run(path) for path in self._runs], key=_sort_key)
+        else:
+            self._buffer.sort(key=_sort_key)
+            records = iter(self._buffer)
+
+        for n, record in enumerate(records):
+            if limit is not None and n >= limit:
+                return
+            tweet = dict(zip(RANKED_FIELDS, record))
+            tweet["id"] = str(tweet["id"])
+            yield tweet
+
+    def __len__(self):
+        return self.n_added
+
+    def close(self):
+        """
+        Deletes the spilled runs.
+        """
+        for path in self._runs:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._runs = []
+        self._buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
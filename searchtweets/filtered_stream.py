@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 Twitter, Inc.
+# Licensed under the MIT License
+# https://opensource.org/licenses/MIT
+"""
+Ingestion from a long-lived filtered stream connection: newline-delimited
+JSON, one message per matched Tweet, with a blank keep-alive line about every
+20 seconds. Dropped and stalled connections are reconnected, backing off as
+the API asks: linearly for network errors, exponentially for HTTP errors and
+more slowly still for rate limits.
+"""
+
+import time
+import logging
+import requests
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from .result_stream import make_session, make_expander
+
+__all__ = ["FilteredStream", "FILTERED_STREAM_ENDPOINT"]
+
+logger = logging.getLogger(__name__)
+
+FILTERED_STREAM_ENDPOINT = "https://api.twitter.com/2/tweets/search/stream"
+
+# The stream sends a keep-alive at least this often; a connection silent for
+# longer than STALL_SECONDS is treated as dropped.
+HEARTBEAT_SECONDS = 20
+STALL_SECONDS = 30
+
+
+class FilteredStream:
+    """
+    Streams Tweets from a filtered stream endpoint, reconnecting as needed.
+    Stream rules are managed separately, on the rules endpoint.
+
+    Args:
+        endpoint (str): filtered stream endpoint.
+        bearer_token (str): bearer token for v2.
+        extra_headers_dict (dict): custom headers to add.
+        request_parameters (dict): fields and expansions, e.g.
+            ``{"tweet.fields": "public_metrics", "expansions": "referenced_tweets.id"}``.
+        output_format (str): 'a' for Tweets with their expansions inline (and
+            the message's ``matching_rules``), or 'r' for the raw messages.
+        max_tweets (int): stop after this many Tweets; defaults to never.
+        max_reconnects (int): give up after this many reconnects in a row
+            without a message; defaults to never.
+        stall_seconds (float): how long a connection may be silent, heartbeats
+            included, before it is dropped and reconnected.
+        on_heartbeat (function): called with no arguments on every keep-alive,
+            e.g. to publish on a timer while no Tweets arrive.
+
+    Example:
+        >>> fs = FilteredStream(bearer_token=token,
+                                request_parameters={"tweet.fields": "public_metrics"})
+        >>> for tweet in fs.stream():
+        ...     ranker.add(tweet)
+    """
+
+    def __init__(self, endpoint=FILTERED_STREAM_ENDPOINT, bearer_token=None, extra_headers_dict=None,
+                 request_parameters=None, output_format="a", max_tweets=None, max_reconnects=None,
+                 stall_seconds=STALL_SECONDS, on_heartbeat=None):
+        if output_format not in ("a", "r"):
+            raise ValueError("FilteredStream supports the 'a' and 'r' output formats")
+        self.endpoint = endpoint
+        self.bearer_token = bearer_token
+        self.extra_headers_dict = extra_headers_dict
+        self.request_parameters = dict(request_parameters or {})
+        self.output_format = output_format
+        self.max_tweets = max_tweets if isinstance(max_tweets, int) else 10 ** 15
+        self.max_reconnects = max_reconnects
+        self.stall_seconds = stall_seconds
+        self.on_heartbeat = on_heartbeat
+
+        self.total_results = 0
+        self.n_connects = 0
+        self.n_heartbeats = 0
+        self.n_bytes = 0
+        self._stopped = False
+        self._response = None
+
+    def stop(self):
+        """
+        Ends ``stream()`` at the next message or keep-alive. Safe to call
+        from another thread or a signal handler.
+        """
+        self._stopped = True
+        if self._response is not None:
+            self._response.close()
+
+    def stream(self):
+        """
+        Generator of Tweets (or messages), across reconnects.
+        """
+        session = make_session(self.bearer_token, self.extra_headers_dict)
+        failures = 0
+        backoff = _Backoff()
+        try:
+            while not self._stopped and self.total_results < self.max_tweets:
+                try:
+                    self.n_connects += 1
+                    self._response = session.get(self.endpoint, params=self.request_parameters,
+                                                 stream=True, timeout=(10, self.stall_seconds))
+                    if self._response.status_code != 200:
+                        wait_seconds = backoff.http_error(self._response)
+                    else:
+                        logger.info("connected to the stream")
+                        for message in self._read_messages(self._response):
+                            failures = 0
+                            backoff.reset()
+                            yield message
+                            if self.total_results >= self.max_tweets:
+                                return
+                        if self._stopped:
+                            return
+                        logger.warning("stream closed by the server")
+                        wait_seconds = backoff.network_error()
+                except (requests.exceptions.ConnectionError,
+                        requests.exceptions.ChunkedEncodingError,
+                        requests.exceptions.Timeout) as exc:
+                    if self._stopped:
+                        return
+                    logger.warning("stream connection lost: {!r}".format(exc))
+                    wait_seconds = backoff.network_error()
+                except Exception:
+                    # Closing the response from stop() can surface as other errors mid-read.
+                    if self._stopped:
+                        return
+                    raise
+                finally:
+                    if self._response is not None:
+                        self._response.close()
+                        self._response = None
+
+                failures += 1
+                if self.max_reconnects is not None and failures > self.max_reconnects:
+                    raise requests.exceptions.ConnectionError(
+                        "gave up on the stream after {} reconnects".format(self.max_reconnects))
+                logger.warning("reconnecting in {:.2f} seconds".format(wait_seconds))
+                time.sleep(wait_seconds)
+        finally:
+            session.close()
+
+    def _read_messages(self, response):
+        for line in response.iter_lines(chunk_size=None):
+            if self._stopped:
+                return
+            self.n_bytes += len(line) + 2
+            if not line.strip():
+                self.n_heartbeats += 1
+                if self.on_heartbeat is not None:
+                    self.on_heartbeat()
+                continue
+
+            message = json.loads(line)
+            if "data" not in message:
+                # Errors, e.g. an operational disconnect notice, arrive as messages of their own.
+                logger.warning("stream message without data: {}".format(message))
+                continue
+
+            self.total_results += 1
+            if self.output_format == "r":
+                yield message
+            else:
+                tweet = make_expander(message.get("includes", {}))(message["data"])
+                tweet["matching_rules"] = message.get("matching_rules", [])
+                yield tweet
+
+    def __repr__(self):
+        return "FilteredStream: {} {}".format(self.endpoint, json.dumps(self.request_parameters))
+
+
+class _Backoff:
+    """
+    Reconnect waits, per the filtered stream guidance: network errors back
+    off linearly by 250ms up to 16s, HTTP errors exponentially from 5s up to
+    320s, and rate limits (429) exponentially from a minute.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.network_seconds = 0
+        self.http_seconds = 0
+        self.rate_limit_seconds = 0
+
+    def network_error(self):
+        self.network_seconds = min(self.network_seconds + 0.25, 16)
+        return self.network_seconds
+
+    def http_error(self, response):
+        logger.error("stream HTTP error {}: {}".format(response.status_code, response.text[:200]))
+        if response.status_code == 429:
+            self.rate_limit_seconds = 60 if not self.rate_limit_seconds else self.rate_limit_seconds * 2
+            return self.rate_limit_seconds
+        if 400 <= response.status_code < 500:
+            # Bad credentials or parameters won't fix themselves.
+            raise requests.exceptions.HTTPError(
+                "stream request failed with HTTP {}".format(response.status_code), response=response)
+        self.http_seconds = min(self.http_seconds * 2 or 5, 320)
+        return self.http_seconds
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 Twitter, Inc.
+# Licensed under the MIT License
+# https://opensource.org/licenses/MIT
+"""
+Tweet lookup ("hydration") of known Tweet IDs. Pairs with a thin search
+request: search with just ``tweet.fields=public_metrics``, rank, then look up
+full fields and expansions only for the few Tweets that are kept.
+"""
+
+import time
+import logging
+import requests
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from .utils import partition
+from .api_utils import change_to_lookup_endpoint
+from .result_stream import make_session, make_expander, request, DeadlineExceeded
+
+__all__ = ["hydrate_tweets", "LOOKUP_BATCH_SIZE"]
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of IDs the Tweet lookup endpoint accepts per request.
+LOOKUP_BATCH_SIZE = 100
+
+
+def hydrate_tweets(tweet_ids, endpoint, bearer_token=None, extra_headers_dict=None,
+                   tweet_fields=None, user_fields=None, media_fields=None,
+                   place_fields=None, poll_fields=None, expansions=None,
+                   deadline=None, reserve_seconds=0, **kwargs):
+    """
+    Looks up full Tweet objects for a list of Tweet IDs, batching up to
+    ``LOOKUP_BATCH_SIZE`` IDs per request. Expansions are inlined the same
+    way as the 'a' output format of ``ResultStream``.
+
+    Args:
+        tweet_ids (list): Tweet IDs, as strings or ints.
+        endpoint (str): a search, counts or lookup endpoint; the lookup
+            endpoint on the same host is used.
+        bearer_token (str): bearer token for v2.
+        extra_headers_dict (dict): custom headers to add.
+        tweet_fields (str): comma-delimited Tweet fields, as for search.
+        Also user_fields, media_fields, place_fields, poll_fields, expansions.
+        deadline (float): absolute time (epoch seconds) by which lookups
+            must be done, as for ``ResultStream``. Batches not looked up by
+            then are left out.
+        reserve_seconds (float): time to keep in hand before the deadline.
+        Any other keyword arguments are passed to ``request``.
+
+    Returns:
+        list of expanded Tweets, in the order of ``tweet_ids``. Tweets that
+        could not be looked up (deleted, protected, a failed request, out of
+        time) are left out.
+
+    Example:
+        >>> from searchtweets import hydrate_tweets
+        >>> tweets = hydrate_tweets(["1484265578202382336"],
+                                    tweet_fields="created_at,public_metrics",
+                                    expansions="author_id",
+                                    **search_args)
+    """
+    tweet_ids = [str(tweet_id) for tweet_id in tweet_ids]
+    if not tweet_ids:
+        return []
+
+    url = change_to_lookup_endpoint(endpoint)
+    fields = {"tweet.fields": tweet_fields,
+              "user.fields": user_fields,
+              "media.fields": media_fields,
+              "place.fields": place_fields,
+              "poll.fields": poll_fields,
+              "expansions": expansions}
+    fields = {k: v for k, v in fields.items() if v}
+
+    session = make_session(bearer_token, extra_headers_dict)
+    hydrated = {}
+    try:
+        for batch in partition(tweet_ids, LOOKUP_BATCH_SIZE, pad_none=True):
+            batch = [tweet_id for tweet_id in batch if tweet_id is not None]
+            request_parameters = dict(fields, ids=",".join(batch))
+            deadline_kwargs = {}
+            if deadline is not None:
+                # Leave the reserve untouched, and don't let a slow response hang past it.
+                request_deadline = deadline - (reserve_seconds or 0)
+                deadline_kwargs = {"deadline": request_deadline,
+                                   "timeout": max(request_deadline - time.time(), 1)}
+            try:
+                resp = request(session=session, url=url,
+                               request_parameters=request_parameters,
+                               **dict(kwargs, **deadline_kwargs))
+            except (DeadlineExceeded, requests.exceptions.Timeout):
+                if deadline is None:
+                    raise
+                logger.warning("lookup abandoned at the deadline; {} Tweets left unhydrated".format(
+                    len(tweet_ids) - len(hydrated)))
+                break
+            except requests.exceptions.HTTPError:
+                # A 4XX other than 429 ('one and done' in retry): these Tweets stay unhydrated.
+                logger.error("lookup of {} Tweets failed; skipping them".format(len(batch)))
+                continue
+            if resp.status_code != 200:
+                # Retries (429, 5XX) ran out; the rest of the batches may still get through.
+                logger.error("lookup of {} Tweets failed with HTTP {}; skipping them".format(len(batch),
+                                                                                          resp.status_code))
+                continue
+            resp = json.loads(resp.content.decode(resp.encoding))
+            expand_payload = make_expander(resp.get("includes", None))
+            for tweet in resp.get("data", []):
+                hydrated[tweet["id"]] = expand_payload(tweet)
+            for error in resp.get("errors", []):
+                logger.info("could not look up {}: {}".format(error.get("value"), error.get("detail")))
+    finally:
+        session.close()
+
+    logger.info("hydrated {} of {} Tweets".format(len(hydrated), len(tweet_ids)))
+    return [hydrated[tweet_id] for tweet_id in tweet_ids if tweet_id in hydrated]
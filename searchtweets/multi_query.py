@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 Twitter, Inc.
+# Licensed under the MIT License
+# https://opensource.org/licenses/MIT
+"""
+Collection for many queries at once. Small, compatible queries are packed
+into OR'd requests up to the query length limit, and each returned Tweet is
+routed back to the sub-queries it satisfies, each with its own ranker.
+"""
+
+import logging
+import queue
+import threading
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from .query import (parse_query, split_query, tweet_features, Term,
+                    QUERY_LENGTH_LIMIT, MATCH_TWEET_FIELDS, MATCH_EXPANSIONS)
+from .ranking import TopK
+from .dedup import SeenIds
+from .result_stream import ResultStream
+
+__all__ = ["QueryBatch", "plan_query_batches", "MultiQueryCollector",
+           "SplitQueryStream"]
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBatch:
+    """
+    Queries that share one request.
+
+    Attributes:
+        members (list): ``(query_id, query)`` pairs, where ``query`` is the
+            parsed ``Query``. A query that can't be matched locally runs on
+            its own, unparsed.
+        query (str): the combined query sent to the API.
+    """
+
+    def __init__(self, members):
+        self.members = members
+
+    @property
+    def query(self):
+        if len(self.members) == 1:
+            return self.members[0][1].text
+        return " OR ".join(_clause(query) for _, query in self.members)
+
+    def needs_matching(self):
+        return len(self.members) > 1
+
+    def __repr__(self):
+        return "QueryBatch({!r})".format(self.query)
+
+
+class _Unparsed:
+    """Stands in for a query that can't be matched locally; it runs alone."""
+
+    def __init__(self, text):
+        self.text = ' '.join(text.split())
+
+
+def _clause(query):
+    return query.text if isinstance(query.root, Term) else "({})".format(query.text)
+
+
+def plan_query_batches(queries, max_length=QUERY_LENGTH_LIMIT):
+    """
+    Packs queries into as few OR'd requests as the length limit allows,
+    keeping their order. Queries with operators that can't be matched
+    locally (see ``searchtweets.query``) get a request of their own.
+
+    Args:
+        queries (dict): query ID -> query string.
+        max_length (int): query length limit of the endpoint.
+
+    Returns:
+        list of QueryBatch
+
+    Example:
+        >>> plan_query_batches({"snow": "#snow", "ski": "ski has:media"})
+        [QueryBatch('#snow OR (ski has:media)')]
+    """
+    batches = []
+    members = []
+    length = 0
+
+    for query_id, text in queries.items():
+        try:
+            query = parse_query(text)
+        except ValueError:
+            logger.info("query {} can't be matched locally; it gets its own request".format(query_id))
+            batches.append(QueryBatch([(query_id, _Unparsed(text))]))
+            continue
+
+        clause_length = len(_clause(query))
+        if members and length + len(" OR ") + clause_length > max_length:
+            batches.append(QueryBatch(members))
+            members = []
+            length = 0
+        length += clause_length + (len(" OR ") if members else 0)
+        members.append((query_id, query))
+
+    if members:
+        batches.append(QueryBatch(members))
+
+    logger.info("planned {} requests for {} queries".format(len(batches), len(queries)))
+    return batches
+
+
+def _merge_fields(*field_lists):
+    merged = []
+    for fields in field_lists:
+        for field in (fields or "").split(","):
+            if field and field not in merged:
+                merged.append(field)
+    return ",".join(merged)
+
+
+class MultiQueryCollector:
+    """
+    Collects top Tweets for many queries, sharing requests between them.
+
+    Args:
+        queries (dict): query ID -> query string.
+        request_parameters (dict or json): other request parameters shared by
+            all queries, e.g. from ``gen_request_parameters``. Any query in it
+            is ignored.
+        k (int): how many top Tweets to keep per query.
+        ranker_factory (function): builds the ranker for a query ID; defaults
+            to a ``TopK(k)`` per query.
+        max_length (int): query length limit of the endpoint.
+        result_stream_args (dict): other ``ResultStream`` arguments, e.g.
+            ``endpoint`` and ``bearer_token``.
+
+    Example:
+        >>> collector = MultiQueryCollector({"snow": "#snow", "ski": "ski"},
+                                            request_parameters=params,
+                                            **search_args)
+        >>> rankers = collector.collect()
+        >>> rankers["snow"].ranked()
+    """
+
+    def __init__(self, queries, request_parameters=None, k=10, ranker_factory=None,
+                 max_length=QUERY_LENGTH_LIMIT, **result_stream_args):
+        if isinstance(request_parameters, str):
+            request_parameters = json.loads(request_parameters)
+        self.request_parameters = dict(request_parameters or {})
+        self.request_parameters.pop("query", None)
+        self.result_stream_args = result_stream_args
+        self.result_stream_args.setdefault("max_tweets", None)
+
+        ranker_factory = ranker_factory or (lambda query_id: TopK(k))
+        self.rankers = {query_id: ranker_factory(query_id) for query_id in queries}
+        self.max_length = max_length
+        self.batches = plan_query_batches(queries, max_length)
+        self.n_requests = 0
+        self.n_tweets = 0
+
+    def batch_request_parameters(self, batch):
+        """
+        Request parameters for a batch: the shared ones, plus the fields
+        needed to route Tweets back to their queries.
+        """
+        params = dict(self.request_parameters, query=batch.query)
+        if batch.needs_matching():
+            params["tweet.fields"] = _merge_fields(params.get("tweet.fields"), MATCH_TWEET_FIELDS)
+            params["expansions"] = _merge_fields(params.get("expansions"), MATCH_EXPANSIONS)
+        return params
+
+    def route(self, batch, tweet):
+        """
+        Offers a Tweet to the rankers of the batch queries it satisfies.
+        """
+        if not batch.needs_matching():
+            self.rankers[batch.members[0][0]].add(tweet)
+            return
+        features = tweet_features(tweet)
+        for query_id, query in batch.members:
+            if query.root.matches(features):
+                self.rankers[query_id].add(tweet)
+
+    def collect(self):
+        """
+        Runs every batch and returns the rankers, keyed by query ID.
+        """
+        for batch in self.batches:
+            # A lone query over the length limit is split rather than failing.
+            if len(batch.query) > self.max_length:
+                rs = SplitQueryStream(request_parameters=self.batch_request_parameters(batch),
+                                      output_format="a",
+                                      max_length=self.max_length,
+                                      **self.result_stream_args)
+            else:
+                rs = ResultStream(request_parameters=self.batch_request_parameters(batch),
+                                  output_format="a",
+                                  **self.result_stream_args)
+            for tweet in rs.stream():
+                self.n_tweets += 1
+                self.route(batch, tweet)
+            self.n_requests += rs.n_requests
+
+        logger.info("collected {} Tweets for {} queries in {} requests"
+                    .format(self.n_tweets, len(self.rankers), self.n_requests))
+        return self.rankers
+
+
+class SplitQueryStream:
+    """
+    Runs a query that is over the length limit as several sub-queries (see
+    ``split_query``), concurrently, and streams the merged results with
+    duplicate Tweets removed. Takes the same arguments as ``ResultStream``,
+    which it can stand in for.
+
+    Args:
+        request_parameters (json or dict): payload, including the full query.
+        max_length (int): query length limit of the endpoint.
+        max_workers (int): how many sub-queries run at once.
+        max_tweets (int): max number of Tweets returned, over all sub-queries.
+        output_format (str): 'a' for Tweets, or 'r' for response pages
+            whose ``data`` has duplicates removed.
+        result_stream_args (dict): other ``ResultStream`` arguments.
+
+    Example:
+        >>> rs = SplitQueryStream(request_parameters=params, **search_args)
+        >>> tweets = list(rs.stream())
+    """
+
+    def __init__(self, request_parameters, max_length=QUERY_LENGTH_LIMIT, max_workers=4,
+                 max_tweets=None, output_format="a", **result_stream_args):
+        if isinstance(request_parameters, str):
+            request_parameters = json.loads(request_parameters)
+        if output_format not in ("a", "r"):
+            raise ValueError("SplitQueryStream supports the 'a' and 'r' output formats")
+        self.request_parameters = request_parameters
+        self.queries = split_query(request_parameters["query"], max_length)
+        self.max_workers = max_workers
+        self.max_tweets = max_tweets if isinstance(max_tweets, int) else 10 ** 15
+        self.output_format = output_format
+        self.streams = [ResultStream(request_parameters=dict(request_parameters, query=query),
+                                     output_format=output_format,
+                                     max_tweets=None,
+                                     **result_stream_args)
+                        for query in self.queries]
+        self.total_results = 0
+        self.n_duplicates = 0
+
+    @property
+    def n_requests(self):
+        return sum(rs.n_requests for rs in self.streams)
+
+    @property
+    def partial(self):
+        return any(rs.partial for rs in self.streams)
+
+    @property
+    def n_retries(self):
+        return sum(rs.n_retries for rs in self.streams)
+
+    @property
+    def n_bytes(self):
+        return sum(rs.n_bytes for rs in self.streams)
+
+    @property
+    def request_seconds(self):
+        return sum(rs.request_seconds for rs in self.streams)
+
+    def stream(self):
+        """
+        Streams de-duplicated results of all sub-queries, in arrival order.
+        """
+        results = queue.Queue(maxsize=1000)
+        stopped = threading.Event()
+        pending = queue.Queue()
+        for rs in self.streams:
+            pending.put(rs)
+
+        done = object()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    results.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def work():
+            while not stopped.is_set():
+                try:
+                    rs = pending.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    for item in rs.stream():
+                        if not put(item):
+                            break
+                except Exception as exc:
+                    put(exc)
+            put(done)
+
+        n_workers = min(self.max_workers, len(self.streams))
+        workers = [threading.Thread(target=work, daemon=True) for _ in range(n_workers)]
+        for worker in workers:
+            worker.start()
+
+        seen = SeenIds()
+        n_done = 0
+        try:
+            while n_done < n_workers and self.total_results < self.max_tweets:
+                item = results.get()
+                if item is done:
+                    n_done += 1
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+
+                if self.output_format == "a":
+                    if not seen.add(item["id"]):
+                        self.n_duplicates += 1
+                        continue
+                    self.total_results += 1
+                    yield item
+                else:
+                    tweets = []
+                    for tweet in item.get("data", []):
+                        if not seen.add(tweet["id"]):
+                            self.n_duplicates += 1
+                            continue
+                        tweets.append(tweet)
+                    self.total_results += len(tweets)
+                    yield dict(item, data=tweets)
+        finally:
+            stopped.set()
+
+        logger.info("merged {} Tweets from {} sub-queries; dropped {} duplicates"
+                    .format(self.total_results, len(self.queries), self.n_duplicates))
+
+    def __repr__(self):
+        return "SplitQueryStream: {} sub-queries of {!r}".format(len(self.queries),
+                                                               self.request_parameters["query"])
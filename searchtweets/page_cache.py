@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 Twitter, Inc.
+# Licensed under the MIT License
+# https://opensource.org/licenses/MIT
+"""
+On-disk cache of response pages for searches over closed time windows
+(``end_time`` in the past), so re-running a report doesn't fetch the same
+pages again. Which Tweets match a closed window doesn't change; their
+metrics do, so how long an entry is served depends on whether its request
+asked for metrics.
+
+Entries are content-addressed: the file name is a hash of the endpoint and
+the normalized request parameters (the query, the window and, for later
+pages, the ``next_token`` of the page before). Pages are stored
+gzip-compressed, and the least recently used are evicted once the cache
+grows past ``max_bytes``.
+"""
+
+import os
+import gzip
+import time
+import json
+import calendar
+import hashlib
+import logging
+
+__all__ = ["PageCache"]
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+# Pages with Tweet or user metrics are refetched once they are this old, by default.
+METRICS_MAX_AGE = 3600
+
+# A window is taken as closed once its end_time is this far in the past.
+_CLOSED_MARGIN = 60
+
+# Evicting goes down to this fraction of max_bytes, so it doesn't run on every write.
+_LOW_WATER = 0.9
+
+
+def _epoch(timestamp):
+    # end_time as convert_utc_time formats it, "YYYY-mm-ddTHH:MM:SSZ".
+    return calendar.timegm(time.strptime(timestamp[:19], "%Y-%m-%dT%H:%M:%S"))
+
+
+class PageCache:
+    """
+    Response pages of closed-window searches, on disk.
+
+    Args:
+        cache_dir (str): where pages are kept; created if need be. Several
+            processes may share it.
+        max_bytes (int): size of the cache (compressed) past which the least
+            recently used pages are evicted.
+        max_age (float): seconds a page without metrics is served for;
+            None for as long as it is cached.
+        metrics_max_age (float): seconds a page whose request asked for
+            metrics (``public_metrics`` and the like) is served for, before
+            it is fetched again; None for as long as it is cached.
+
+    Example:
+        >>> cache = PageCache("~/.searchtweets/pages", max_bytes=2 * 1024 ** 3)
+        >>> rs = ResultStream(cache=cache, **search_args)    # with an end_time in the past
+        >>> tweets = list(rs.stream())
+        >>> rs.n_cache_hits, rs.n_requests
+        (48, 0)
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, max_age=None, metrics_max_age=METRICS_MAX_AGE):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.metrics_max_age = metrics_max_age
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_stale = 0
+        self.n_evicted = 0
+        self._size = None  # bytes on disk; scanned on the first write
+
+    @staticmethod
+    def cacheable(request_parameters):
+        """
+        Whether a request's results can be cached: its window has closed.
+        """
+        end_time = request_parameters.get("end_time")
+        if not end_time:
+            return False
+        try:
+            return _epoch(end_time) < time.time() - _CLOSED_MARGIN
+        except ValueError:
+            return False
+
+    def key(self, endpoint, request_parameters):
+        """
+        The content address of a request: a hash of the endpoint and the
+        request parameters, with the query's whitespace normalized.
+        """
+        params = {name: value for name, value in request_parameters.items() if value is not None}
+        if "query" in params:
+            params["query"] = " ".join(params["query"].split())
+        normalized = json.dumps([endpoint, params], sort_keys=True)
+        return hashlib.blake2b(normalized.encode("utf-8"), digest_size=20).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json.gz")
+
+    def freshness(self, request_parameters):
+        """
+        How long (seconds) a page for this request is served for: the
+        ``metrics_max_age`` if any of its fields are metrics, the ``max_age``
+        otherwise.
+        """
+        for name, value in request_parameters.items():
+            if name.endswith(".fields") and value and "metrics" in value:
+                return self.metrics_max_age
+        return self.max_age
+
+    def _fresh_path(self, endpoint, request_parameters, max_age):
+        path = self._path(self.key(endpoint, request_parameters))
+        try:
+            stored_at = os.stat(path).st_mtime
+        except OSError:
+            return None, False
+        max_age = self.freshness(request_parameters) if max_age is None else max_age
+        return path, max_age is None or time.time() - stored_at <= max_age
+
+    def contains(self, endpoint, request_parameters, max_age=None):
+        """Whether a fresh page is cached for the request."""
+        path, fresh = self._fresh_path(endpoint, request_parameters, max_age)
+        return path is not None and fresh
+
+    def get(self, endpoint, request_parameters, max_age=None):
+        """
+        The cached response body (bytes) for a request, or None if it isn't
+        cached or is older than ``max_age`` seconds (by default, as
+        ``freshness`` has it).
+        """
+        path, fresh = self._fresh_path(endpoint, request_parameters, max_age)
+        if path is None or not fresh:
+            if path is None:
+                self.n_misses += 1
+            else:
+                self.n_stale += 1
+            return None
+        try:
+            with gzip.open(path, "rb") as f:
+                content = f.read()
+            # The access time marks recent use, for eviction; the modification time stays the time stored.
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except (OSError, EOFError):
+            # Evicted by another process meanwhile, or cut short.
+            self.n_misses += 1
+            return None
+        self.n_hits += 1
+        return content
+
+    def put(self, endpoint, request_parameters, content):
+        """
+        Caches a response body (bytes) for a request.
+        """
+        path = self._path(self.key(endpoint, request_parameters))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+            f.write(content)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        if self._size is None:
+            self._size = sum(entry[2] for entry in self._entries())
+        else:
+            self._size += size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        # (last used, path, bytes) of every cached page.
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if filename.endswith(".json.gz"):
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield stat.st_atime, path, stat.st_size
+
+    def evict(self):
+        """
+        Deletes the least recently used pages until the cache is back under
+        ``max_bytes`` (with some room to spare).
+        """
+        entries = sorted(self._entries())
+        size = sum(entry[2] for entry in entries)
+        target = self.max_bytes * _LOW_WATER
+        n_evicted = 0
+        for _, path, entry_size in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+            n_evicted += 1
+        self._size = size
+        self.n_evicted += n_evicted
+        logger.info("evicted {} cached pages; {} bytes cached".format(n_evicted, size))
+
+    def __repr__(self):
+        return "PageCache({!r}, {} hits, {} misses, {} stale)".format(self.cache_dir, self.n_hits, self.n_misses,
+                                                                     self.n_stale)
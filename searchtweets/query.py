@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 Twitter, Inc.
+# Licensed under the MIT License
+# https://opensource.org/licenses/MIT
+"""
+Parsing and local evaluation of search queries. A parsed query can be
+rendered back to a query string, and matched against returned Tweets, so
+several small queries can share one OR'd request and have the results
+routed back to the queries each Tweet satisfies.
+
+Only operators that can be judged from a Tweet's own fields are supported
+locally: keywords, "exact phrases", #hashtags, @mentions, $cashtags,
+``from:``, ``to:``, ``url:``, ``lang:``, ``has:`` and ``is:``.
+"""
+
+import re
+import logging
+
+__all__ = ["parse_query", "split_query", "Query", "QUERY_LENGTH_LIMIT", "MATCH_TWEET_FIELDS",
+           "MATCH_EXPANSIONS"]
+
+logger = logging.getLogger(__name__)
+
+# Query length limit of the v2 search endpoints (1024 with Academic Research access).
+QUERY_LENGTH_LIMIT = 512
+
+# Fields and expansions a Tweet needs for ``Query.matches`` to judge every operator.
+MATCH_TWEET_FIELDS = "author_id,entities,referenced_tweets,attachments,lang,geo,in_reply_to_user_id"
+MATCH_EXPANSIONS = "author_id,in_reply_to_user_id,attachments.media_keys"
+
+_TOKEN_RE = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<lparen>-?\()
+  | (?P<rparen>\))
+  | (?P<phrase>-?"(?:[^"\\]|\\.)*")
+  | (?P<operator>-?[a-z_]+:(?:"(?:[^"\\]|\\.)*"|[^\s()]+))
+  | (?P<word>-?[^\s()"]+)
+''', re.VERBOSE)
+
+_WORD_RE = re.compile(r"\w+")
+
+_HAS_MEDIA_TYPES = {"images": {"photo"},
+                    "videos": {"video", "animated_gif"},
+                    "video_link": {"video"}}
+
+
+class Node:
+    """Base of the parsed query tree."""
+
+    def render(self):
+        raise NotImplementedError
+
+    def matches(self, features):
+        raise NotImplementedError
+
+    def __str__(self):
+        return self.render()
+
+
+class Term(Node):
+    """A single keyword, phrase or operator, e.g. ``snow``, ``"fresh snow"`` or ``has:media``."""
+
+    def __init__(self, text, strict=True):
+        self.text = text
+        self.operator = None
+        self.value = text
+        if text.startswith('"'):
+            self.kind = "phrase"
+            self.value = text[1:-1]
+        elif re.match(r"[a-z_]+:", text):
+            self.kind = "operator"
+            self.operator, self.value = text.split(":", 1)
+            self.value = self.value.strip('"')
+            allowed = _OPERATOR_VALUES.get(self.operator)
+            if self.operator not in _OPERATORS or (allowed and self.value.lower() not in allowed):
+                logger.debug("{} can't be matched locally".format(text))
+                if strict:
+                    raise ValueError("unsupported operator: {}".format(text))
+                self.kind = "opaque"
+        elif text[0] in "#@$" and len(text) > 1:
+            self.kind = text[0]
+            self.value = text[1:]
+        else:
+            self.kind = "keyword"
+        self.value = self.value.lower()
+        self._tokens = _WORD_RE.findall(self.value)
+
+    def render(self):
+        return self.text
+
+    def matches(self, features):
+        if self.kind == "opaque":
+            raise ValueError("{} can't be matched locally".format(self.text))
+        if self.kind == "operator":
+            return _OPERATORS[self.operator](self.value, features)
+        if self.kind == "#":
+            return self.value in features["hashtags"]
+        if self.kind == "@":
+            return self.value in features["mentions"]
+        if self.kind == "$":
+            return self.value in features["cashtags"]
+        if len(self._tokens) == 1 and self.kind == "keyword":
+            return self._tokens[0] in features["token_set"]
+        return _contains_sequence(features["tokens"], self._tokens)
+
+
+class Not(Node):
+    def __init__(self, child):
+        self.child = child
+
+    def render(self):
+        inner = self.child.render()
+        return "-" + (f"({inner})" if isinstance(self.child, (And, Or)) else inner)
+
+    def matches(self, features):
+        return not self.child.matches(features)
+
+
+class And(Node):
+    def __init__(self, children):
+        self.children = children
+
+    def render(self):
+        return " ".join(f"({c.render()})" if isinstance(c, Or) else c.render()
+                        for c in self.children)
+
+    def matches(self, features):
+        return all(c.matches(features) for c in self.children)
+
+
+class Or(Node):
+    def __init__(self, children):
+        self.children = children
+
+    def render(self):
+        return " OR ".join(c.render() for c in self.children)
+
+    def matches(self, features):
+        return any(c.matches(features) for c in self.children)
+
+
+class Query:
+    """
+    A parsed search query. Use ``parse_query`` to build one.
+
+    Attributes:
+        text (str): the query, normalized.
+        root (Node): the parsed query tree.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.text = root.render()
+
+    def matches(self, tweet):
+        """
+        Whether a Tweet satisfies this query. The Tweet should carry
+        ``MATCH_TWEET_FIELDS``, preferably expanded ('a' output format) with
+        ``MATCH_EXPANSIONS``; missing fields count as absent.
+        """
+        return self.root.matches(tweet_features(tweet))
+
+    def __len__(self):
+        return len(self.text)
+
+    def __repr__(self):
+        return "Query({!r})".format(self.text)
+
+
+def parse_query(query, strict=True):
+    """
+    Parses a search query string. AND (whitespace) binds tighter than OR, as
+    it does for the API: ``apple OR iphone ipad`` is ``apple OR (iphone ipad)``.
+
+    Args:
+        query (str): search query, e.g. ``(snow OR #snowday) has:media -is:retweet``.
+        strict (bool): reject operators that can't be matched locally. With
+            False they are kept as-is, for rendering only.
+
+    Returns:
+        Query
+
+    Raises:
+        ValueError: for unbalanced parentheses, or, if ``strict``, an operator
+        that can't be judged locally (e.g. ``conversation_id:``).
+
+    Example:
+        >>> from searchtweets import parse_query
+        >>> parse_query("snow OR #snowday -is:retweet").matches(tweet)
+        True
+    """
+    tokens = _tokenize(query)
+    root, position = _parse_or(tokens, 0, strict)
+    if position != len(tokens):
+        raise ValueError("unbalanced parentheses in query: {}".format(query))
+    return Query(root)
+
+
+def _tokenize(query):
+    tokens = []
+    position = 0
+    while position < len(query):
+        match = _TOKEN_RE.match(query, position)
+        if match is None:
+            raise ValueError("unbalanced quotes in query: {}".format(query))
+        position = match.end()
+        if match.lastgroup != "space":
+            tokens.append((match.lastgroup, match.group()))
+    return tokens
+
+
+def _parse_or(tokens, position, strict):
+    children = []
+    while True:
+        child, position = _parse_and(tokens, position, strict)
+        children.append(child)
+        if position < len(tokens) and tokens[position] == ("word", "OR"):
+            position += 1
+            continue
+        break
+    return (children[0] if len(children) == 1 else Or(children)), position
+
+
+def _parse_and(tokens, position, strict):
+    children = []
+    while position < len(tokens):
+        kind, text = tokens[position]
+        if kind == "rparen" or (kind, text) == ("word", "OR"):
+            break
+        negated = text.startswith("-") and len(text) > 1
+        if kind == "lparen":
+            child, position = _parse_or(tokens, position + 1, strict)
+            if position >= len(tokens) or tokens[position][0] != "rparen":
+                raise ValueError("unbalanced parentheses in query")
+            position += 1
+        else:
+            child = Term(text[1:] if negated else text, strict)
+            position += 1
+        children.append(Not(child) if negated else child)
+    if not children:
+        raise ValueError("empty query clause")
+    return (children[0] if len(children) == 1 else And(children)), position
+
+
+def split_query(query, max_length=QUERY_LENGTH_LIMIT):
+    """
+    Splits a query that is over the length limit into sub-queries that,
+    together, match the same Tweets. The largest top-level OR group is
+    partitioned, and every part keeps the rest of the query: with a tiny
+    limit, ``(snow OR ski OR sled) -is:retweet`` becomes
+    ``(snow OR ski) -is:retweet`` and ``sled -is:retweet``.
+
+    Args:
+        query (str): search query.
+        max_length (int): query length limit of the endpoint.
+
+    Returns:
+        list of query strings; just the (normalized) query if it fits.
+
+    Raises:
+        ValueError: if the query has no top-level OR group to split, or one
+        alternative plus the rest of the query is already too long.
+    """
+    parsed = parse_query(query, strict=False)
+    if len(parsed.text) <= max_length:
+        return [parsed.text]
+
+    root = parsed.root
+    if isinstance(root, Or):
+        group = root
+    elif isinstance(root, And) and any(isinstance(c, Or) for c in root.children):
+        group = max((c for c in root.children if isinstance(c, Or)), key=lambda c: len(c.render()))
+    else:
+        raise ValueError("query is over {} characters and has no OR group to split".format(max_length))
+
+    def render(alternatives):
+        node = alternatives[0] if len(alternatives) == 1 else Or(alternatives)
+        if group is root:
+            return node.render()
+        return And([node if c is group else c for c in root.children]).render()
+
+    sub_queries = []
+    part = []
+    for alternative in group.children:
+        if part and len(render(part + [alternative])) > max_length:
+            sub_queries.append(render(part))
+            part = []
+        part.append(alternative)
+        if len(render(part)) > max_length:
+            raise ValueError("query can't be split below {} characters: {}".format(max_length, render(part)))
+    sub_queries.append(render(part))
+
+    logger.info("split a {} character query into {} sub-queries".format(len(parsed.text), len(sub_queries)))
+    return sub_queries
+
+
+def _contains_sequence(tokens, sequence):
+    if not sequence:
+        return False
+    n = len(sequence)
+    first = sequence[0]
+    for i, token in enumerate(tokens):
+        if token == first and tokens[i:i + n] == sequence:
+            return True
+    return False
+
+
+def tweet_features(tweet):
+    """
+    Pulls the fields query terms are matched against out of a Tweet, e.g.
+    lower-cased text tokens, hashtags and author identifiers.
+    """
+    text = tweet.get("text", "").lower()
+    entities = tweet.get("entities", {})
+
+    def entity_values(name, key, pattern):
+        if name in entities:
+            return {entity[key].lower() for entity in entities[name]}
+        return set(re.findall(pattern, text))
+
+    author = tweet.get("author") or {}
+    reply_user = tweet.get("in_reply_to_user") or {}
+    tokens = _WORD_RE.findall(text)
+
+    return {"tokens": tokens,
+            "token_set": set(tokens),
+            "hashtags": entity_values("hashtags", "tag", r"#(\w+)"),
+            "mentions": entity_values("mentions", "username", r"@(\w+)"),
+            "cashtags": entity_values("cashtags", "tag", r"\$(\w+)"),
+            "urls": [url.get(key, "").lower() for url in entities.get("urls", [])
+                     for key in ("url", "expanded_url", "display_url")],
+            "author": {str(tweet.get("author_id", "")), author.get("username", "").lower()} - {""},
+            "reply_to": {str(tweet.get("in_reply_to_user_id", "")), reply_user.get("username", "").lower()} - {""},
+            "referenced": {ref.get("type") for ref in tweet.get("referenced_tweets", [])},
+            "media_keys": tweet.get("attachments", {}).get("media_keys", []),
+            "media_types": {media.get("type") for media in tweet.get("media", [])},
+            "lang": tweet.get("lang", ""),
+            "geo": "geo" in tweet,
+            "verified": bool(author.get("verified"))}
+
+
+def _has(value, features):
+    if value == "media":
+        return bool(features["media_keys"])
+    if value in _HAS_MEDIA_TYPES:
+        # Without expanded media, all we know is that there is some.
+        if not features["media_types"]:
+            return bool(features["media_keys"])
+        return bool(features["media_types"] & _HAS_MEDIA_TYPES[value])
+    if value == "links":
+        return bool(features["urls"])
+    return bool(features[value])
+
+
+def _is(value, features):
+    if value == "retweet":
+        return "retweeted" in features["referenced"]
+    if value == "reply":
+        return "replied_to" in features["referenced"]
+    if value == "quote":
+        return "quoted" in features["referenced"]
+    return features["verified"]
+
+
+# Operators whose values are a closed set; other operators take any value.
+_OPERATOR_VALUES = {"has": ("media", "images", "videos", "video_link", "links",
+                            "mentions", "hashtags", "cashtags", "geo"),
+                    "is": ("retweet", "reply", "quote", "verified")}
+
+_OPERATORS = {"from": lambda value, f: value.lstrip("@") in f["author"],
+              "to": lambda value, f: value.lstrip("@") in f["reply_to"],
+              "url": lambda value, f: any(value in url for url in f["urls"]),
+              "lang": lambda value, f: f["lang"] == value,
+              "has": _has,
+              "is": _is}
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 Twitter, Inc.
+# Licensed under the MIT License
+# https://opensource.org/licenses/MIT
+"""
+Rankers for keeping the top Tweets of a stream without holding (or sorting)
+the whole stream in memory.
+"""
+
+import time
+import heapq
+import logging
+
+__all__ = ["TopK", "RollingTopK", "WindowedTopK", "EarlyStop", "engagement_score", "snowflake_seconds"]
+
+logger = logging.getLogger(__name__)
+
+# Start of Tweet ID time, in epoch milliseconds.
+SNOWFLAKE_EPOCH_MS = 1288834974657
+
+
+def engagement_score(tweet):
+    """
+    Total of a Tweet's public metrics: likes, Retweets, replies and quotes.
+    """
+    metrics = tweet.get("public_metrics", {})
+    return (metrics.get("like_count", 0) + metrics.get("retweet_count", 0) +
+            metrics.get("reply_count", 0) + metrics.get("quote_count", 0))
+
+
+def snowflake_seconds(tweet_id):
+    """
+    Creation time of a Tweet (epoch seconds), read from its ID: no
+    ``created_at`` field needed.
+    """
+    return ((int(tweet_id) >> 22) + SNOWFLAKE_EPOCH_MS) / 1000.0
+
+
+class TopK:
+    """
+    Keeps the ``k`` highest-scoring Tweets seen, in a bounded min-heap, so
+    adding a Tweet costs O(log k) and memory stays at ``k`` Tweets.
+    Ties are broken in favour of the newer (higher) Tweet ID.
+
+    Args:
+        k (int): how many Tweets to keep.
+        score_func (function): maps a Tweet to its score. Defaults to
+            ``engagement_score``.
+        minimum (number): Tweets scoring below this are never kept.
+
+    Example:
+        >>> ranker = TopK(10)
+        >>> for tweet in ResultStream(output_format="a", **search_args).stream():
+        ...     ranker.add(tweet)
+        >>> for score, tweet in ranker.ranked():
+        ...     print(score, tweet["id"])
+    """
+
+    def __init__(self, k, score_func=engagement_score, minimum=None):
+        self.k = int(k)
+        self.score_func = score_func
+        self.minimum = minimum
+        self.n_seen = 0
+        self._heap = []
+
+    def add(self, tweet, score=None):
+        """
+        Offers a Tweet to the ranker. Returns True if it made the top ``k``.
+        """
+        self.n_seen += 1
+        if score is None:
+            score = self.score_func(tweet)
+        if self.minimum is not None and score < self.minimum:
+            return False
+
+        entry = (score, int(tweet["id"]), tweet)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+            return True
+        if entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+            return True
+        return False
+
+    def kth_score(self):
+        """
+        Score of the lowest Tweet kept, or None while fewer than ``k`` are kept.
+        """
+        if len(self._heap) < self.k:
+            return None
+        return self._heap[0][0]
+
+    def ranked(self):
+        """
+        Returns the kept Tweets as ``(score, tweet)`` pairs, highest score first.
+        """
+        return [(score, tweet) for score, _, tweet in sorted(self._heap, key=lambda e: e[:2], reverse=True)]
+
+    def __len__(self):
+        return len(self._heap)
+
+
+class RollingTopK:
+    """
+    Keeps the ``k`` highest-scoring Tweets of a live stream, where the same
+    Tweet keeps coming back with newer metrics (e.g. as the original of each
+    Retweet), within a sliding window of Tweet creation time. Updating a
+    Tweet in the top ``k``, or one that doesn't make it, costs O(k); only a
+    top Tweet dropping (expiring, or its score falling) re-ranks the rest.
+
+    Args:
+        k (int): how many Tweets to keep.
+        score_func (function): maps a Tweet to its score. Defaults to
+            ``engagement_score``.
+        window_seconds (float): Tweets created longer ago than this are
+            dropped by ``expire``; defaults to no window.
+        max_candidates (int): Tweets kept outside the top ``k``, in case they
+            climb into it; the lowest-scoring are dropped past this.
+
+    Attributes:
+        version (int): bumped every time the top ``k`` changes.
+
+    Example:
+        >>> ranker = RollingTopK(10, window_seconds=24 * 3600)
+        >>> for tweet in FilteredStream(**stream_args).stream():
+        ...     if ranker.add(tweet):
+        ...         publish(ranker.ranked())
+    """
+
+    def __init__(self, k, score_func=engagement_score, window_seconds=None, max_candidates=100000):
+        self.k = int(k)
+        self.score_func = score_func
+        self.window_seconds = window_seconds
+        self.max_candidates = max_candidates
+        self.n_seen = 0
+        self.version = 0
+        self._candidates = {}  # Tweet ID -> (score, tweet)
+        self._top = {}  # Tweet ID -> score, for the top k
+        self._created = []  # (created seconds, Tweet ID) min-heap, for expiry
+
+    def add(self, tweet, score=None):
+        """
+        Offers a new or updated Tweet. Returns True if the top ``k`` changed.
+        """
+        self.n_seen += 1
+        if score is None:
+            score = self.score_func(tweet)
+        tweet_id = int(tweet["id"])
+
+        if tweet_id not in self._candidates:
+            created = snowflake_seconds(tweet_id)
+            if self.window_seconds is not None and created < time.time() - self.window_seconds:
+                return False
+            if len(self._candidates) >= self.max_candidates:
+                self._prune()
+            heapq.heappush(self._created, (created, tweet_id))
+        self._candidates[tweet_id] = (score, tweet)
+
+        if tweet_id in self._top:
+            previous = self._top[tweet_id]
+            if score == previous:
+                return False
+            if score > previous:
+                self._top[tweet_id] = score
+            else:
+                # It may have fallen below a Tweet outside the top k.
+                self._rerank()
+            return self._changed()
+
+        if len(self._top) < self.k:
+            self._top[tweet_id] = score
+            return self._changed()
+        lowest = min(self._top.items(), key=lambda item: (item[1], item[0]))
+        if (score, tweet_id) > (lowest[1], lowest[0]):
+            del self._top[lowest[0]]
+            self._top[tweet_id] = score
+            return self._changed()
+        return False
+
+    def expire(self, now=None):
+        """
+        Drops Tweets created before the window. Returns True if the top ``k``
+        changed.
+        """
+        if self.window_seconds is None:
+            return False
+        oldest = (time.time() if now is None else now) - self.window_seconds
+        dropped_top = False
+        while self._created and self._created[0][0] < oldest:
+            _, tweet_id = heapq.heappop(self._created)
+            if self._candidates.pop(tweet_id, None) is not None and tweet_id in self._top:
+                dropped_top = True
+        if dropped_top:
+            self._rerank()
+            return self._changed()
+        return False
+
+    def ranked(self):
+        """
+        Returns the top Tweets as ``(score, tweet)`` pairs, highest score first.
+        """
+        top = sorted(self._top.items(), key=lambda item: (item[1], item[0]), reverse=True)
+        return [(score, self._candidates[tweet_id][1]) for tweet_id, score in top]
+
+    def kth_score(self):
+        """
+        Score of the lowest top Tweet, or None while fewer than ``k`` are kept.
+        """
+        if len(self._top) < self.k:
+            return None
+        return min(self._top.values())
+
+    def _rerank(self):
+        top = heapq.nlargest(self.k, self._candidates.items(), key=lambda item: (item[1][0], item[0]))
+        self._top = {tweet_id: score for tweet_id, (score, _) in top}
+
+    def _prune(self):
+        # Keep the better-scoring half; the expiry heap skips IDs no longer held.
+        keep = heapq.nlargest(self.max_candidates // 2, self._candidates.items(),
+                              key=lambda item: (item[1][0], item[0]))
+        pruned = dict(keep)
+        pruned.update((tweet_id, self._candidates[tweet_id]) for tweet_id in self._top)
+        self._candidates = pruned
+        self._created = [entry for entry in self._created if entry[1] in pruned]
+        heapq.heapify(self._created)
+
+    def _changed(self):
+        self.version += 1
+        return True
+
+    def __len__(self):
+        return len(self._top)
+
+
+class WindowedTopK:
+    """
+    Several top lists from one pass over one fetch: a bounded ``TopK`` per
+    (window, metric) pair, e.g. the top Tweets of the last 1h, 6h and 24h
+    by likes, by Retweets and by total score. Each Tweet's age is read once
+    from its ID, and it is offered only to the windows it falls in.
+
+    Args:
+        k (int): how many Tweets each list keeps.
+        windows (dict): window label -> length in seconds, e.g.
+            ``{"1h": 3600, "24h": 86400}``.
+        metrics (dict): metric name -> function mapping a Tweet to its score.
+        now (float): end of the windows, in epoch seconds. Defaults to the
+            time the ranker is made.
+        minimum (number): Tweets scoring below this are never kept.
+
+    Example:
+        >>> ranker = WindowedTopK(10, {"1h": 3600, "24h": 86400},
+                                  {"likes": lambda t: t["public_metrics"]["like_count"]})
+        >>> for tweet in tweets:
+        ...     ranker.add(tweet)
+        >>> ranker.ranked()[("1h", "likes")]
+    """
+
+    def __init__(self, k, windows, metrics, now=None, minimum=None):
+        self.k = int(k)
+        self.now = time.time() if now is None else now
+        # Widest first, so a Tweet too old for one window is too old for the rest.
+        self.windows = sorted(windows.items(), key=lambda window: window[1], reverse=True)
+        self.metrics = dict(metrics)
+        self.n_seen = 0
+        self.n_too_old = 0
+        self._rankers = {(label, metric): TopK(k, score_func, minimum)
+                         for label, _ in self.windows for metric, score_func in self.metrics.items()}
+
+    def add(self, tweet):
+        """
+        Offers a Tweet to every list whose window it falls in. Returns how
+        many lists it made.
+        """
+        self.n_seen += 1
+        age = self.now - snowflake_seconds(tweet["id"])
+        scores = None
+        kept = 0
+        for label, seconds in self.windows:
+            if age > seconds:
+                break
+            if scores is None:
+                scores = {metric: score_func(tweet) for metric, score_func in self.metrics.items()}
+            for metric, score in scores.items():
+                kept += self._rankers[(label, metric)].add(tweet, score)
+        if scores is None:
+            self.n_too_old += 1
+        return kept
+
+    def ranked(self):
+        """
+        Returns every list, as ``{(window, metric): [(score, tweet), ...]}``,
+        highest score first.
+        """
+        return {key: ranker.ranked() for key, ranker in self._rankers.items()}
+
+    def __len__(self):
+        return len(self._rankers)
+
+
+class EarlyStop:
+    """
+    Early-termination predicate for paging through ``sort_order=relevancy``
+    results, for ``ResultStream(early_stop=...)``. It ranks each page as it
+    arrives and ends paging once ``patience`` pages in a row have produced no
+    Tweet beating the current K-th score by more than ``margin``: with
+    relevancy ordering, the top K are then very likely already in hand.
+
+    Args:
+        k (int): size of the top list that matters.
+        score_func (function): maps a Tweet to its score. Defaults to
+            ``engagement_score``.
+        margin (float): how far, as a fraction of the K-th score, a Tweet must
+            beat it to count as an improvement. Defaults to 0.
+        patience (int): pages without an improvement before stopping.
+
+    Attributes:
+        ranker (TopK): the Tweets ranked so far.
+
+    Example:
+        >>> stop = EarlyStop(10, margin=0.1)
+        >>> rs = ResultStream(request_parameters=relevancy_params,
+                              early_stop=stop, output_format="r", **search_args)
+        >>> for page in rs.stream():
+        ...     pass
+        >>> stop.ranker.ranked()
+    """
+
+    def __init__(self, k, score_func=engagement_score, margin=0.0, patience=1):
+        self.ranker = TopK(k, score_func)
+        self.score_func = score_func
+        self.margin = margin
+        self.patience = patience
+        self.pages_without_improvement = 0
+
+    def __call__(self, tweets):
+        kth_score = self.ranker.kth_score()
+        improved = False
+        for tweet in tweets or []:
+            score = self.score_func(tweet)
+            if kth_score is not None and score > kth_score * (1 + self.margin):
+                improved = True
+            self.ranker.add(tweet, score)
+
+        # Until the top list is full, every page counts.
+        if kth_score is None or improved:
+            self.pages_without_improvement = 0
+            return False
+
+        self.pages_without_improvement += 1
+        return self.pages_without_improvement >= self.patience
@@ -8,9 +8,12 @@ Its core method is the ``ResultStream`` object, which takes the API call
 arguments and returns a stream of results to the user.
 """
 
+import re
 import time
 import logging
+import threading
 import requests
+from collections import deque
 from urllib.parse import urlencode
 try:
     import ujson as json
@@ -18,6 +21,8 @@ except ImportError:
     import json
 
 from .utils import merge_dicts
+from .batches import TweetBatch
+from .page_cache import PageCache
 from .api_utils import infer_endpoint, change_to_count_endpoint
 from collections import defaultdict
 
@@ -26,6 +31,10 @@ from ._version import VERSION
 logger = logging.getLogger(__name__)
 
 
+class DeadlineExceeded(Exception):
+    """Raised when a request cannot be (re)tried before its deadline."""
+
+
 def make_session(bearer_token=None, extra_headers_dict=None):
     """Creates a Requests Session for use. Accepts a bearer token
     for v2.
@@ -58,6 +67,7 @@ def retry(func):
     Rate-limit (429) and server-side errors (5XX) implement a retry design.
     Other 4XX errors are a 'one and done' type error.
     Retries implement an exponential backoff...
+    The number of retries is attached to the returned response as ``n_retries``.
     Args:
         func (function): function for decoration
     Returns:
@@ -67,6 +77,8 @@ def retry(func):
         max_tries = 10
         tries = 0
         total_sleep_seconds = 0
+        # Absolute time (epoch seconds) past which we stop backing off.
+        deadline = kwargs.pop("deadline", None)
 
         while True:
             try:
@@ -102,12 +114,17 @@ def retry(func):
                     raise requests.exceptions.HTTPError
 
 
+                if deadline is not None and time.time() + sleep_seconds > deadline:
+                    logger.error("Not enough time left before the deadline to retry; giving up.")
+                    raise DeadlineExceeded
+
                 logger.error(f"Will retry in {sleep_seconds} seconds...")
                 time.sleep(sleep_seconds)
                 continue
 
             break
 
+        resp.n_retries = tries
         return resp
 
     return retried_func
@@ -141,6 +158,136 @@ def request(session, url, request_parameters, **kwargs):
     return result
 
 
+def make_expander(includes, search_type="tweets"):
+    """
+    Builds the function that inlines a response's ``includes`` objects
+    (authors, media, referenced Tweets, ...) into the Tweet objects of the
+    same response.
+    Args:
+        includes (dict or None): the ``includes`` section of a response.
+        search_type (str): 'tweets' or 'counts'.
+    Returns:
+        function taking a Tweet (or any payload) and returning it expanded.
+    """
+
+    def extract_includes(expansion, _id="id"):
+        """
+        Return empty objects for things missing in includes.
+        """
+        if includes is not None and expansion in includes:
+            return defaultdict(
+                lambda: {},
+                {include[_id]: include for include in includes[expansion]},
+            )
+        else:
+            return defaultdict(lambda: {})
+
+    #TODO - counts does not have extractions.... So, skip if you caunt.
+    # Users extracted both by id and by username for expanding mentions
+    includes_users = merge_dicts(extract_includes("users"), extract_includes("users", "username"))
+    # Tweets in includes will themselves be expanded
+    includes_tweets = extract_includes("tweets")
+    # Media is by media_key, not id
+    includes_media = extract_includes("media", "media_key")
+    includes_polls = extract_includes("polls")
+    includes_places = extract_includes("places")
+    # Errors are returned but unused here
+    includes_errors = extract_includes("errors")
+
+    def expand_payload(payload):
+        """
+        Recursively step through an object and sub objects and append extra data. 
+        """
+
+        # Don't try to expand on primitive values, return strings as is:
+        if isinstance(payload, (str, bool, int, float)):
+            return payload
+        # expand list items individually:
+        elif isinstance(payload, list):
+            payload = [expand_payload(item) for item in payload]
+            return payload
+        # Try to expand on dicts within dicts:
+        elif isinstance(payload, dict):
+            for key, value in payload.items():
+                payload[key] = expand_payload(value)
+
+        if "author_id" in payload:
+            payload["author"] = includes_users[payload["author_id"]]
+
+        if "in_reply_to_user_id" in payload:
+            payload["in_reply_to_user"] = includes_users[payload["in_reply_to_user_id"]]
+
+        if "media_keys" in payload:
+            payload["media"] = list(includes_media[media_key] for media_key in payload["media_keys"])
+
+        if "poll_ids" in payload:
+            poll_id = payload["poll_ids"][-1] # always 1, only 1 poll per tweet.
+            payload["poll"] = includes_polls[poll_id]
+
+        if "geo" in payload:
+            place_id = payload["geo"]['place_id']
+            payload["geo"] = merge_dicts(payload["geo"], includes_places[place_id])
+
+        if "mentions" in payload:
+            payload["mentions"] = list(merge_dicts(referenced_user, includes_users[referenced_user['username']]) for referenced_user in payload["mentions"])
+
+        if "referenced_tweets" in payload:
+            payload["referenced_tweets"] = list(merge_dicts(referenced_tweet, includes_tweets[referenced_tweet['id']]) for referenced_tweet in payload["referenced_tweets"])
+
+        if "pinned_tweet_id" in payload:
+            payload["pinned_tweet"] = includes_tweets[payload["pinned_tweet_id"]]
+
+        return payload
+
+    #TODO: Tweets or Counts?
+    # First, expand the included tweets, before processing actual result tweets:
+    if search_type == 'tweets':
+        for included_id, included_tweet in extract_includes("tweets").items():
+            includes_tweets[included_id] = expand_payload(included_tweet)
+
+    return expand_payload
+
+
+def decode_page(content, encoding="utf-8", output_format="a", search_type="tweets", worker_func=None):
+    """
+    Decodes a raw response body and, for the 'a' output format, expands its
+    Tweets; ``worker_func``, if given, is then applied to each Tweet, and
+    Tweets it maps to None are dropped. Module-level, so it can run in a
+    worker process.
+    Returns:
+        list of Tweets for 'a', a ``TweetBatch`` for 'c', or the response
+        page for 'r'.
+    """
+    page = json.loads(content.decode(encoding or "utf-8"))
+    tweets = page.get("data") or []
+    if output_format == "a":
+        expand_payload = make_expander(page.get("includes"), search_type)
+        tweets = [expand_payload(tweet) for tweet in tweets]
+    if worker_func is not None:
+        tweets = [tweet for tweet in map(worker_func, tweets) if tweet is not None]
+    if output_format == "a":
+        return tweets
+    if output_format == "c":
+        return TweetBatch.from_tweets(tweets)
+    if "data" in page:
+        page["data"] = tweets
+    return page
+
+
+# The meta object closes a response: flat, small, and all paging needs.
+_META_RE = re.compile(rb'"meta"\s*:\s*(\{[^{}]*\})')
+
+
+def scan_meta(content):
+    """
+    Reads just the ``meta`` object out of a raw response body, without
+    decoding the rest. Returns None if it can't be found.
+    """
+    position = content.rfind(b'"meta"')
+    match = _META_RE.match(content, position) if position >= 0 else None
+    return json.loads(match.group(1)) if match else None
+
+
 class ResultStream:
     """
     Class to represent an API query that handles two major functionality
@@ -162,6 +309,49 @@ class ResultStream:
         instance will make. Good for testing in v2 environment.
 
         extra_headers_dict (dict): custom headers to add
+
+        deadline (float): absolute time (epoch seconds) by which this stream
+        must be done. Paging and retries stop early once the time left won't
+        cover another request plus ``reserve_seconds``; the stream is then
+        flagged with ``partial = True``.
+
+        time_budget (float): alternative to ``deadline``, in seconds counted
+        from the start of ``stream()``.
+
+        reserve_seconds (float): time to keep in hand after the last request,
+        e.g. for publishing results. Defaults to 0.
+
+        early_stop (function): called with each page's Tweets once the page
+        has been served; paging ends when it returns True. See ``EarlyStop``
+        for one suited to ``sort_order=relevancy``.
+
+        output_format (str): 'r' for each response page as is, 'a' for one
+        Tweet per result with its expansions inline, 'm' for a stream of
+        Tweets, includes and meta messages, or 'c' for one columnar
+        ``TweetBatch`` per page (see also ``iter_batches``).
+
+        workers (int): decode (and, for the 'a' output format, expand) pages
+        in this many worker processes, while the next pages are fetched.
+        Only the small ``meta`` object is read in this process, for the next
+        token. Results still come out in order. For the 'a', 'c' and 'r'
+        output formats; not with ``early_stop``.
+
+        worker_func (function): applied to each Tweet in the workers, e.g. a
+        projection or a scoring function; Tweets it maps to None are dropped.
+        Must be picklable: a module-level function.
+
+        cache (PageCache or str): cache pages of searches over closed windows
+        (``end_time`` in the past) here, a ``PageCache`` or a directory for
+        one, and read them from it rather than the API while they are fresh.
+
+        cache_max_age (float): seconds a cached page is served for, overriding
+        the cache's freshness policy (which refetches pages with metrics
+        sooner than others).
+
+    Telemetry for the stream so far is kept in ``n_requests``,
+    ``n_retries``, ``n_bytes`` (response bodies) and ``request_seconds``;
+    for counts requests, also ``n_buckets`` and ``total_tweet_count``.
+    See ``CountsCollector`` for counts as aligned time series.
     Example:
         >>> rs = ResultStream(**search_args, request_parameters=rule, max_pages=1)
         >>> results = list(rs.stream())
@@ -169,9 +359,13 @@ class ResultStream:
     # leaving this here to have an API call counter for ALL objects in your
     # session, helping with usage of the convenience functions in the library.
     session_request_counter = 0
+    # SplitQueryStream runs streams in threads; the counter is shared by them all.
+    _counter_lock = threading.Lock()
 
     def __init__(self, endpoint, request_parameters, bearer_token=None, extra_headers_dict=None, max_tweets=500,
-                 max_requests=None, output_format="r", **kwargs):
+                 max_requests=None, output_format="r", deadline=None, time_budget=None,
+                 reserve_seconds=0, early_stop=None, workers=None, worker_func=None, cache=None,
+                 cache_max_age=None, **kwargs):
 
         self.bearer_token = bearer_token #TODO: Add support for user tokens.
         self.extra_headers_dict = extra_headers_dict
@@ -210,96 +404,51 @@ class ResultStream:
 
         self.output_format = output_format
 
-    def formatted_output(self):
-
-        def extract_includes(expansion, _id="id"):
-            """
-            Return empty objects for things missing in includes.
-            """
-            if self.includes is not None and expansion in self.includes:
-                return defaultdict(
-                    lambda: {},
-                    {include[_id]: include for include in self.includes[expansion]},
-                )
-            else:
-                return defaultdict(lambda: {})
-
-        #TODO - counts does not have extractions.... So, skip if you caunt.
-        # Users extracted both by id and by username for expanding mentions
-        includes_users = merge_dicts(extract_includes("users"), extract_includes("users", "username"))
-        # Tweets in includes will themselves be expanded
-        includes_tweets = extract_includes("tweets")
-        # Media is by media_key, not id
-        includes_media = extract_includes("media", "media_key")
-        includes_polls = extract_includes("polls")
-        includes_places = extract_includes("places")
-        # Errors are returned but unused here
-        includes_errors = extract_includes("errors")
-
-        def expand_payload(payload):
-            """
-            Recursively step through an object and sub objects and append extra data. 
-            """
-
-            # Don't try to expand on primitive values, return strings as is:
-            if isinstance(payload, (str, bool, int, float)):
-                return payload
-            # expand list items individually:
-            elif isinstance(payload, list):
-                payload = [expand_payload(item) for item in payload]
-                return payload
-            # Try to expand on dicts within dicts:
-            elif isinstance(payload, dict):
-                for key, value in payload.items():
-                    payload[key] = expand_payload(value)
-
-            if "author_id" in payload:
-                payload["author"] = includes_users[payload["author_id"]]
-
-            if "in_reply_to_user_id" in payload:
-                payload["in_reply_to_user"] = includes_users[payload["in_reply_to_user_id"]]
-
-            if "media_keys" in payload:
-                payload["media"] = list(includes_media[media_key] for media_key in payload["media_keys"])
-
-            if "poll_ids" in payload:
-                poll_id = payload["poll_ids"][-1] # always 1, only 1 poll per tweet.
-                payload["poll"] = includes_polls[poll_id]
-
-            if "geo" in payload:
-                place_id = payload["geo"]['place_id']
-                payload["geo"] = merge_dicts(payload["geo"], includes_places[place_id])
-
-            if "mentions" in payload:
-                payload["mentions"] = list(merge_dicts(referenced_user, includes_users[referenced_user['username']]) for referenced_user in payload["mentions"])
-
-            if "referenced_tweets" in payload:
-                payload["referenced_tweets"] = list(merge_dicts(referenced_tweet, includes_tweets[referenced_tweet['id']]) for referenced_tweet in payload["referenced_tweets"])
+        self.deadline = deadline
+        self.time_budget = time_budget
+        self.reserve_seconds = reserve_seconds or 0
+        # Slowest request seen so far, used to judge whether another one fits.
+        self.max_request_seconds = 0
+        self.partial = False
+        self.n_retries = 0
+        self.n_bytes = 0
+        self.n_cache_hits = 0
+        self.request_seconds = 0.0
+        # Counts requests: buckets returned, and the Tweets in them, so far ('r' output format).
+        self.n_buckets = 0
+        self.total_tweet_count = 0
+
+        self.early_stop = early_stop
+        self.stopped_early = False
+
+        self.workers = workers or None
+        self.worker_func = worker_func
+        self.cache = PageCache(cache) if isinstance(cache, str) else cache
+        self.cache_max_age = cache_max_age
+        self.current_content = None
+        if self.workers and output_format not in ("a", "c", "r"):
+            raise ValueError("workers support the 'a', 'c' and 'r' output formats")
+        if self.workers and early_stop is not None:
+            raise ValueError("early_stop needs each page's Tweets before the next request; it can't be used with workers")
 
-            if "pinned_tweet_id" in payload:
-                payload["pinned_tweet"] = includes_tweets[payload["pinned_tweet_id"]]
-
-            return payload
+    def formatted_output(self):
 
-        #TODO: Tweets or Counts?
-        # First, expand the included tweets, before processing actual result tweets:
-        if self.search_type == 'tweets':
-            for included_id, included_tweet in extract_includes("tweets").items():
-                includes_tweets[included_id] = expand_payload(included_tweet)
+        expand_payload = make_expander(self.includes, self.search_type)
 
         def output_response_format():
             """ 
             output the response as 1 "page" per line
             """
-            #TODO: counts details
             if self.search_type == 'tweets':
                 if self.total_results >= self.max_tweets:
                     return
             yield self.current_response
 
-            #With counts, there is nothing to count here... we aren't counting Tweets (but should count requests)
+            #With counts, there are no Tweets to count against max_tweets; the counts are totalled instead.
             if self.search_type == 'tweets':
                 self.total_results += self.meta['result_count']
+            else:
+                self.add_count_totals(self.current_response)
 
         def output_atomic_format():
             """
@@ -331,9 +480,21 @@ class ResultStream:
             if self.meta != None:
                 yield self.meta
 
+        def output_columnar_format():
+            """
+            One columnar TweetBatch per page, built from the raw page.
+            """
+            remaining = self.max_tweets - self.total_results
+            if remaining <= 0 or not self.current_tweets:
+                return
+            batch = TweetBatch.from_tweets(self.current_tweets[:remaining])
+            self.total_results += len(batch)
+            yield batch
+
         response_format = {"r": output_response_format,
                            "a": output_atomic_format,
-                           "m": output_message_stream_format}
+                           "m": output_message_stream_format,
+                           "c": output_columnar_format}
 
         return response_format.get(self.output_format)()
 
@@ -349,9 +510,16 @@ class ResultStream:
             >>> # or for faster usage...
             >>> results = list(ResultStream(**kwargs).stream())
         """
+        if self.time_budget is not None and self.deadline is None:
+            self.deadline = time.time() + self.time_budget
+
+        if self.workers:
+            yield from self.stream_with_workers()
+            return
+
         self.init_session()
         #self.check_counts() #TODO: not needed if no Tweet Parser being used.
-        self.execute_request()
+        self.request_page()
         self.stream_started = True
 
         while True:
@@ -360,6 +528,16 @@ class ResultStream:
                 break
             yield from self.formatted_output()
 
+            if self.early_stop is not None and self.early_stop(self.current_tweets) and self.next_token:
+                logger.info("early stop after {} requests".format(self.n_requests))
+                self.stopped_early = True
+                break
+
+            if self.next_token and not self.time_for_another_request():
+                logger.warning("stopping early to stay within the deadline; results are partial")
+                self.partial = True
+                break
+
             if self.next_token and self.total_results < self.max_tweets and self.n_requests <= self.max_requests:
                 self.request_parameters = merge_dicts(self.request_parameters,
                                                       {"next_token": self.next_token})
@@ -369,10 +547,11 @@ class ResultStream:
                 #If hitting the "all" search endpoint, wait one second since that endpoint is currently
                 #limited to one request per sleep.
                 #Revisit and make configurable when the requests-per-second gets revisited.
-                if "tweets/search/all" in self.endpoint:
+                if "tweets/search/all" in self.endpoint and not self.next_page_cached():
                     time.sleep(2)
 
-                self.execute_request()
+                if not self.request_page():
+                    break
 
             else:
                 break
@@ -382,6 +561,109 @@ class ResultStream:
         self.current_tweets = None
         self.session.close()
 
+    def stream_with_workers(self):
+        """
+        ``stream()`` with pages decoded in worker processes. Requests are still
+        made one at a time, in order; while the workers decode, the next page is
+        fetched. At most twice as many pages as workers are in flight.
+        """
+        from concurrent.futures import ProcessPoolExecutor  # Pulls in multiprocessing; only needed here.
+        self.init_session()
+        pool = ProcessPoolExecutor(self.workers)
+        in_flight = deque()
+        requested_results = 0
+        try:
+            while self.request_page() and self.current_content is not None:
+                self.stream_started = True
+                in_flight.append(pool.submit(decode_page, *self.current_content, output_format=self.output_format,
+                                             search_type=self.search_type, worker_func=self.worker_func))
+                requested_results += (self.meta or {}).get("result_count", 0)
+                while in_flight and (len(in_flight) > 2 * self.workers or in_flight[0].done()):
+                    yield from self.serve_decoded(in_flight.popleft().result())
+
+                if not self.next_token or requested_results >= self.max_tweets or self.n_requests > self.max_requests:
+                    break
+                if not self.time_for_another_request():
+                    logger.warning("stopping early to stay within the deadline; results are partial")
+                    self.partial = True
+                    break
+                self.request_parameters = merge_dicts(self.request_parameters, {"next_token": self.next_token})
+                if "tweets/search/all" in self.endpoint and not self.next_page_cached():
+                    time.sleep(2)
+
+            while in_flight:
+                yield from self.serve_decoded(in_flight.popleft().result())
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            self.current_content = None
+            self.session.close()
+        logger.info("ending stream at {} tweets".format(self.total_results))
+
+    def iter_batches(self, size=1000):
+        """
+        Streams the results as columnar ``TweetBatch``es of ``size`` Tweets
+        (the last one may be smaller), regardless of page boundaries.
+        Usage:
+            >>> for batch in ResultStream(**kwargs).iter_batches(5000):
+            ...     scores = scorer.score_batch(batch)
+        """
+        output_format = self.output_format
+        self.output_format = "c"
+        try:
+            pending = TweetBatch()
+            for batch in self.stream():
+                pending.append_batch(batch)
+                while len(pending) >= size:
+                    yield pending.slice(0, size)
+                    pending = pending.slice(size, len(pending))
+            if len(pending):
+                yield pending
+        finally:
+            self.output_format = output_format
+
+    def serve_decoded(self, decoded):
+        if self.output_format == "c":
+            remaining = self.max_tweets - self.total_results
+            if remaining > 0 and len(decoded):
+                batch = decoded if len(decoded) <= remaining else decoded.slice(0, remaining)
+                self.total_results += len(batch)
+                yield batch
+            return
+        if self.output_format == "r":
+            if self.search_type == "tweets" and "data" not in decoded:
+                # A page with no Tweets (result_count 0); the serial stream doesn't yield these either.
+                return
+            if self.total_results < self.max_tweets or self.search_type != "tweets":
+                yield decoded
+                if self.search_type == "tweets":
+                    self.total_results += decoded.get("meta", {}).get("result_count", 0)
+                else:
+                    self.add_count_totals(decoded)
+            return
+        for tweet in decoded:
+            if self.total_results >= self.max_tweets:
+                return
+            yield tweet
+            self.total_results += 1
+
+    def add_count_totals(self, page):
+        """
+        Adds a counts response page to ``total_tweet_count`` and
+        ``n_buckets``.
+        """
+        self.n_buckets += len(page.get("data") or ())
+        self.total_tweet_count += (page.get("meta") or {}).get("total_tweet_count", 0)
+
+    def use_cache(self):
+        """
+        Whether the current request's page can come from, and go to, the
+        cache.
+        """
+        return self.cache is not None and self.cache.cacheable(self.request_parameters)
+
+    def next_page_cached(self):
+        return self.use_cache() and self.cache.contains(self.endpoint, self.request_parameters, self.cache_max_age)
+
     def init_session(self):
         """
         Defines a session object for passing requests.
@@ -402,23 +684,65 @@ class ResultStream:
             self._tweet_func = lambda x: x
 
 
+    def time_for_another_request(self):
+        """
+        Whether the time left before the deadline covers another request
+        (judged by the slowest one so far) plus ``reserve_seconds``.
+        """
+        if self.deadline is None:
+            return True
+        needed = self.max_request_seconds + self.reserve_seconds
+        if "tweets/search/all" in self.endpoint:
+            needed += 2
+        return time.time() + needed < self.deadline
+
+    def request_page(self):
+        """
+        Executes the next request. If the deadline cuts it short, flags the
+        stream as partial instead of raising. Returns True if a page was read.
+        """
+        try:
+            self.execute_request()
+        except (DeadlineExceeded, requests.exceptions.Timeout):
+            if self.deadline is None:
+                raise
+            logger.warning("request abandoned at the deadline; results are partial")
+            self.partial = True
+            self.current_tweets = None
+            return False
+        return True
+
     def execute_request(self):
         """
         Sends the request to the API and parses the json response.
         Makes some assumptions about the session length and sets the presence
         of a "next" token.
         """
-        if self.n_requests % 20 == 0 and self.n_requests > 1:
-            logger.info("refreshing session")
-            self.init_session()
+        use_cache = self.use_cache()
+        content = (self.cache.get(self.endpoint, self.request_parameters, self.cache_max_age)
+                   if use_cache else None)
+        if content is not None:
+            self.n_cache_hits += 1
+            encoding = "utf-8"
+        else:
+            content, encoding = self.fetch_page()
+            if use_cache and scan_meta(content) is not None:
+                self.cache.put(self.endpoint, self.request_parameters, content)
+
+        if self.workers:
+            # The body is decoded by a worker; here, only the meta object is read, for paging.
+            self.current_content = None
+            meta = scan_meta(content)
+            if meta is None:
+                logger.error("no meta object in the response; ending the stream")
+                return
+            self.current_content = (content, encoding)
+            self.meta = meta
+            self.next_token = meta.get("next_token", None)
+            return
 
-        resp = request(session=self.session,
-                       url=self.endpoint,
-                       request_parameters=self.request_parameters)
-        self.n_requests += 1
-        ResultStream.session_request_counter += 1
         try:
-            resp = json.loads(resp.content.decode(resp.encoding))
+            resp = json.loads(content.decode(encoding))
 
             self.current_response = resp
             self.current_tweets = resp.get("data", None)
@@ -429,6 +753,36 @@ class ResultStream:
         except:
             print("Error parsing content as JSON.")
 
+    def fetch_page(self):
+        """
+        Requests the current page from the API. Returns the response body and
+        its encoding.
+        """
+        if self.n_requests % 20 == 0 and self.n_requests > 1:
+            logger.info("refreshing session")
+            self.init_session()
+
+        deadline_kwargs = {}
+        if self.deadline is not None:
+            # Leave the reserve untouched, and don't let a slow response hang past it.
+            request_deadline = self.deadline - self.reserve_seconds
+            deadline_kwargs = {"deadline": request_deadline,
+                               "timeout": max(request_deadline - time.time(), 1)}
+
+        resp = request(session=self.session,
+                       url=self.endpoint,
+                       request_parameters=self.request_parameters,
+                       **deadline_kwargs)
+        self.max_request_seconds = max(self.max_request_seconds,
+                                       resp.elapsed.total_seconds())
+        self.request_seconds += resp.elapsed.total_seconds()
+        self.n_retries += getattr(resp, "n_retries", 0)
+        self.n_bytes += len(resp.content)
+        self.n_requests += 1
+        with ResultStream._counter_lock:
+            ResultStream.session_request_counter += 1
+        return resp.content, resp.encoding
+
     def __repr__(self):
         repr_keys = ["endpoint", "request_parameters", "max_tweets"]
         str_ = json.dumps(dict([(k, self.__dict__.get(k)) for k in repr_keys]),
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 Twitter, Inc.
+# Licensed under the MIT License
+# https://opensource.org/licenses/MIT
+"""
+Configurable Tweet scoring. A weighted formula such as
+``likes*1 + retweets*3 + quotes*2`` is checked and compiled once, into a
+per-Tweet function as fast as a hand-written sum, and into a function over
+whole metric columns (vectorized with numpy when it is installed).
+
+Formula variables:
+
+    likes, retweets, replies, quotes   Tweet public metrics
+    followers                          author's follower count (needs the
+                                       author_id expansion, 'a' output format,
+                                       and user.fields=public_metrics)
+    age_hours                          hours since created_at (needs
+                                       tweet.fields=created_at)
+
+and functions ``log1p``, ``sqrt``, ``min`` and ``max``. Division by zero
+gives 0, per Tweet and over columns alike.
+"""
+
+import ast
+import math
+import time
+import calendar
+import logging
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__all__ = ["Scorer", "compile_formula", "DEFAULT_FORMULA"]
+
+logger = logging.getLogger(__name__)
+
+# The total of public metrics, as ranked by top_tweets.py.
+DEFAULT_FORMULA = "likes + retweets + replies + quotes"
+
+_METRICS = {"likes": "like_count",
+            "retweets": "retweet_count",
+            "replies": "reply_count",
+            "quotes": "quote_count"}
+
+_VARIABLES = set(_METRICS) | {"followers", "age_hours"}
+
+_FUNCTIONS = {"log1p", "sqrt", "min", "max"}
+
+_ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Name,
+                  ast.Load, ast.Call, ast.Add, ast.Sub, ast.Mult, ast.Div,
+                  ast.Pow, ast.USub, ast.UAdd)
+
+
+class _SafeDivision(ast.NodeTransformer):
+    """Rewrites ``a / b`` as ``_div(a, b)``, so both compiled paths agree on x/0."""
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if not isinstance(node.op, ast.Div):
+            return node
+        return ast.copy_location(ast.Call(func=ast.Name(id="_div", ctx=ast.Load()),
+                                          args=[node.left, node.right], keywords=[]), node)
+
+
+def _divide(a, b):
+    return a / b if b else 0
+
+
+def _divide_arrays(a, b):
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+    return np.divide(a, b, out=np.zeros(a.shape), where=b != 0)
+
+
+def _created_at_seconds(created_at):
+    return calendar.timegm(time.strptime(created_at[:19], "%Y-%m-%dT%H:%M:%S"))
+
+
+class Scorer:
+    """
+    A compiled scoring formula. Use ``compile_formula`` to build one.
+
+    Args:
+        formula (str): e.g. ``"likes*1 + retweets*3 + quotes*2"``.
+        now (float): reference time (epoch seconds) for ``age_hours``;
+            defaults to when the scorer is built.
+
+    Attributes:
+        variables (list): the formula variables, in order of appearance.
+        score_tweet (function): the compiled per-Tweet function. Calling the
+            scorer does the same, but pass this one as a ``score_func`` in
+            hot loops: it skips a method call per Tweet.
+
+    Example:
+        >>> scorer = compile_formula("likes + retweets*3")
+        >>> scorer(tweet)
+        42
+        >>> scorer.score_columns({"likes": [1, 2], "retweets": [0, 1]})
+        [1, 5]
+    """
+
+    def __init__(self, formula, now=None):
+        self.formula = formula
+        self.now = time.time() if now is None else now
+
+        tree = ast.parse(formula.strip(), mode="eval")
+        variables = []
+        for node in ast.walk(tree):
+            if not isinstance(node, _ALLOWED_NODES):
+                raise ValueError("unsupported syntax in score formula: {}".format(formula))
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or node.func.id not in _FUNCTIONS or node.keywords:
+                    raise ValueError("unsupported function in score formula: {}".format(formula))
+            elif isinstance(node, ast.Name) and node.id not in _FUNCTIONS:
+                if node.id not in _VARIABLES:
+                    raise ValueError("unknown variable '{}' in score formula; use one of {}"
+                                     .format(node.id, ", ".join(sorted(_VARIABLES))))
+                if node.id not in variables:
+                    variables.append(node.id)
+            elif isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+                raise ValueError("unsupported constant in score formula: {}".format(formula))
+        self.variables = variables
+        self.expression = ast.unparse(ast.fix_missing_locations(_SafeDivision().visit(tree)))
+        self._code = compile(self.expression, "<score formula>", "eval")
+
+        self.score_tweet = self._compile_tweet_function()
+        self._score_lists = self._compile_column_function()
+
+    def _compile_tweet_function(self):
+        lines = ["def score(tweet):",
+                 "    metrics = tweet.get('public_metrics', {})"]
+        for variable in self.variables:
+            if variable in _METRICS:
+                lines.append("    {} = metrics.get({!r}, 0)".format(variable, _METRICS[variable]))
+            elif variable == "followers":
+                lines.append("    followers = (tweet.get('author') or {}).get('public_metrics', {}).get('followers_count', 0)")
+            elif variable == "age_hours":
+                lines.append("    age_hours = (now - _created_at_seconds(tweet['created_at'])) / 3600")
+        lines.append("    return " + self.expression)
+        namespace = self._namespace(math)
+        exec(compile("\n".join(lines), "<score formula>", "exec"), namespace)
+        return namespace["score"]
+
+    def _compile_column_function(self):
+        args = ", ".join(self.variables)
+        if not self.variables:
+            source = "lambda: {}".format(self.expression)
+        elif len(self.variables) == 1:
+            source = "lambda {0}: [{1} for {0} in {0}]".format(args, self.expression)
+        else:
+            source = "lambda {0}: [{1} for {0} in zip({0})]".format(args, self.expression)
+        return eval(compile(source, "<score formula>", "eval"), self._namespace(math))
+
+    def _namespace(self, functions):
+        namespace = {"__builtins__": {}, "now": self.now, "_created_at_seconds": _created_at_seconds,
+                     "min": min, "max": max, "zip": zip, "_div": _divide}
+        namespace.update({name: getattr(functions, name) for name in ("log1p", "sqrt")})
+        if functions is not math:
+            namespace.update({"min": np.minimum, "max": np.maximum, "_div": _divide_arrays})
+        return namespace
+
+    def __call__(self, tweet):
+        """Scores one Tweet."""
+        return self.score_tweet(tweet)
+
+    def columns(self, tweets):
+        """
+        Pulls the formula's variables out of a list of Tweets as columns:
+        numpy arrays if numpy is installed, lists otherwise.
+        """
+        columns = {}
+        for variable in self.variables:
+            if variable in _METRICS:
+                name = _METRICS[variable]
+                values = [tweet.get("public_metrics", {}).get(name, 0) for tweet in tweets]
+            elif variable == "followers":
+                values = [(tweet.get("author") or {}).get("public_metrics", {}).get("followers_count", 0)
+                          for tweet in tweets]
+            else:
+                values = [(self.now - _created_at_seconds(tweet["created_at"])) / 3600 for tweet in tweets]
+            columns[variable] = np.asarray(values) if np is not None else values
+        return columns
+
+    def score_columns(self, columns):
+        """
+        Scores whole metric columns at once, e.g. ``{"likes": [...], "retweets": [...]}``.
+        Numpy arrays are scored with array operations; anything else with a
+        compiled list comprehension.
+        """
+        values = [columns[variable] for variable in self.variables]
+        if np is not None and any(isinstance(v, np.ndarray) for v in values):
+            namespace = self._namespace(np)
+            namespace.update(zip(self.variables, values))
+            return eval(self._code, namespace)
+        if not self.variables:
+            return self._score_lists()
+        return self._score_lists(*values)
+
+    def score_batch(self, batch):
+        """
+        Scores a columnar ``TweetBatch`` straight from its columns, with no
+        per-Tweet objects; ``age_hours`` comes from its creation times. Not
+        for formulas using ``followers``, which batches don't carry.
+        """
+        if "followers" in self.variables:
+            raise ValueError("Tweet batches have no follower counts; score with score_tweets instead")
+        if not self.variables:
+            return [self.score_tweet({})] * len(batch)
+        columns = {}
+        for variable in self.variables:
+            if variable == "age_hours":
+                created_at = batch.column("created_at")
+                columns[variable] = ((self.now - created_at / 1000) / 3600 if np is not None
+                                     else [(self.now - ms / 1000) / 3600 for ms in created_at])
+            else:
+                columns[variable] = batch.column(variable)
+        return self.score_columns(columns)
+
+    def score_tweets(self, tweets):
+        """Scores a list of Tweets, column-wise. Returns a list."""
+        if not self.variables:
+            return [self.score_tweet({})] * len(tweets)
+        scores = self.score_columns(self.columns(tweets))
+        return scores.tolist() if np is not None and isinstance(scores, np.ndarray) else scores
+
+    def __repr__(self):
+        return "Scorer({!r})".format(self.formula)
+
+
+def compile_formula(formula=DEFAULT_FORMULA, now=None):
+    """
+    Checks and compiles a scoring formula.
+
+    Args:
+        formula (str): e.g. ``"likes*1 + retweets*3 + quotes*2"``; defaults
+            to the total of public metrics.
+        now (float): reference time for ``age_hours``; defaults to now.
+
+    Returns:
+        Scorer
+
+    Raises:
+        ValueError: for unknown variables or functions, or anything in the
+        formula other than arithmetic.
+    """
+    return Scorer(formula, now=now)
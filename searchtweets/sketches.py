@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 Twitter, Inc.
+# Licensed under the MIT License
+# https://opensource.org/licenses/MIT
+"""
+Heavy-hitter sketches, for counting hashtags, URLs and mentions over
+backfills too big to count exactly. Memory is fixed by the error bounds
+asked for, not by the number of distinct entities.
+
+``SpaceSaving`` tracks the ``1 / epsilon`` most frequent keys, with counts
+overestimated by at most ``epsilon * n``. ``CountMinSketch`` estimates the
+count of any key, also overestimating by at most ``epsilon * n``, with
+probability ``1 - delta``. ``HeavyHitters`` uses the first to pick candidates
+and the second to estimate their Tweet counts and engagement.
+
+All three are mergeable: sketches built over separate shards (with the same
+parameters) can be merged into one, and they pickle, so shards may run in
+other processes.
+"""
+
+import math
+import heapq
+import hashlib
+import logging
+from array import array
+
+from .dedup import _mix64, _MASK64
+
+__all__ = ["SpaceSaving", "CountMinSketch", "HeavyHitters"]
+
+logger = logging.getLogger(__name__)
+
+
+def _hash64(key):
+    # Stable across processes, unlike hash(), so sketches built apart can be merged.
+    return int.from_bytes(hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class SpaceSaving:
+    """
+    Space-Saving summary of the most frequent keys of a stream (Metwally et
+    al.). Keeps ``capacity`` counters; a new key takes over the smallest, and
+    inherits its count as the bound on its own error.
+
+    Args:
+        capacity (int): counters kept. Defaults to ``ceil(1 / epsilon)``.
+        epsilon (float): the most any count is overestimated by, as a
+            fraction of the stream's total weight. Any key with more than
+            that share is guaranteed to be kept.
+
+    Example:
+        >>> summary = SpaceSaving(epsilon=0.001)
+        >>> for tag in hashtags:
+        ...     summary.add(tag)
+        >>> summary.top(3)
+        [('snow', 4123, 0), ('ski', 977, 12), ('avalanche', 310, 40)]
+    """
+
+    def __init__(self, capacity=None, epsilon=0.001):
+        self.capacity = int(capacity) if capacity else math.ceil(1 / epsilon)
+        self.n = 0
+        self._counts = {}
+        self._errors = {}
+        self._heap = []  # (count, key), lazily: entries whose count is stale are skipped
+
+    def add(self, key, weight=1):
+        """
+        Counts ``weight`` (positive) occurrences of ``key``.
+        """
+        if weight <= 0:
+            return
+        self.n += weight
+        counts = self._counts
+        if key in counts:
+            counts[key] += weight
+        elif len(counts) < self.capacity:
+            counts[key] = weight
+            self._errors[key] = 0
+        else:
+            minimum, evicted = self._pop_min()
+            del counts[evicted], self._errors[evicted]
+            counts[key] = minimum + weight
+            self._errors[key] = minimum
+        heapq.heappush(self._heap, (counts[key], key))
+        if len(self._heap) > 4 * self.capacity + 64:
+            self._compact()
+
+    def _pop_min(self):
+        while True:
+            count, key = heapq.heappop(self._heap)
+            if self._counts.get(key) == count:
+                return count, key
+
+    def _min_count(self):
+        # What a key not kept may have been counted, at most: the smallest counter, once all are in use.
+        if len(self._counts) < self.capacity:
+            return 0
+        while self._counts.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0]
+
+    def _compact(self):
+        self._heap = [(count, key) for key, count in self._counts.items()]
+        heapq.heapify(self._heap)
+
+    def count(self, key):
+        """
+        Upper bound on the count of ``key``.
+        """
+        return self._counts.get(key, self._min_count())
+
+    def top(self, k):
+        """
+        The ``k`` keys with the highest counts, as ``(key, count, error)``,
+        highest first. The true count is between ``count - error`` and
+        ``count``.
+        """
+        return [(key, self._counts[key], self._errors[key])
+                for key in heapq.nlargest(k, self._counts, key=self._counts.get)]
+
+    def heavy_hitters(self, phi):
+        """
+        Every key that may have more than ``phi`` of the total weight, as
+        ``(key, count, error)``; none with more is missed.
+        """
+        threshold = phi * self.n
+        return [entry for entry in self.top(len(self._counts)) if entry[1] > threshold]
+
+    def merge(self, other):
+        """
+        Folds in a summary of another shard of the stream (Agarwal et al.'s
+        mergeable summaries); error bounds add. Returns self.
+        """
+        own_min, other_min = self._min_count(), other._min_count()
+        merged = {}
+        for key in set(self._counts) | set(other._counts):
+            merged[key] = (self._counts.get(key, own_min) + other._counts.get(key, other_min),
+                           self._errors.get(key, own_min) + other._errors.get(key, other_min))
+        kept = heapq.nlargest(self.capacity, merged, key=lambda key: merged[key][0])
+        self._counts = {key: merged[key][0] for key in kept}
+        self._errors = {key: merged[key][1] for key in kept}
+        self.n += other.n
+        self._compact()
+        return self
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __contains__(self, key):
+        return key in self._counts
+
+
+class CountMinSketch:
+    """
+    Count-Min sketch (Cormode and Muthukrishnan): estimated counts of any
+    key, in ``depth`` rows of ``width`` counters. An estimate is never low,
+    and is within ``epsilon * n`` of the true count with probability
+    ``1 - delta``.
+
+    Args:
+        epsilon (float): error bound, as a fraction of the total weight;
+            sets ``width = ceil(e / epsilon)``.
+        delta (float): probability of exceeding it; sets
+            ``depth = ceil(ln(1 / delta))``.
+        integer (bool): keep integer counts; otherwise float weights (e.g.
+            engagement totals).
+        seed (int): hash seed. Only sketches with the same seed, epsilon and
+            delta can be merged.
+
+    Example:
+        >>> sketch = CountMinSketch(epsilon=0.0005, delta=0.01)
+        >>> sketch.add("snow")
+        >>> sketch.estimate("snow")
+        1
+    """
+
+    def __init__(self, epsilon=0.001, delta=0.01, integer=True, seed=0):
+        self.epsilon = epsilon
+        self.delta = delta
+        self.seed = seed
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.n = 0
+        self._table = array("q" if integer else "d", bytes(8 * self.width * self.depth))
+
+    def _cells(self, key):
+        # One cell per row, by double hashing one 64-bit hash of the key.
+        h1 = _mix64(_hash64(key) ^ self.seed)
+        h2 = _mix64(h1) | 1
+        width = self.width
+        return [row * width + ((h1 + row * h2) & _MASK64) % width for row in range(self.depth)]
+
+    def add(self, key, weight=1):
+        """
+        Counts ``weight`` (non-negative) occurrences of ``key``. Returns the
+        new estimate.
+        """
+        self.n += weight
+        table = self._table
+        estimate = None
+        for cell in self._cells(key):
+            table[cell] += weight
+            if estimate is None or table[cell] < estimate:
+                estimate = table[cell]
+        return estimate
+
+    def estimate(self, key):
+        table = self._table
+        return min(table[cell] for cell in self._cells(key))
+
+    def merge(self, other):
+        """
+        Adds in a sketch of another shard of the stream. Returns self.
+        """
+        if (other.width, other.depth, other.seed, other._table.typecode) != \
+                (self.width, self.depth, self.seed, self._table.typecode):
+            raise ValueError("only Count-Min sketches with the same epsilon, delta, seed and type merge")
+        table = self._table
+        for cell, value in enumerate(other._table):
+            if value:
+                table[cell] += value
+        self.n += other.n
+        return self
+
+    def memory_bytes(self):
+        return self._table.itemsize * len(self._table)
+
+
+class HeavyHitters:
+    """
+    Top keys of an unbounded stream, in fixed memory, with both a Tweet count
+    and an engagement total per key, as ``KeyedCounter`` has exactly:
+    Space-Saving keeps candidates by the measure ranked by, and Count-Min
+    sketches estimate both measures for them.
+
+    Args:
+        epsilon (float): error bound of counts and engagement totals, as a
+            fraction of the stream's totals.
+        delta (float): probability of a Count-Min estimate exceeding it.
+        by (str): what the candidates are picked by: Tweet ``count`` or total
+            ``engagement``.
+        seed (int): hash seed; shards to be merged need the same one.
+
+    Example:
+        >>> hashtags = HeavyHitters(epsilon=0.0001)
+        >>> hashtags.add("snow", engagement=12)
+        >>> hashtags.top(10)
+        [('snow', 1, 12.0)]
+    """
+
+    def __init__(self, epsilon=0.001, delta=0.01, by="count", seed=0):
+        if by not in ("count", "engagement"):
+            raise ValueError("rank by 'count' or 'engagement', not '{}'".format(by))
+        self.by = by
+        self.candidates = SpaceSaving(epsilon=epsilon)
+        self.counts = CountMinSketch(epsilon, delta, integer=True, seed=seed)
+        self.engagement = CountMinSketch(epsilon, delta, integer=False, seed=seed)
+
+    def add(self, key, engagement=0):
+        self.candidates.add(key, 1 if self.by == "count" else engagement)
+        self.counts.add(key)
+        if engagement:
+            self.engagement.add(key, engagement)
+
+    def top(self, k, by=None):
+        """
+        The ``k`` top keys, as ``(key, estimated count, estimated
+        engagement)``, highest first. Only ``by`` the measure candidates were
+        picked by is reliable.
+        """
+        by = by or self.by
+        # Each estimate is an upper bound, so the tighter of the two stands.
+        candidates = self.candidates.top(len(self.candidates))
+        if self.by == "count":
+            entries = [(key, min(count, self.counts.estimate(key)), self.engagement.estimate(key))
+                       for key, count, _ in candidates]
+        else:
+            entries = [(key, self.counts.estimate(key), min(weight, self.engagement.estimate(key)))
+                       for key, weight, _ in candidates]
+        measure = 1 if by == "count" else 2
+        return heapq.nlargest(k, entries, key=lambda entry: (entry[measure], entry[3 - measure]))
+
+    def merge(self, other):
+        """
+        Folds in the heavy hitters of another shard. Returns self.
+        """
+        if other.by != self.by:
+            raise ValueError("only heavy hitters ranked by the same measure merge")
+        self.candidates.merge(other.candidates)
+        self.counts.merge(other.counts)
+        self.engagement.merge(other.engagement)
+        return self
+
+    def memory_bytes(self):
+        return self.counts.memory_bytes() + self.engagement.memory_bytes()
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def __contains__(self, key):
+        return key in self.candidates
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 Twitter, Inc.
+# Licensed under the MIT License
+# https://opensource.org/licenses/MIT
+"""
+Append-only, memory-mapped store of per-Tweet metric snapshots, for
+engagement velocity ("fastest rising") and acceleration between collection
+cycles.
+
+Each snapshot is a fixed-width record of int64s::
+
+    tweet_id, captured_at, previous, likes, retweets, replies, quotes
+
+where ``previous`` is the record number of the same Tweet's prior snapshot
+(-1 for its first), so every Tweet's history is a chain back through the
+file. An in-memory Tweet ID -> latest record index is rebuilt from the file
+on open. Deltas over the last N cycles are gathered column-wise: with numpy
+arrays when numpy is installed, with lists otherwise.
+"""
+
+import os
+import mmap
+import time
+import bisect
+import logging
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__all__ = ["MetricSnapshotStore", "SNAPSHOT_METRICS"]
+
+logger = logging.getLogger(__name__)
+
+RECORD_FIELDS = ("tweet_id", "captured_at", "previous", "likes", "retweets", "replies", "quotes")
+RECORD_WIDTH = len(RECORD_FIELDS)
+RECORD_SIZE = 8 * RECORD_WIDTH
+_FIELD = {name: i for i, name in enumerate(RECORD_FIELDS)}
+
+SNAPSHOT_METRICS = ("likes", "retweets", "replies", "quotes")
+
+_PUBLIC_METRICS = {"likes": "like_count",
+                   "retweets": "retweet_count",
+                   "replies": "reply_count",
+                   "quotes": "quote_count"}
+
+
+def _snapshot_metrics(tweet):
+    # Takes Tweets with public_metrics, or the {id, likes, retweets, ...} rows top_tweets.py ranks.
+    if "public_metrics" in tweet:
+        metrics = tweet["public_metrics"]
+        return tuple(metrics.get(_PUBLIC_METRICS[name], 0) for name in SNAPSHOT_METRICS)
+    return tuple(tweet.get(name, 0) for name in SNAPSHOT_METRICS)
+
+
+class MetricSnapshotStore:
+    """
+    Metric snapshots of tracked Tweets, one record per Tweet per cycle.
+
+    Args:
+        path (str): the snapshot file; created if missing. Records are in
+            native (on every supported platform, little-endian) byte order.
+
+    Example:
+        >>> store = MetricSnapshotStore("snapshots.bin")
+        >>> store.append(tweets)          # once per collection cycle
+        >>> store.rising(10, cycles=2)    # fastest-rising by total engagement
+        [(412.5, 1484265578202382336, {'likes': 900, ...}), ...]
+    """
+
+    def __init__(self, path):
+        self.path = path
+        open(path, "ab").close()
+        size = os.path.getsize(path)
+        if size % RECORD_SIZE:
+            # A write cut short: drop the partial record.
+            logger.warning("dropping a partial record at the end of {}".format(path))
+            with open(path, "r+b") as f:
+                f.truncate(size - size % RECORD_SIZE)
+        self._file = open(path, "ab")
+        self._mmap = None
+        self._values = None
+        self._remap()
+        ids = self._column("tweet_id")
+        # Later records overwrite earlier ones: each ID maps to its latest snapshot.
+        self._index = dict(zip(ids.tolist(), range(len(self))))
+
+    def _remap(self):
+        self._release()
+        if os.path.getsize(self.path) == 0:
+            self._values = array("q")
+            return
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._values = (np.frombuffer(self._mmap, dtype=np.int64) if np is not None
+                        else memoryview(self._mmap).cast("q"))
+
+    def _release(self):
+        if isinstance(self._values, memoryview):
+            self._values.release()
+        self._values = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # A numpy view is still alive somewhere; the map closes when it goes.
+                pass
+            self._mmap = None
+
+    def _column(self, name):
+        return self._values[_FIELD[name]::RECORD_WIDTH]
+
+    def __len__(self):
+        return len(self._values) // RECORD_WIDTH
+
+    @property
+    def n_tweets(self):
+        return len(self._index)
+
+    def append(self, tweets, captured_at=None):
+        """
+        Appends one snapshot per Tweet, as of ``captured_at`` (epoch seconds,
+        defaulting to now). Returns how many were appended.
+        """
+        captured_at = int(time.time() if captured_at is None else captured_at)
+        first = record = len(self)
+        values = array("q")
+        for tweet in tweets:
+            tweet_id = int(tweet["id"])
+            previous = self._index.get(tweet_id, -1)
+            # Records from `first` on are still pending in `values`, and all of this cycle.
+            if previous >= first or (previous >= 0 and self._values[previous * RECORD_WIDTH + 1] == captured_at):
+                continue  # Already snapshotted this cycle.
+            values.extend((tweet_id, captured_at, previous) + _snapshot_metrics(tweet))
+            self._index[tweet_id] = record
+            record += 1
+
+        self._file.write(values.tobytes())
+        self._file.flush()
+        self._remap()
+        return len(values) // RECORD_WIDTH
+
+    def history(self, tweet_id, n=None):
+        """
+        A Tweet's snapshots, newest first, as dicts of RECORD_FIELDS.
+        """
+        records = []
+        record = self._index.get(int(tweet_id), -1)
+        while record >= 0 and (n is None or len(records) < n):
+            start = record * RECORD_WIDTH
+            records.append(dict(zip(RECORD_FIELDS, self._values[start:start + RECORD_WIDTH].tolist())))
+            record = records[-1]["previous"]
+        return records
+
+    def _chain(self, depth):
+        # Record numbers of every tracked Tweet's latest snapshot and the `depth` before it (-1 past the start).
+        previous = self._column("previous")
+        if np is not None:
+            chain = [np.fromiter(self._index.values(), dtype=np.int64, count=len(self._index))]
+            for _ in range(depth):
+                last = chain[-1]
+                chain.append(np.where(last >= 0, previous[np.maximum(last, 0)], -1))
+        else:
+            chain = [list(self._index.values())]
+            for _ in range(depth):
+                chain.append([previous[record] if record >= 0 else -1 for record in chain[-1]])
+        return chain
+
+    def _take(self, name, records):
+        column = self._column(name)
+        if np is not None:
+            return column[np.maximum(records, 0)]
+        return [column[record] for record in records]
+
+    def _metric(self, metric, records):
+        if metric == "total":
+            columns = [self._take(name, records) for name in SNAPSHOT_METRICS]
+            if np is not None:
+                return sum(columns)
+            return [sum(values) for values in zip(*columns)]
+        if metric not in SNAPSHOT_METRICS:
+            raise ValueError("unknown metric '{}'; use total or one of {}".format(metric, ", ".join(SNAPSHOT_METRICS)))
+        return self._take(metric, records)
+
+    def rates(self, metric="total", cycles=1):
+        """
+        Engagement velocity (per hour, over the last ``cycles`` snapshot
+        intervals) and acceleration (per hour, per hour: the change from the
+        ``cycles`` intervals before) of every tracked Tweet.
+
+        Returns:
+            ``(tweet_ids, velocity, acceleration)``, as parallel arrays (or
+            lists). Velocity is NaN for Tweets with fewer than ``cycles``
+            intervals of history, acceleration for fewer than ``2 * cycles``.
+        """
+        chain = self._chain(2 * cycles)
+        now, mid, old = chain[0], chain[cycles], chain[2 * cycles]
+        values = [self._metric(metric, records) for records in (now, mid, old)]
+        times = [self._take("captured_at", records) for records in (now, mid, old)]
+        tweet_ids = self._take("tweet_id", now)
+
+        if np is not None:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                hours_recent = (times[0] - times[1]) / 3600
+                hours_before = (times[1] - times[2]) / 3600
+                velocity = np.where((mid >= 0) & (hours_recent > 0),
+                                    (values[0] - values[1]) / hours_recent, np.nan)
+                before = np.where((old >= 0) & (hours_before > 0),
+                                  (values[1] - values[2]) / hours_before, np.nan)
+                acceleration = (velocity - before) / ((hours_recent + hours_before) / 2)
+            return tweet_ids, velocity, acceleration
+
+        nan = float("nan")
+        velocity, acceleration = [], []
+        for i in range(len(tweet_ids)):
+            hours_recent = (times[0][i] - times[1][i]) / 3600
+            hours_before = (times[1][i] - times[2][i]) / 3600
+            recent = (values[0][i] - values[1][i]) / hours_recent if mid[i] >= 0 and hours_recent > 0 else nan
+            before = (values[1][i] - values[2][i]) / hours_before if old[i] >= 0 and hours_before > 0 else nan
+            velocity.append(recent)
+            acceleration.append((recent - before) / ((hours_recent + hours_before) / 2)
+                                if before == before and recent == recent else nan)
+        return tweet_ids, velocity, acceleration
+
+    def rising(self, k, metric="total", cycles=1, by="velocity"):
+        """
+        The ``k`` fastest-rising Tweets, by ``velocity`` or ``acceleration``.
+        Only Tweets snapshotted in the latest cycle count: a Tweet missing
+        from it (e.g. a cycle cut short) would otherwise rank on stale rates.
+
+        Returns:
+            list of ``(rate, tweet_id, latest metrics)``, fastest first.
+        """
+        if not len(self):
+            return []
+        tweet_ids, velocity, acceleration = self.rates(metric, cycles)
+        rates = velocity if by == "velocity" else acceleration
+        # The latest cycle's snapshots are the tail of the file sharing the last captured_at.
+        captured_at = self._column("captured_at").tolist()
+        latest_cycle = bisect.bisect_left(captured_at, captured_at[-1])
+        latest = self._chain(0)[0]
+        if np is not None:
+            candidates = np.flatnonzero(~np.isnan(rates) & (latest >= latest_cycle))
+            top = candidates[np.argsort(-rates[candidates], kind="stable")[:k]].tolist()
+            rates = rates.tolist()
+            tweet_ids = tweet_ids.tolist()
+        else:
+            top = sorted((i for i, rate in enumerate(rates) if rate == rate and latest[i] >= latest_cycle),
+                         key=lambda i: -rates[i])[:k]
+
+        rising = []
+        for i in top:
+            latest = self.history(tweet_ids[i], 1)[0]
+            rising.append((rates[i], tweet_ids[i], {name: latest[name] for name in SNAPSHOT_METRICS}))
+        return rising
+
+    def compact(self, max_age_hours, min_fraction=0.0):
+        """
+        Drops snapshots older than ``max_age_hours``, rewriting the file.
+        Snapshots are appended in time order, so what is kept is the tail
+        of the file. To avoid rewriting it every cycle, nothing is done until
+        at least ``min_fraction`` of the records can go. Returns how many
+        records were dropped.
+        """
+        cutoff = time.time() - max_age_hours * 3600
+        captured_at = self._column("captured_at").tolist()
+        first_kept = bisect.bisect_left(captured_at, cutoff)
+        if first_kept == 0 or first_kept < min_fraction * len(self):
+            return 0
+
+        kept = array("q")
+        kept.frombytes(self._mmap[first_kept * RECORD_SIZE:] if self._mmap is not None else b"")
+        previous = _FIELD["previous"]
+        kept[previous::RECORD_WIDTH] = array("q", (record - first_kept if record >= first_kept else -1
+                                                   for record in kept[previous::RECORD_WIDTH]))
+
+        self._file.close()
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(kept.tobytes())
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, "ab")
+        self._remap()
+        self._index = dict(zip(self._column("tweet_id").tolist(), range(len(self))))
+        logger.info("compacted {}: dropped {} snapshots".format(self.path, first_kept))
+        return first_kept
+
+    def close(self):
+        self._release()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
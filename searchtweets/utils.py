@@ -10,21 +10,23 @@ import itertools as it
 import os
 import types
 import codecs
+import hashlib
 import datetime
 import logging
-import configparser
-from configparser import MissingSectionHeaderError
 try:
     import ujson as json
 except ImportError:
     import json
-import yaml
 
 
 logger = logging.getLogger(__name__)
 
 __all__ = ["take", "partition", "merge_dicts", "write_result_stream",
-           "read_config"]
+           "read_config", "read_config_snapshot", "load_config_snapshot",
+           "save_config_snapshot", "config_file_stat"]
+
+# Bumped when what is snapshotted, or how, changes, so older snapshots are ignored.
+CONFIG_SNAPSHOT_VERSION = 2
 
 
 def take(n, iterable):
@@ -97,8 +99,25 @@ def write_ndjson(filename, data_iterable, append=False, **kwargs):
             yield item
 
 
+def write_columnar_stream(filename, data_iterable, metadata=None, text=True,
+                          **kwargs):
+    """
+    Generator that collects Tweets (or ``TweetBatch``es) into a columnar
+    archive file, written once the iterable is exhausted, and returns items
+    from the iterable.
+    """
+    from .archive import ArchiveWriter  # Only needed for columnar files.
+    logger.info("writing to file {}".format(filename))
+    writer = ArchiveWriter(filename, metadata=metadata, text=text)
+    for item in data_iterable:
+        writer.add(item)
+        yield item
+    writer.close()
+
+
 def write_result_stream(result_stream, filename_prefix=None,
-                        results_per_file=None, **kwargs):
+                        results_per_file=None, file_format="ndjson",
+                        **kwargs):
     """
     Wraps a ``ResultStream`` object to save it to a file. This function will still
     return all data from the result stream as a generator that wraps the
@@ -111,8 +130,22 @@ def write_result_stream(result_stream, filename_prefix=None,
         per file. Defaults to having no max, which means one file. Multiple
         files will be named by datetime, according to
         ``<prefix>_YYY-mm-ddTHH_MM_SS.json``.
+        file_format (str): "ndjson", or "columnar" for a compact columnar
+        archive (``<prefix>.col``) of Tweet IDs, creation times, authors,
+        public metrics and texts, read back with ``ColumnarArchive``. Any
+        ``metadata`` dict, and ``text=False`` to leave texts out, are passed
+        through.
 
     """
+    if file_format not in ("ndjson", "columnar"):
+        raise ValueError("file_format is 'ndjson' or 'columnar', not '{}'"
+                         .format(file_format))
+    if file_format == "columnar":
+        from .archive import ARCHIVE_SUFFIX
+        write, suffix = write_columnar_stream, ARCHIVE_SUFFIX
+    else:
+        write, suffix = write_ndjson, ".json"
+
     if isinstance(result_stream, types.GeneratorType):
         stream = result_stream
     else:
@@ -130,14 +163,14 @@ def write_result_stream(result_stream, filename_prefix=None,
             chunk = filter(lambda x: x is not None, chunk)
             curr_datetime = (datetime.datetime.utcnow()
                              .strftime(file_time_formatter))
-            _filename = "{}_{}.json".format(filename_prefix, curr_datetime)
-            yield from write_ndjson(_filename, chunk)
+            _filename = "{}_{}{}".format(filename_prefix, curr_datetime, suffix)
+            yield from write(_filename, chunk, **kwargs)
 
     else:
         curr_datetime = (datetime.datetime.utcnow()
                          .strftime(file_time_formatter))
-        _filename = "{}.json".format(filename_prefix)
-        yield from write_ndjson(_filename, stream)
+        _filename = "{}{}".format(filename_prefix, suffix)
+        yield from write(_filename, stream, **kwargs)
 
 
 def read_config(filename):
@@ -182,9 +215,9 @@ def read_config(filename):
         dict: parsed configuration dictionary.
     """
     file_type = "yaml" if filename.endswith(".yaml") else "config"
-    config = configparser.ConfigParser()
 
     if file_type == "yaml":
+        import yaml  # Imported here, so only runs with YAML config files pay for it.
         with open(os.path.expanduser(filename), encoding="utf-8") as f:
             config_dict = yaml.safe_load(f)
 
@@ -192,6 +225,8 @@ def read_config(filename):
                                     in config_dict.keys()])
 
     elif file_type == "config":
+        import configparser
+        config = configparser.ConfigParser()
         with open(filename) as f:
             config.read_file(f)
             config_dict = merge_dicts(*[dict(config[s]) for s
@@ -209,3 +244,123 @@ def read_config(filename):
     if config_dict.get("end_time") is not None:
         config_dict["end_time"] = str(config_dict["end_time"])
     return config_dict
+
+
+def config_file_stat(filename):
+    """
+    The absolute path, size and modification time of a config file, for
+    keying a snapshot of what was read from it.
+    """
+    path = os.path.abspath(os.path.expanduser(filename))
+    stat = os.stat(path)
+    return {"path": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _snapshot_path(name, snapshot_dir):
+    snapshot_dir = os.path.expanduser(snapshot_dir or os.getenv("SEARCHTWEETS_CACHE_DIR", "~/.cache/searchtweets"))
+    return os.path.join(snapshot_dir, "config-{}.json".format(
+        hashlib.blake2b(name.encode("utf-8"), digest_size=12).hexdigest()))
+
+
+def _snapshot_checksum(source, config):
+    canonical = json.dumps([source, config], sort_keys=True)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def load_config_snapshot(name, source, required_keys=(), snapshot_dir=None):
+    """
+    A configuration kept by ``save_config_snapshot`` under ``name``, if it
+    was taken from the same ``source``.
+
+    Args:
+        name (str): what the snapshot is of, e.g. a config file's path.
+        source (dict): everything the configuration was resolved from
+            (arguments, environment variables, ``config_file_stat``), as
+            JSON types.
+        required_keys (iterable): keys the configuration must have, set;
+            a snapshot without any of them is not used.
+        snapshot_dir (str): where snapshots are kept; defaults to
+            ``$SEARCHTWEETS_CACHE_DIR`` or ``~/.cache/searchtweets``.
+
+    Returns:
+        dict, or None if there is no usable snapshot: none was taken, it
+        was taken from another source (it is stale), it doesn't match its
+        checksum (edited by hand, or cut short), or it lacks a required key.
+    """
+    path = _snapshot_path(name, snapshot_dir)
+    try:
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        config = snapshot["config"]
+        if snapshot["source"] != dict(source, version=CONFIG_SNAPSHOT_VERSION) or not isinstance(config, dict):
+            return None
+        if snapshot["checksum"] != _snapshot_checksum(snapshot["source"], config):
+            logger.warning("config snapshot {} doesn't match its checksum; ignoring it".format(path))
+            return None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    missing = [key for key in required_keys if config.get(key) is None]
+    if missing:
+        logger.info("config snapshot {} lacks {}; ignoring it".format(path, ", ".join(missing)))
+        return None
+    return config
+
+
+def save_config_snapshot(name, source, config, snapshot_dir=None):
+    """
+    Keeps a configuration (a dict) for ``load_config_snapshot``. Only a
+    configuration that JSON gives back unchanged is kept: tuples, dates or
+    non-string keys would come back as something else, so such a config is
+    simply not snapshotted. Leave secrets out of it; the file is only
+    readable by its owner, but stays on disk.
+
+    Returns:
+        bool: whether the snapshot was written.
+    """
+    source = dict(source, version=CONFIG_SNAPSHOT_VERSION)
+    snapshot_path = _snapshot_path(name, snapshot_dir)
+    tmp_path = "{}.{}.tmp".format(snapshot_path, os.getpid())
+    try:
+        # Serialized first, so a config that can't be leaves no file behind.
+        contents = json.dumps({"source": source, "config": config,
+                               "checksum": _snapshot_checksum(source, config)})
+        if json.loads(contents)["config"] != config:
+            logger.info("not snapshotting config {}: it doesn't survive JSON unchanged".format(name))
+            return False
+        os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w", encoding="utf-8") as f:
+            f.write(contents)
+        os.replace(tmp_path, snapshot_path)
+    except (OSError, TypeError, ValueError, OverflowError) as exc:
+        # Not writable, or not serializable: just don't snapshot.
+        logger.info("not snapshotting config {}: {!r}".format(name, exc))
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def read_config_snapshot(filename, snapshot_dir=None):
+    """
+    ``read_config``, with the result kept as a JSON snapshot, so that later
+    runs skip parsing the file (and importing its parser) until it changes.
+    A snapshot is only used while the file's size and modification time
+    match those it was taken from.
+
+    Args:
+        filename (str): config file, as for ``read_config``.
+        snapshot_dir (str): where snapshots are kept; defaults to
+            ``$SEARCHTWEETS_CACHE_DIR`` or ``~/.cache/searchtweets``. If it
+            can't be written, the file is simply read every time.
+
+    Returns:
+        dict: parsed configuration dictionary.
+    """
+    source = config_file_stat(filename)
+    config_dict = load_config_snapshot(source["path"], source, snapshot_dir=snapshot_dir)
+    if config_dict is None:
+        config_dict = read_config(filename)
+        save_config_snapshot(source["path"], source, config_dict, snapshot_dir)
+    return config_dict
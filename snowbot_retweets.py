@@ -4,27 +4,42 @@
 #   * POST /2/tweets text, quote_tweet_id
 #
 # This script uses 'relevancy' sorting to efficiently surface higher-engaged Tweets.
-# The script requests 100 Tweets per response, and, given the sort order, it assumes
-# the most relevant Tweets is included with the first response. For that reason, this
-# script does not paginate through search responses.
+# The script requests 100 Tweets per response, and, given the sort order, by default it assumes
+# the most relevant Tweets is included with the first response. Setting 'max_pages' lets it
+# paginate, stopping early once pages stop producing a Tweet that beats the current best by
+# more than 'early_stop_margin' (a fraction, default 0.1).
 #
 # Since the underlying search 'revelant ranking' model is evolving and will always have an
 # element of 'secret sauce' to rank relevance, there is an additional layer of ranking
-# performed by this script. This script ranks the *first page* of search results (the only
-# one requested) by their number of Likes and Retweets (these public metrics are available
-# Tweet attributes.
+# performed by this script. This script ranks the pages of search results it requested
+# by their number of Likes and Retweets (these public metrics are available
+# Tweet attributes. A different formula can be set with 'score_formula', e.g. 'likes + retweets*3'.
 #
 # Note: This script was written to run on Heroku. Instead of passing in settings and options
 # via the command-line, these inputs are read from the local environment and no command-line
-# options are supported.
+# options are supported. Several queries can be run at once by setting 'queries' to a JSON list.
+#
+# Surfaced Tweets are recorded per query (see storage.py for the STORAGE_URL / DATABASE_* settings) and skipped on later runs, until they age out after 'history_ttl_hours' (default a week).
+#
+# All requests go through one SnowbotClient, which keeps a pooled session each for App and
+# user auth, and the quotes are queued and sent back to back once all searches are done.
+# A stats row per query (volume, requests, bytes, candidates, timings) is written to
+# top_tweet_stats at the end of each run, in one insert.
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests_oauthlib import OAuth1Session
 import os
 import json
+import time
 import datetime
+from collections import deque
 from dateutil.relativedelta import *
 
+from searchtweets import EarlyStop, compile_formula
+
+from storage import open_backend, HISTORY_TTL_HOURS
+
 # Retrieve authentication tokens.
 # Here, the Author consumer and user tokens needed to Retweet on behalf of the Author's account.
 bot_consumer_key = os.environ.get("SNOWBOT_CONSUMER_KEY")
@@ -45,115 +60,236 @@ def set_quote_text(query):
 
     return text
 
-def quote_tweet(tweet_id, query):
+# v2 endpoints used by the bot.
+SEARCH_URL = "https://api.twitter.com/2/tweets/search/recent"
+POST_TWEET_URL = "https://api.twitter.com/2/tweets"
+RETWEET_URL = "https://api.twitter.com/2/users/{}/retweets"
+
+# Connections kept open per session. Actions and searches run back to back, so a few is plenty.
+POOL_SIZE = 4
+# Outbound actions allowed per rate-limit window (POST /2/tweets: 200 per 15 minutes per user).
+ACTIONS_PER_WINDOW = 200
+ACTION_WINDOW_SECONDS = 15 * 60
+
+class SnowbotClient:
+    """
+    The bot's connection to the API: two long-lived, pooled sessions, so every search
+    and action reuses open connections instead of paying for a new TLS handshake.
+      * app_session: App-level Bearer Token, for search.
+      * user_session: OAuth 1.0a user context of the bot's account, for Tweets and Retweets.
+    """
+
+    def __init__(self, bearer_token, consumer_key, consumer_secret, access_token, access_secret, pool_size=POOL_SIZE):
+
+        self.app_session = requests.Session()
+        self.app_session.headers.update({"Authorization": f"Bearer {bearer_token}",
+                                         "User-Agent": "@SnowbotDev snowbot_retweets.py"})
+
+        self.user_session = OAuth1Session(
+            consumer_key,
+            client_secret=consumer_secret,
+            resource_owner_key=access_token,
+            resource_owner_secret=access_secret
+        )
+
+        for session in (self.app_session, self.user_session):
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+
+        # Telemetry of the last search_tweets call.
+        self.search_stats = {}
+
+    def search_tweets(self, query, start_time_hours_ago, max_pages=1, early_stop=None):
+        """
+        Pages through relevancy-sorted search results, up to max_pages, and returns the Tweets read.
+        early_stop is called with each page's Tweets, and paging ends once it returns True.
+        """
+        start_time = get_start_time(start_time_hours_ago)
+        query_params = {'query': query, 'sort_order': 'relevancy','start_time': start_time, 'tweet.fields': 'public_metrics', 'max_results': 100}
+
+        tweets = []
+        self.search_stats = {'pages_cycle': 0, 'requests_cycle': 0, 'bytes_cycle': 0}
+        for page in range(max_pages):
+            response = self.app_session.get(SEARCH_URL, params=query_params)
+            self.search_stats['requests_cycle'] += 1
+            self.search_stats['bytes_cycle'] += len(response.content)
+
+            if response.status_code != 200:
+                print(f"Response code: {response.status_code}")
+                break
 
-    quote_text = set_quote_text(query)
-    payload = {"text": quote_text, "quote_tweet_id": tweet_id}
+            # Cast response JSON into a dictionary.
+            response_dict = json.loads(response.text)
+            page_tweets = response_dict.get('data', [])
+            tweets.extend(page_tweets)
+            self.search_stats['pages_cycle'] += 1
 
-    # Make the request
-    oauth = OAuth1Session(
-        bot_consumer_key,
-        client_secret=bot_consumer_secret,
-        resource_owner_key=author_access_token,
-        resource_owner_secret=author_access_secret
-    )
+            next_token = response_dict.get('meta', {}).get('next_token')
+            if early_stop is not None and early_stop(page_tweets) and next_token:
+                print(f"Stopping after {page + 1} pages, later Tweets are no longer beating the top one.")
+                break
+            if not next_token:
+                break
+            query_params['next_token'] = next_token
 
-    # Making the request...
-    response = oauth.post(
-        "https://api.twitter.com/2/tweets", json=payload
-    )
+        return tweets
 
-    if response.status_code != 200:
-        print(f"Response code: {response.status_code}")
-    #    raise Exception(
-    #        "Request returned an error: {} {}".format(response.status_code, response.text)
-    #    )
+    def quote_tweet(self, tweet_id, query):
 
-    return response
+        quote_text = set_quote_text(query)
+        payload = {"text": quote_text, "quote_tweet_id": tweet_id}
 
-def retweet(author_id, tweet_id):
+        response = self.user_session.post(POST_TWEET_URL, json=payload)
 
-    # You can replace the given Tweet ID with your the Tweet ID you want to Retweet
-    # You can find a Tweet ID by using the Tweet lookup endpoint
-    payload = {"tweet_id": tweet_id}
+        if response.status_code not in (200, 201):
+            print(f"Response code: {response.status_code}")
 
-    # Make the request
-    oauth = OAuth1Session(
-        bot_consumer_key,
-        client_secret=bot_consumer_secret,
-        resource_owner_key=author_access_token,
-        resource_owner_secret=author_access_secret
-    )
+        return response
 
-    # Making the request...
-    response = oauth.post(
-        "https://api.twitter.com/2/users/{}/retweets".format(author_id), json=payload
-    )
+    def retweet(self, author_id, tweet_id):
 
-    if response.status_code != 200:
-        print(f"Response code: {response.status_code}")
-    #    raise Exception(
-    #        "Request returned an error: {} {}".format(response.status_code, response.text)
-    #    )
+        # You can replace the given Tweet ID with your the Tweet ID you want to Retweet
+        # You can find a Tweet ID by using the Tweet lookup endpoint
+        payload = {"tweet_id": tweet_id}
 
-    return response
+        response = self.user_session.post(RETWEET_URL.format(author_id), json=payload)
 
-def bearer_oauth(r):
+        if response.status_code != 200:
+            print(f"Response code: {response.status_code}")
+
+        return response
+
+    def close(self):
+        self.app_session.close()
+        self.user_session.close()
+
+class ActionQueue:
     """
-    Method required by bearer token authentication.
+    Outbound actions (quotes, Retweets) queued up during a run and dispatched back to back.
+    A token bucket holds them to the rate limit: up to `actions_per_window` go out at once,
+    after which actions wait for the bucket to refill. A 429 waits for the rate-limit reset
+    and retries once.
     """
-    r.headers["Authorization"] = f"Bearer {search_bearer_token}"
-    r.headers["User-Agent"] = "@SnowbotDev snowbot_retweets.py"
-    return r
+
+    def __init__(self, actions_per_window=ACTIONS_PER_WINDOW, window_seconds=ACTION_WINDOW_SECONDS):
+        self.capacity = actions_per_window
+        self.refill_per_second = actions_per_window / window_seconds
+        self.tokens = actions_per_window
+        self.last_refill = time.monotonic()
+        self.actions = deque()
+
+    def enqueue(self, action, *args):
+        self.actions.append((action, args))
+
+    def _take_token(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_per_second)
+        self.last_refill = now
+        if self.tokens < 1:
+            time.sleep((1 - self.tokens) / self.refill_per_second)
+            self._take_token()
+            return
+        self.tokens -= 1
+
+    def dispatch(self):
+        """Runs all queued actions, returning their responses."""
+        responses = []
+        while self.actions:
+            action, args = self.actions.popleft()
+            self._take_token()
+            response = action(*args)
+            if response.status_code == 429:
+                reset = int(response.headers.get("x-rate-limit-reset", time.time() + 60))
+                wait_seconds = min(max(reset - time.time(), 1), ACTION_WINDOW_SECONDS)
+                print(f"Rate limited, retrying in {wait_seconds:.0f} seconds...")
+                time.sleep(wait_seconds)
+                response = action(*args)
+            responses.append(response)
+        return responses
 
 def get_start_time(start_time_hours_ago):
     timestamp = datetime.datetime.utcnow()
     timestamp = (timestamp + relativedelta(hours=-int(start_time_hours_ago)))
     return timestamp.strftime("%Y-%m-%dT%H:%M:%SZ")
 
-def search_tweets(query, start_time_hours_ago):
-    search_url = "https://api.twitter.com/2/tweets/search/recent"
-    start_time = get_start_time(start_time_hours_ago)
-    query_params = {'query': query, 'sort_order': 'relevancy','start_time': start_time, 'tweet.fields': 'public_metrics', 'max_results': 100}
-    response = requests.get(search_url, auth=bearer_oauth, params=query_params)
-
-    if response.status_code != 200:
-        print(f"Response code: {response.status_code}")
-    #    raise Exception(
-    #        "Request returned an error: {} {}".format(response.status_code, response.text)
-    #    )
-
-    return response
+def get_queries():
+    """
+    Queries to surface Tweets for: a JSON list in the 'queries' environment variable, or the
+    single 'query' one.
+    """
+    queries = os.environ.get("queries")
+    if queries:
+        return json.loads(queries)
+    return [os.environ.get("query")]
 
 if __name__ == '__main__':
 
     author_id = os.environ.get("AUTHOR_ID")
     # Retreive some 'app' settings (things that would
-    query = os.environ.get("query")
+    queries = get_queries()
     metrics_minimum = os.environ.get("metrics_minimum")
     start_time_hours_ago = os.environ.get("start_time_hours_ago")
-
-    print(f"Making search request with query: #{query}...")
-    response = search_tweets(query, start_time_hours_ago)
-
-    # Cast response JSON into a dictionary.
-    response_dict = json.loads(response.text)
-
-    if 'data' in response_dict.keys():
-        tweets = response_dict['data']
-
-        treshold_met = False
-
-        # For now, just sort by number of Likes + Retweets.
-        tweets = sorted(tweets, key=lambda i: i['public_metrics']['like_count']+i['public_metrics']['retweet_count'] , reverse=True)
-
-        if (tweets[0]['public_metrics']['like_count']+ tweets[0]['public_metrics']['retweet_count']) > int(metrics_minimum):
-            treshold_met = True
-
-        if treshold_met:
-            print(f"https://twitter.com/SnowBotDev/status/{id})")
-            tweet_id = tweets[0]['id']
-            #response = retweet(author_id, tweet_id)
-            response = quote_tweet(tweet_id, query)
-    else:
-        print("No Tweets from search requests.")
+    max_pages = int(os.environ.get("max_pages", 1))
+    early_stop_margin = float(os.environ.get("early_stop_margin", 0.1))
+    # For now, by default just sort by number of Likes + Retweets.
+    score = compile_formula(os.environ.get("score_formula", "likes + retweets")).score_tweet
+
+    client = SnowbotClient(search_bearer_token, bot_consumer_key, bot_consumer_secret,
+                           author_access_token, author_access_secret)
+    action_queue = ActionQueue()
+
+    # Tweets already surfaced are skipped, until they age out of the history.
+    storage = open_backend(history_ttl_hours=float(os.environ.get("history_ttl_hours", HISTORY_TTL_HOURS)))
+    storage.expire_surfaced()
+
+    def surface(action, query, tweet_id, *args):
+        """Runs an action on a Tweet, recording it as surfaced for the query if it went through."""
+        response = action(tweet_id, *args)
+        if response.status_code in (200, 201):
+            storage.mark_surfaced(query, [tweet_id])
+        return response
+
+    stats = []
+
+    for query in queries:
+        print(f"Making search request with query: #{query}...")
+        collect_started = time.time()
+        early_stop = EarlyStop(1, score_func=score, margin=early_stop_margin)
+        tweets = client.search_tweets(query, start_time_hours_ago, max_pages=max_pages, early_stop=early_stop)
+        query_stats = dict(client.search_stats, search_query=query, query_id=query,
+                           tweet_volume_cycle=len(tweets), candidates_cycle=0,
+                           collect_seconds=round(time.time() - collect_started, 3))
+        stats.append(query_stats)
+
+        if tweets:
+            rank_started = time.time()
+            tweets = sorted(tweets, key=score, reverse=True)
+
+            # Candidates meeting the threshold, less any already surfaced for this query (one lookup).
+            candidates = [tweet['id'] for tweet in tweets if score(tweet) > int(metrics_minimum)]
+            candidates = storage.filter_unsurfaced(query, candidates)
+            query_stats['candidates_cycle'] = len(candidates)
+            query_stats['rank_seconds'] = round(time.time() - rank_started, 3)
+
+            if candidates:
+                tweet_id = candidates[0]
+                print(f"https://twitter.com/SnowBotDev/status/{tweet_id}")
+                #action_queue.enqueue(surface, lambda tweet_id: client.retweet(author_id, tweet_id), query, tweet_id)
+                action_queue.enqueue(surface, client.quote_tweet, query, tweet_id, query)
+            else:
+                print("No new Tweets meeting the threshold.")
+        else:
+            print("No Tweets from search requests.")
+
+    action_queue.dispatch()
+
+    updated_at = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    for query_stats in stats:
+        query_stats['updated_at'] = updated_at
+    try:
+        storage.write_stats(stats)
+    except Exception as e:
+        print(f"Error writing run stats: {e}")
+
+    client.close()
+    storage.close()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# Licensed under the Apache License, Version 2.0
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Start-up benchmark for top_tweets.py: how long a fresh interpreter takes to get from launch to the
+# point of sending its first request (imports, argument parsing, config and credential loading,
+# setting up the ResultStream). Each run is a new process, as in the hourly job. Exits with status 1
+# if the median is over the budget, so it can gate a deploy or CI step.
+#
+#   python startup_benchmark.py --runs 15 --budget-ms 400
+#   python startup_benchmark.py --config-file config/search.yaml --importtime
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import time
+
+DEFAULT_RUNS = 11
+DEFAULT_BUDGET_MS = 250
+
+# Runs in each fresh process; prints its own seconds from the first line to a ready ResultStream.
+SET_UP_CODE = """
+import sys, time
+started = time.perf_counter()
+sys.argv = ['top_tweets.py'] + {argv!r}
+import top_tweets
+args_dict = vars(top_tweets.parse_cmd_args().parse_args())
+stream_params = top_tweets.do_set_up(args_dict)
+stream_params.pop('time_budget', None)
+rs = top_tweets.ResultStream(tweetify=False, **stream_params)
+print(time.perf_counter() - started)
+"""
+
+def parse_cmd_args():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help=f"Processes to time (default {DEFAULT_RUNS}).")
+    argparser.add_argument("--budget-ms", dest="budget_ms", type=float, default=DEFAULT_BUDGET_MS,
+                           help=f"Most the median start-up may take, in milliseconds (default {DEFAULT_BUDGET_MS}).")
+    argparser.add_argument("--query", default="snow has:media -is:retweet", help="Query to set up with.")
+    argparser.add_argument("--config-file", dest="config_filename", default=None,
+                           help="Config file for top_tweets.py, to include reading it.")
+    argparser.add_argument("--importtime", action="store_true",
+                           help="Also list the slowest imports of one run (python -X importtime).")
+    return argparser
+
+def run_once(argv, env, extra_flags=()):
+    """Times one fresh process. Returns (wall seconds, set-up seconds within it, stderr)."""
+    started = time.perf_counter()
+    done = subprocess.run([sys.executable, *extra_flags, '-c', SET_UP_CODE.format(argv=argv)],
+                          capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    wall = time.perf_counter() - started
+    if done.returncode != 0:
+        print(done.stderr)
+        sys.exit(f"Set-up failed with exit status {done.returncode}.")
+    return wall, float(done.stdout.strip().splitlines()[-1]), done.stderr
+
+def time_bare_interpreter(env):
+    """Times a process that does nothing, for comparison."""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], env=env, check=True)
+    return time.perf_counter() - started
+
+def slowest_imports(importtime_output, n=10):
+    """The n imports with the largest cumulative times (microseconds), from -X importtime output."""
+    imports = []
+    for line in importtime_output.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                imports.append((int(cumulative), name.rstrip()))
+    return sorted(imports, reverse=True)[:n]
+
+def main():
+    args = parse_cmd_args().parse_args()
+    argv = ['--query', args.query, '--storage', 'sqlite:///:memory:']
+    if args.config_filename:
+        argv += ['--config-file', args.config_filename]
+
+    # No request is sent, so stand-in credentials do; real ones in the environment are left alone.
+    env = dict(os.environ)
+    env.setdefault('SEARCHTWEETS_ENDPOINT', 'https://api.twitter.com/2/tweets/search/recent')
+    env.setdefault('SEARCHTWEETS_BEARER_TOKEN', 'benchmark')
+
+    interpreter = statistics.median(time_bare_interpreter(env) for _ in range(max(3, args.runs // 2)))
+
+    run_once(argv, env)  # Warms the OS file cache and any config snapshot, as an hourly job would have them.
+    walls, set_ups = [], []
+    for _ in range(args.runs):
+        wall, set_up, _ = run_once(argv, env)
+        walls.append(wall)
+        set_ups.append(set_up)
+
+    median_ms = statistics.median(walls) * 1000
+    print(json.dumps({'runs': args.runs,
+                      'median_ms': round(median_ms, 1),
+                      'max_ms': round(max(walls) * 1000, 1),
+                      'set_up_median_ms': round(statistics.median(set_ups) * 1000, 1),
+                      'bare_interpreter_ms': round(interpreter * 1000, 1),
+                      'budget_ms': args.budget_ms}, indent=4))
+
+    if args.importtime:
+        _, _, stderr = run_once(argv, env, extra_flags=('-X', 'importtime'))
+        print("Slowest imports (cumulative ms):")
+        for cumulative, name in slowest_imports(stderr):
+            print(f"{cumulative / 1000:8.1f}  {name}")
+
+    if median_ms > args.budget_ms:
+        print(f"Start-up takes {median_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget.")
+        sys.exit(1)
+    print(f"Start-up takes {median_ms:.0f} ms, within the {args.budget_ms:.0f} ms budget.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# Licensed under the Apache License, Version 2.0
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# A local stand-in for the filtered stream endpoint, for testing stream_top_tweets.py without
+# credentials or network access. It serves newline-delimited Tweet JSON with keep-alive blank
+# lines, mixing new Tweets with Retweets of earlier ones (whose metrics grow as they are shared).
+# Connections can be dropped or refused on purpose, to exercise reconnects and backoff.
+#
+#   python stream_standin.py --port 8766 --drop-after 200 --refuse-first 1
+#   python stream_top_tweets.py --endpoint http://127.0.0.1:8766/2/tweets/search/stream --storage sqlite:///stream.db
+
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Start of Tweet ID time, in epoch milliseconds.
+SNOWFLAKE_EPOCH_MS = 1288834974657
+
+def parse_cmd_args():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--port", type=int, default=8766, help="Port to listen on (default 8766).")
+    argparser.add_argument("--rate", type=float, default=20, help="Messages per second (default 20).")
+    argparser.add_argument("--heartbeat", type=float, default=20, help="Seconds between keep-alives (default 20).")
+    argparser.add_argument("--retweet-share", type=float, default=0.6, help="Share of messages that are Retweets (default 0.6).")
+    argparser.add_argument("--drop-after", type=int, default=None, help="Close each connection after this many messages.")
+    argparser.add_argument("--refuse-first", type=int, default=0, help="Answer the first this many connections with a 503.")
+    argparser.add_argument("--seed", type=int, default=None, help="Random seed, for repeatable streams.")
+    return argparser
+
+class StandinStream:
+    """The synthetic Tweets, shared by all connections."""
+
+    def __init__(self, retweet_share, seed=None):
+        self.retweet_share = retweet_share
+        self.random = random.Random(seed)
+        self.originals = []
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def new_id(self):
+        self.sequence = (self.sequence + 1) % 4096
+        return str(((int(time.time() * 1000) - SNOWFLAKE_EPOCH_MS) << 22) | self.sequence)
+
+    def next_message(self):
+        with self.lock:
+            tweet_id = self.new_id()
+            if self.originals and self.random.random() < self.retweet_share:
+                # Popular Tweets get shared more: pick from the most-Retweeted with higher odds.
+                original = max(self.random.sample(self.originals, min(3, len(self.originals))),
+                               key=lambda t: t['public_metrics']['retweet_count'])
+                metrics = original['public_metrics']
+                metrics['retweet_count'] += 1
+                metrics['like_count'] += self.random.randint(0, 4)
+                metrics['reply_count'] += self.random.randint(0, 1)
+                return {'data': {'id': tweet_id, 'text': 'RT ' + original['text'],
+                                 'referenced_tweets': [{'type': 'retweeted', 'id': original['id']}],
+                                 'public_metrics': dict(metrics)},
+                        'includes': {'tweets': [json.loads(json.dumps(original))]},
+                        'matching_rules': [{'id': '1', 'tag': 'standin'}]}
+
+            tweet = {'id': tweet_id, 'text': f'#snow report {tweet_id[-4:]}',
+                     'public_metrics': {'like_count': 0, 'retweet_count': 0, 'reply_count': 0, 'quote_count': 0}}
+            self.originals.append(tweet)
+            del self.originals[:-1000]
+            return {'data': dict(tweet, public_metrics=dict(tweet['public_metrics'])),
+                    'matching_rules': [{'id': '1', 'tag': 'standin'}]}
+
+def make_handler(args, standin):
+    connections = {'n': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+
+        # Like the real endpoint, the stream is sent with chunked transfer encoding.
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *log_args):
+            pass
+
+        def do_GET(self):
+            connections['n'] += 1
+            if connections['n'] <= args.refuse_first:
+                body = b'{"title": "Service Unavailable"}'
+                self.send_response(503)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+
+            sent = 0
+            last_heartbeat = time.monotonic()
+            try:
+                while args.drop_after is None or sent < args.drop_after:
+                    if args.rate > 0:
+                        self.write_chunk((json.dumps(standin.next_message()) + '\r\n').encode())
+                        sent += 1
+                    if time.monotonic() - last_heartbeat >= args.heartbeat:
+                        self.write_chunk(b'\r\n')
+                        last_heartbeat = time.monotonic()
+                    time.sleep(1 / args.rate if args.rate > 0 else args.heartbeat)
+                self.write_chunk(b'')
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def write_chunk(self, data):
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+
+    return Handler
+
+def main():
+    args = parse_cmd_args().parse_args()
+    standin = StandinStream(args.retweet_share, args.seed)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(args, standin))
+    print(f"Stand-in stream on http://127.0.0.1:{args.port}/2/tweets/search/stream")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
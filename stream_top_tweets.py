@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# Licensed under the Apache License, Version 2.0
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Streaming alternative to top_tweets.py: instead of an hourly search, stay connected to the
+# filtered stream and keep a rolling top-K of the Tweets it delivers. Retweets and quotes carry
+# their original Tweet (with the referenced_tweets.id expansion) and its current metrics, so
+# popular Tweets keep climbing as they are shared. The ranking is published (see storage.py)
+# when it changes, at most every --min-publish-seconds, and on a timer in any case.
+#
+# Stream rules are managed on the rules endpoint, outside this script.
+# For local testing, run stream_standin.py and point --endpoint at it.
+
+import os
+import time
+import signal
+import argparse
+import logging
+
+from searchtweets import (FilteredStream,
+                          FILTERED_STREAM_ENDPOINT,
+                          RollingTopK,
+                          DecayedRanking,
+                          make_decay,
+                          compile_formula,
+                          DEFAULT_FORMULA)
+
+from storage import open_backend, DEFAULT_QUERY_ID, DEFAULT_WINDOW
+
+MAX_TOP_TWEETS = 10
+WINDOW_HOURS = 24
+PUBLISH_INTERVAL_SECONDS = 60
+MIN_PUBLISH_SECONDS = 5
+
+logger = logging.getLogger()
+logging.basicConfig(level=os.environ.get("LOGLEVEL", "ERROR"))
+
+def parse_cmd_args():
+    argparser = argparse.ArgumentParser()
+
+    argparser.add_argument("--endpoint",
+                           dest="endpoint",
+                           default=os.getenv('SEARCHTWEETS_STREAM_ENDPOINT', FILTERED_STREAM_ENDPOINT),
+                           help="Filtered stream endpoint (default SEARCHTWEETS_STREAM_ENDPOINT, else the v2 one).")
+
+    argparser.add_argument("--tweet-fields",
+                           dest="tweet_fields",
+                           default="public_metrics,referenced_tweets",
+                           help="Tweet fields to request; public_metrics is needed to rank.")
+
+    argparser.add_argument("--expansions",
+                           dest="expansions",
+                           default="referenced_tweets.id",
+                           help="Expansions to request; referenced_tweets.id brings in the originals of Retweets and quotes.")
+
+    argparser.add_argument("--max-top-tweets",
+                           dest="max_top_tweets",
+                           type=int,
+                           default=MAX_TOP_TWEETS,
+                           help=f"How many top Tweets to keep (default {MAX_TOP_TWEETS}).")
+
+    argparser.add_argument("--window-hours",
+                           dest="window_hours",
+                           type=float,
+                           default=WINDOW_HOURS,
+                           help=f"Only Tweets created in the last this many hours are ranked (default {WINDOW_HOURS}).")
+
+    argparser.add_argument("--score-formula",
+                           dest="score_formula",
+                           default=None,
+                           help=f"Scoring formula (default score_formula in the environment, else '{DEFAULT_FORMULA}').")
+
+    argparser.add_argument("--decay",
+                           dest="decay",
+                           default=os.getenv('decay'),
+                           help="Rank by time-decayed score: 'half-life:HOURS' or 'gravity:G' (default: no decay).")
+
+    argparser.add_argument("--publish-interval",
+                           dest="publish_interval",
+                           type=float,
+                           default=PUBLISH_INTERVAL_SECONDS,
+                           help=f"Publish at least this often, in seconds (default {PUBLISH_INTERVAL_SECONDS}).")
+
+    argparser.add_argument("--min-publish-seconds",
+                           dest="min_publish_seconds",
+                           type=float,
+                           default=MIN_PUBLISH_SECONDS,
+                           help=f"Publish changes at most this often, in seconds (default {MIN_PUBLISH_SECONDS}).")
+
+    argparser.add_argument("--max-tweets",
+                           dest="max_tweets",
+                           type=int,
+                           default=None,
+                           help="Stop after this many Tweets (default: run until stopped).")
+
+    argparser.add_argument("--storage",
+                           dest="storage_url",
+                           default=None,
+                           help="Where to publish top Tweets (see storage.py; default STORAGE_URL, else DATABASE_*).")
+
+    argparser.add_argument("--query-id",
+                           dest="query_id",
+                           default=os.getenv('query_id', DEFAULT_QUERY_ID),
+                           help=f"Name the top Tweets are published under (default {DEFAULT_QUERY_ID}).")
+
+    argparser.add_argument("--window",
+                           dest="window",
+                           default=os.getenv('window', DEFAULT_WINDOW),
+                           help=f"Label of the time window ranked (default {DEFAULT_WINDOW}).")
+
+    argparser.add_argument("--debug",
+                           dest="debug",
+                           action="store_true",
+                           default=False,
+                           help="print all info and warning messages")
+    return argparser
+
+def candidate_tweets(tweet):
+    """
+    The Tweets a stream message gives fresh metrics for: the Tweet itself, and the Tweets it
+    quotes or replies to. A Retweet stands for its original, not itself.
+    """
+    candidates = []
+    is_retweet = False
+    for referenced_tweet in tweet.get('referenced_tweets', []):
+        is_retweet = is_retweet or referenced_tweet.get('type') == 'retweeted'
+        if 'public_metrics' in referenced_tweet:
+            candidates.append(referenced_tweet)
+    if not is_retweet and 'public_metrics' in tweet:
+        candidates.append(tweet)
+    return candidates
+
+def top_tweet_details(score, tweet):
+    metrics = tweet['public_metrics']
+    return {'id': tweet['id'],
+            'score': float(f'{score:.6g}'),
+            'likes': metrics.get('like_count', 0),
+            'retweets': metrics.get('retweet_count', 0),
+            'replies': metrics.get('reply_count', 0),
+            'quotes': metrics.get('quote_count', 0)}
+
+class Publisher:
+    """
+    Publishes the ranking when it has changed, no more often than min_seconds, and every
+    interval seconds regardless (after dropping Tweets that have aged out of the window).
+    """
+
+    def __init__(self, ranker, storage, query_id, window, interval, min_seconds):
+        self.ranker = ranker
+        self.storage = storage
+        self.query_id = query_id
+        self.window = window
+        self.interval = interval
+        self.min_seconds = min_seconds
+        self.published_version = None
+        self.last_published = 0
+        self.n_publishes = 0
+
+    def maybe_publish(self, force=False):
+        since_last = time.monotonic() - self.last_published
+        if since_last >= self.interval:
+            self.ranker.expire()
+        elif not force and (self.ranker.version == self.published_version or since_last < self.min_seconds):
+            return False
+
+        top_tweets = [top_tweet_details(score, tweet) for score, tweet in self.ranker.ranked()]
+        try:
+            self.storage.publish_rankings(top_tweets, self.query_id, self.window)
+        except Exception as e:
+            print(f"Error publishing top Tweets: {e}")
+            return False
+        self.published_version = self.ranker.version
+        self.last_published = time.monotonic()
+        self.n_publishes += 1
+        return True
+
+def main():
+    args_dict = vars(parse_cmd_args().parse_args())
+    if args_dict['debug']:
+        logger.setLevel(logging.DEBUG)
+
+    scorer = compile_formula(args_dict['score_formula'] or os.getenv('score_formula', DEFAULT_FORMULA))
+    # With a decay, the ranking also changes as time passes, and the timed publishes pick that up.
+    decay = make_decay(args_dict['decay'])
+    if decay is not None:
+        ranker = DecayedRanking(args_dict['max_top_tweets'], decay, score_func=scorer.score_tweet,
+                                window_seconds=args_dict['window_hours'] * 3600)
+    else:
+        ranker = RollingTopK(args_dict['max_top_tweets'], score_func=scorer.score_tweet,
+                             window_seconds=args_dict['window_hours'] * 3600)
+    storage = open_backend(args_dict['storage_url'])
+    publisher = Publisher(ranker, storage, args_dict['query_id'], args_dict['window'],
+                          args_dict['publish_interval'], args_dict['min_publish_seconds'])
+
+    request_parameters = {'tweet.fields': args_dict['tweet_fields'], 'expansions': args_dict['expansions']}
+    stream = FilteredStream(endpoint=args_dict['endpoint'],
+                            bearer_token=os.getenv('SEARCHTWEETS_BEARER_TOKEN'),
+                            request_parameters=request_parameters,
+                            max_tweets=args_dict['max_tweets'],
+                            on_heartbeat=publisher.maybe_publish)
+
+    # Heroku stops dynos with SIGTERM; finish with a last publish.
+    signal.signal(signal.SIGTERM, lambda signum, frame: stream.stop())
+
+    try:
+        for tweet in stream.stream():
+            for candidate in candidate_tweets(tweet):
+                ranker.add(candidate)
+            publisher.maybe_publish()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        publisher.maybe_publish(force=True)
+        storage.close()
+
+    print(f"Read {stream.total_results} Tweets over {stream.n_connects} connections; "
+          f"published {publisher.n_publishes} times.")
+
+if __name__ == '__main__':
+    main()
@@ -5,34 +5,51 @@ import os
 import argparse
 import json
 import sys
-from datetime import datetime
+import time
 from time import gmtime, strftime
+from datetime import datetime
 import logging
 
-import psycopg2 #Writing 'top tweet' metadata to a shared Postgres database.
+from storage import open_backend, DEFAULT_QUERY_ID, DEFAULT_WINDOW, DEFAULT_METRIC, SNAPSHOT_RETENTION_DAYS #Writing 'top tweet' metadata to a shared Postgres database (or SQLite, or files).
 
 # The TwitterDev search-tweets-python project does the work of managing the Tweet collection.
 # Local version has special code for Heroku deployment.
+# Only what every cycle uses is imported here; optional subsystems (aggregates, spilling, snapshots,
+# archives, hydration, split queries) are imported where they are switched on, to keep start-up quick.
 
 from searchtweets import (ResultStream,
+                          EarlyStop,
+                          compile_formula,
+                          DEFAULT_FORMULA,
+                          DecayedRanking,
+                          WindowedTopK,
+                          snowflake_seconds,
+                          make_decay,
+                          QUERY_LENGTH_LIMIT,
+                          dedupe_tweets,
+                          SeenIds,
                           load_credentials,
                           merge_dicts,
-                          read_config,
-                          write_result_stream,
+                          read_config_snapshot,
+                          load_config_snapshot,
+                          save_config_snapshot,
+                          config_file_stat,
+                          convert_utc_time,
+                          is_relative_time,
                           gen_params_from_config)
 
 # 'Some should be in a config thingy' items:
 ENGAGEMENTS_MINIMUM = 5
 MAX_TOP_TWEETS = 10
+PUBLISH_RESERVE_SECONDS = 30 # With a --time-budget, time kept back for writing to the database.
+SNAPSHOT_MAX_AGE_HOURS = 48 # Metric snapshots kept for velocity, with --snapshots.
+RANKING_METRICS = ('score', 'likes', 'retweets', 'replies', 'quotes') # What --metrics can rank by.
+DEFAULT_METRICS = 'score,likes,retweets'
+SPILL_MEMORY_MB = 256 # With --ranked-output, memory for candidates before they are spilled to disk.
 # FILE_DIR = './output'          Not doing any file handling on Heroku, just DB i/o.
 # FILE_NAME = 'top_tweets.json'
 
-# Just writing to a database.
-TABLE_NAME = os.getenv('TABLE_NAME', None)
-DATABASE_NAME = os.getenv('DATABASE_NAME', None)
-DATABASE_HOST = os.getenv('DATABASE_HOST', None)
-DATABASE_USER = os.getenv('DATABASE_USER', None)
-DATABASE_PASSWORD = os.getenv('DATABASE_PASSWORD', None)
+# Just writing to a database. Database settings (STORAGE_URL, DATABASE_*) are read by storage.py.
 
 logger = logging.getLogger()
 # we want to leave this here and have it command-line configurable via the
@@ -44,14 +61,68 @@ logging.basicConfig(level=os.environ.get("LOGLEVEL", "ERROR"))
 # Query is read in from ENV (and file), and over-written with command-line.
 REQUIRED_KEYS = {}
 
+# The resolved ResultStream parameters are snapshotted, so later runs with the same arguments, environment
+# and config file skip resolving them again. These are the environment variables the set-up reads (see
+# credentials.py and gen_params_from_config); their values key the snapshot.
+SET_UP_ENV_VARS = ('SEARCHTWEETS_ENDPOINT', 'start_time', 'query', 'tweet_fields', 'time_budget')
+# Secrets are never snapshotted, but read afresh on every run; only whether they are set keys the snapshot.
+SECRET_ENV_VARS = ('SEARCHTWEETS_BEARER_TOKEN', 'SEARCHTWEETS_CONSUMER_KEY', 'SEARCHTWEETS_CONSUMER_SECRET')
+# What a snapshot must hold to be used.
+SNAPSHOT_REQUIRED_KEYS = ('endpoint', 'request_parameters')
+
+def set_up_source(args_dict):
+    """
+    Everything the stream parameters are resolved from, to key their snapshot: the arguments, the
+    environment variables read, and the config file's size and modification time.
+    """
+    return {'args': dict(args_dict),
+            'env': {name: os.getenv(name) for name in SET_UP_ENV_VARS},
+            'secrets_set': [name for name in SECRET_ENV_VARS if os.getenv(name)],
+            'config_file': config_file_stat(args_dict['config_filename']) if args_dict.get('config_filename') else None}
+
+def resolve_relative_times(stream_params, relative_times):
+    """
+    Resolves relative start and end times ('24h', '7d') against now, in place of the times they
+    resolved to when the snapshot was taken.
+    """
+    if not relative_times:
+        return stream_params
+    request_parameters = json.loads(stream_params['request_parameters'])
+    for name, value in relative_times.items():
+        request_parameters[name] = convert_utc_time(value)
+    stream_params['request_parameters'] = json.dumps(request_parameters)
+    return stream_params
+
 def do_set_up(args_dict):
     if args_dict.get("debug") is True:
         logger.setLevel(logging.DEBUG)
         logger.debug("command line args dict:")
         logger.debug(json.dumps(args_dict, indent=4))
 
+    source = set_up_source(args_dict)
+    snapshot_name = f"top_tweets {json.dumps(source['args'], sort_keys=True)}"
+    stream_params = load_config_snapshot(snapshot_name, source, required_keys=SNAPSHOT_REQUIRED_KEYS)
+    if stream_params is not None:
+        resolve_relative_times(stream_params, stream_params.pop('relative_times', {}))
+        stream_params['bearer_token'] = os.getenv('SEARCHTWEETS_BEARER_TOKEN')
+        logger.debug("arguments passed to the ResultStream object read from their snapshot, sans credentials")
+        logger.debug(json.dumps(_filter_sensitive_args(stream_params), indent=4))
+        return stream_params
+
+    stream_params, relative_times = resolve_stream_params(args_dict)
+    # Snapshotted only if its one secret, the bearer token, can be read afresh (it isn't from the config file).
+    if stream_params.get('bearer_token') == os.getenv('SEARCHTWEETS_BEARER_TOKEN'):
+        save_config_snapshot(snapshot_name, source, dict(_filter_sensitive_args(stream_params), relative_times=relative_times))
+    return stream_params
+
+def resolve_stream_params(args_dict):
+    """
+    Merges the config file, credentials and command-line arguments into the ResultStream
+    parameters. Returns them, and any relative start and end times they were resolved from.
+    """
     if args_dict.get("config_filename") is not None:
-        configfile_dict = read_config(args_dict["config_filename"])
+        # Parsed once per change of the file; later runs read a JSON snapshot of it.
+        configfile_dict = read_config_snapshot(args_dict["config_filename"])
     else:
         configfile_dict = {}
 
@@ -87,7 +158,9 @@ def do_set_up(args_dict):
     logger.debug("full arguments passed to the ResultStream object sans credentials")
     logger.debug(json.dumps(_filter_sensitive_args(stream_params), indent=4))
 
-    return stream_params
+    relative_times = {name: config_dict[name] for name in ('start_time', 'end_time')
+                      if is_relative_time(config_dict.get(name))}
+    return stream_params, relative_times
 
 def parse_cmd_args():
     argparser = argparse.ArgumentParser()
@@ -118,6 +191,57 @@ def parse_cmd_args():
                            default=None,
                            help="How many top Tweets to generate. Top 10? ")
 
+    argparser.add_argument("--score-formula",
+                           dest="score_formula",
+                           default=None,
+                           help=f"""How Tweets are scored, e.g. 'likes*1 + retweets*3 + quotes*2'. Variables: likes,
+                                 retweets, replies, quotes, followers, age_hours (default '{DEFAULT_FORMULA}').""")
+
+    argparser.add_argument("--decay",
+                           dest="decay",
+                           default=None,
+                           help="""Rank by time-decayed score, so fresh Tweets can beat older, bigger ones:
+                                 'half-life:HOURS' or 'gravity:G' (e.g. gravity:1.8). Default: no decay.""")
+
+    argparser.add_argument("--sort-order",
+                           dest="sort_order",
+                           default=None,
+                           help="Order of search results: 'recency' (API default) or 'relevancy'.")
+
+    argparser.add_argument("--early-stop-margin",
+                           dest="early_stop_margin",
+                           type=float,
+                           default=None,
+                           help="""With --sort-order relevancy, stop paging once pages stop producing Tweets that
+                                 beat the current top list's lowest score by more than this fraction (e.g. 0.1).""")
+
+    argparser.add_argument("--early-stop-patience",
+                           dest="early_stop_patience",
+                           type=int,
+                           default=2,
+                           help="Pages in a row without such a Tweet before stopping early (default 2).")
+
+    argparser.add_argument("--max-query-length",
+                           dest="max_query_length",
+                           type=int,
+                           default=QUERY_LENGTH_LIMIT,
+                           help=f"""Query length limit of the endpoint (default {QUERY_LENGTH_LIMIT}). Longer queries
+                                 are split into sub-queries that run concurrently, with results de-duplicated.""")
+
+    argparser.add_argument("--collapse-retweets",
+                           dest="collapse_retweets",
+                           action="store_true",
+                           default=False,
+                           help="""Rank a Retweet as its original Tweet. Needs 'referenced_tweets' in the
+                                 Tweet fields and the 'referenced_tweets.id' expansion.""")
+
+    argparser.add_argument("--two-phase",
+                           dest="two_phase",
+                           action="store_true",
+                           default=False,
+                           help="""Search with just 'tweet.fields=public_metrics', rank, then look up the
+                                 requested Tweet fields and expansions for the top Tweets only.""")
+
     argparser.add_argument("--credential-file",
                            dest="credential_file",
                            default=None,
@@ -172,6 +296,33 @@ def parse_cmd_args():
                            help="Maximum number of pages/API calls to "
                                 "use for this session.")
 
+    argparser.add_argument("--time-budget",
+                           dest="time_budget",
+                           type=float,
+                           default=None,
+                           help="""Seconds this collection cycle may take, end to end. Paging and
+                                 retries stop early when the time left won't cover another request
+                                 plus the publish, and the best-so-far ranking is published as partial.""")
+
+    argparser.add_argument("--publish-reserve",
+                           dest="reserve_seconds",
+                           type=float,
+                           default=None,
+                           help=f"Seconds of the time budget kept back for publishing results (default {PUBLISH_RESERVE_SECONDS}).")
+
+    argparser.add_argument("--workers",
+                           dest="workers",
+                           type=int,
+                           default=None,
+                           help="""Decode response pages in this many worker processes, while the next pages are
+                                 fetched (default: decode in the main process). Not used with --early-stop-margin.""")
+
+    argparser.add_argument("--cache-dir",
+                           dest="cache_dir",
+                           default=None,
+                           help="""Cache response pages here when the search window has closed (an --end-time in the
+                                 past), so re-running the same report reads them back instead of requesting them.""")
+
     argparser.add_argument("--output-format",
                        dest="output_format",
                        default="r",
@@ -208,6 +359,93 @@ def parse_cmd_args():
                            default=None,
                            help="JSON-formatted str representing a dict of additional HTTP request headers")
 
+    argparser.add_argument("--storage",
+                           dest="storage_url",
+                           default=None,
+                           help="""Where to publish top Tweets: postgres://..., sqlite:///path.db or file:///dir
+                                 (default: STORAGE_URL, else the DATABASE_* settings).""")
+
+    argparser.add_argument("--query-id",
+                           dest="query_id",
+                           default=None,
+                           help=f"Name the top Tweets are published under, so several queries can share the table (default {DEFAULT_QUERY_ID}).")
+
+    argparser.add_argument("--window",
+                           dest="window",
+                           default=None,
+                           help=f"Label of the time window ranked, e.g. 1h or 24h (default {DEFAULT_WINDOW}).")
+
+    argparser.add_argument("--windows",
+                           dest="windows",
+                           default=None,
+                           help="""Several time windows to rank from one fetch, e.g. 1h,6h,24h (default windows in the
+                                 environment). The fetch covers the widest, unless --start-time is given, and a top
+                                 list is published for each window and each of --metrics. Overrides --window.""")
+
+    argparser.add_argument("--metrics",
+                           dest="metrics",
+                           default=None,
+                           help=f"""With --windows, what each window is ranked by: any of {', '.join(RANKING_METRICS)}
+                                 (default metrics in the environment, else {DEFAULT_METRICS}).""")
+
+    argparser.add_argument("--aggregates",
+                           dest="aggregates",
+                           default=None,
+                           help="""Also rank any of authors, hashtags, mentions and media, in the same pass over the
+                                 results (default aggregates in the environment). The Tweet fields and expansions
+                                 they need are added to the search, and they are published to top_entities.""")
+
+    argparser.add_argument("--aggregate-by",
+                           dest="aggregate_by",
+                           default="count",
+                           help="Rank --aggregates by Tweet 'count' (default) or total 'engagement' score.")
+
+    argparser.add_argument("--sketch-epsilon",
+                           dest="sketch_epsilon",
+                           type=float,
+                           default=None,
+                           help="""Count --aggregates approximately, in fixed memory (for long backfills): counts may be
+                                 overestimated by this fraction of all Tweets, e.g. 0.0001. Default: exact counts.""")
+
+    argparser.add_argument("--spill-mb",
+                           dest="spill_mb",
+                           type=float,
+                           default=None,
+                           help="""Rank candidates with an external sort, holding at most about this many MB of them in
+                                 memory and spilling sorted runs to temp files (default spill_mb in the environment;
+                                 no spilling). For full rankings far bigger than --max-top-tweets 10.""")
+
+    argparser.add_argument("--ranked-output",
+                           dest="ranked_output",
+                           default=None,
+                           help=f"""Also write the full ranking of candidates, best first, to this NDJSON file. Ranked
+                                 with an external sort ({SPILL_MEMORY_MB} MB unless --spill-mb is given).""")
+
+    argparser.add_argument("--archive",
+                           dest="archive_prefix",
+                           default=None,
+                           help=f"""Also keep each cycle's Tweets (IDs, authors and public metrics) as a columnar archive
+                                 file, <prefix>_<YYYY-mm-ddTHH_MM_SS>.col, for analyses across cycles.""")
+
+    argparser.add_argument("--snapshot-retention-days",
+                           dest="snapshot_retention_days",
+                           type=float,
+                           default=None,
+                           help=f"Days of top Tweet snapshots to keep (default {SNAPSHOT_RETENTION_DAYS}).")
+
+    argparser.add_argument("--snapshots",
+                           dest="snapshots",
+                           default=None,
+                           help="""File of per-Tweet metric snapshots (default snapshot_store in the environment). When set,
+                                 each cycle's candidates are snapshotted, and the fastest-rising Tweets are also
+                                 published, under the 'rising' metric.""")
+
+    argparser.add_argument("--rising-cycles",
+                           dest="rising_cycles",
+                           type=int,
+                           default=1,
+                           help="Cycles over which engagement velocity is measured (default 1: since the last cycle).")
+
     argparser.add_argument("--debug",
                            dest="debug",
                            action="store_true",
@@ -219,32 +457,93 @@ def _filter_sensitive_args(dict_):
     sens_args = ("consumer_key", "consumer_secret", "bearer_token")
     return {k: v for k, v in dict_.items() if k not in sens_args}
 
-def add_up_engagements(tweets):
-    engaged_tweets = []
+# Request parameters a two-phase search leaves to the lookup of the top Tweets.
+HYDRATION_PARAMETERS = ("tweet.fields", "user.fields", "media.fields",
+                        "place.fields", "poll.fields", "expansions")
 
-    for tweet in tweets:
+def split_two_phase_parameters(request_parameters, scorer=None, collapse_retweets=False):
+    """
+    Splits the search request parameters into a thin search request, asking only for what
+    de-duplication and ranking read (public metrics, and whatever the scoring formula and
+    --collapse-retweets need), and the fields and expansions to look up for the top Tweets.
+    The lookup asks for everything requested, so each published Tweet is complete.
+    """
+    if isinstance(request_parameters, str):
+        request_parameters = json.loads(request_parameters)
+
+    variables = scorer.variables if scorer is not None else []
+    tweet_fields = ['public_metrics']
+    if 'age_hours' in variables:
+        tweet_fields.append('created_at')
+    if collapse_retweets:
+        tweet_fields.append('referenced_tweets')
+
+    search_parameters = {k: v for k, v in request_parameters.items() if k not in HYDRATION_PARAMETERS}
+    if 'followers' in variables:
+        # Follower counts come from the expanded author.
+        tweet_fields.append('author_id')
+        search_parameters['expansions'] = 'author_id'
+        search_parameters['user.fields'] = 'public_metrics'
+    search_parameters['tweet.fields'] = ','.join(tweet_fields)
+
+    hydration_fields = {k.replace('.', '_'): v for k, v in request_parameters.items() if k in HYDRATION_PARAMETERS}
+
+    return search_parameters, hydration_fields
+
+def hydrate_top_tweets(top_tweets, hydration_fields, stream_params):
+    """
+    Second phase of a two-phase collection: looks up full Tweet objects for the ranked
+    top Tweets, attaching each under a 'tweet' key (published with the ranking). Lookups
+    share the cycle's deadline, if any, and keep its publish reserve.
+    """
+    # Nothing beyond public metrics was asked for, so nothing to look up.
+    requested = {k: v for k, v in hydration_fields.items() if v}
+    tweet_fields = set(requested.pop('tweet_fields', '').split(',')) - {'', 'id', 'public_metrics'}
+    if not tweet_fields and not requested:
+        return top_tweets
+
+    from searchtweets import hydrate_tweets # Only needed with --two-phase.
+    hydrated = hydrate_tweets(list(dict.fromkeys(tweet['id'] for tweet in top_tweets)),
+                              endpoint=stream_params['endpoint'],
+                              bearer_token=stream_params.get('bearer_token'),
+                              extra_headers_dict=stream_params.get('extra_headers_dict'),
+                              deadline=stream_params.get('deadline'),
+                              reserve_seconds=stream_params.get('reserve_seconds'),
+                              **hydration_fields)
+    hydrated = {tweet['id']: tweet for tweet in hydrated}
+
+    for tweet in top_tweets:
+        if tweet['id'] in hydrated:
+            tweet['tweet'] = hydrated[tweet['id']]
+
+    return top_tweets
+
+def add_up_engagements(tweets, scorer=None, scores=None):
+    """
+    Scores a page of Tweets (by default, the total of their public metrics), keeping those
+    with at least ENGAGEMENTS_MINIMUM. scores may pass in the page's scores, if already computed.
+    """
+    if scorer is None:
+        scorer = compile_formula(DEFAULT_FORMULA)
+
+    engaged_tweets = []
 
-        total_engagements = 0
+    # Score the whole page at once.
+    if scores is None:
+        scores = scorer.score_tweets(tweets)
 
-        # Look up public metrics and add them together.
-        num_likes = tweet['public_metrics']['like_count']
-        total_engagements = total_engagements + num_likes
-        num_retweets = tweet['public_metrics']['retweet_count']
-        total_engagements = total_engagements + num_retweets
-        num_replies = tweet['public_metrics']['reply_count']
-        total_engagements = total_engagements + num_replies
-        num_quotes = tweet['public_metrics']['quote_count']
-        total_engagements = total_engagements + num_quotes
+    for tweet, total_engagements in zip(tweets, scores):
 
         if total_engagements >= ENGAGEMENTS_MINIMUM:
             # print(f"Tweet with {total_engagements} engagements.")
+            metrics = tweet['public_metrics']
             details = {}
             details['id'] = tweet['id']
             details['score'] = total_engagements
-            details['likes'] = num_likes
-            details['retweets'] = num_retweets
-            details['replies'] = num_replies
-            details['quotes'] = num_quotes
+            details['likes'] = metrics['like_count']
+            details['retweets'] = metrics['retweet_count']
+            details['replies'] = metrics['reply_count']
+            details['quotes'] = metrics['quote_count']
 
             # Add Tweet and score to list.
             engaged_tweets.append(details)
@@ -259,6 +558,92 @@ def sort_tweets(tweets):
 
     return tweets
 
+def decay_tweets(tweets, decay, k, now=None):
+    """
+    Ranks scored Tweets ({id, score, ...}) by their time-decayed score as of now (the cycle's
+    start, like the rest of the cycle), which replaces 'score' in the top k returned.
+    """
+    ranking = DecayedRanking(k, decay)
+    for tweet in tweets:
+        ranking.add(tweet, tweet['score'], now=now)
+    return [dict(tweet, score=float(f'{score:.6g}')) for score, tweet in ranking.ranked(now=now)]
+
+def rising_tweets(snapshot_path, tweets, captured_at, k, cycles=1):
+    """
+    Snapshots the metrics of this cycle's scored Tweets ({id, score, likes, ...}), and returns
+    the k fastest rising since the last `cycles` cycles, scored by engagement velocity (per hour).
+    """
+    from searchtweets import MetricSnapshotStore # Only needed with --snapshots.
+    with MetricSnapshotStore(snapshot_path) as store:
+        store.append(tweets, captured_at=captured_at)
+        rising = store.rising(k, cycles=cycles)
+        store.compact(SNAPSHOT_MAX_AGE_HOURS, min_fraction=0.25)
+
+    return [dict(metrics, id=str(tweet_id), score=float(f'{velocity:.6g}')) for velocity, tweet_id, metrics in rising]
+
+def parse_windows(spec):
+    """
+    Parses a list of window labels, e.g. '30m,6h,1d', into {label: seconds}. Empty for no spec.
+    """
+    units = {'m': 60, 'h': 3600, 'd': 86400}
+    windows = {}
+    for label in (spec or '').split(','):
+        label = label.strip()
+        if not label:
+            continue
+        if label[-1:].lower() not in units or not label[:-1].isdigit():
+            raise ValueError(f"Bad time window '{label}': use minutes, hours or days, e.g. 30m, 6h or 1d.")
+        windows[label] = int(label[:-1]) * units[label[-1].lower()]
+    return windows
+
+def ranking_metrics(spec, decay=None, now=None):
+    """
+    Maps metric names, e.g. 'score,likes', to functions of the scored Tweets ({id, score, likes, ...}).
+    With a decay, 'score' is the decayed score as of now.
+    """
+    metrics = {}
+    for metric in (spec or DEFAULT_METRICS).split(','):
+        metric = metric.strip()
+        if metric not in RANKING_METRICS:
+            raise ValueError(f"Unknown metric '{metric}': use any of {', '.join(RANKING_METRICS)}.")
+        if metric == 'score' and decay is not None:
+            metrics[metric] = lambda tweet: decay.value(tweet['score'], snowflake_seconds(tweet['id']), now)
+        else:
+            metrics[metric] = lambda tweet, metric=metric: tweet[metric]
+    return metrics
+
+def window_rankings(ranker):
+    """
+    The top lists of a WindowedTopK, as {(window, metric): top Tweets}, each Tweet's 'score' being
+    the value it was ranked by.
+    """
+    return {key: [dict(tweet, score=float(f'{score:.6g}')) for score, tweet in ranked]
+            for key, ranked in ranker.ranked().items()}
+
+def add_aggregate_fields(request_parameters, dimensions):
+    """
+    Adds the Tweet fields and expansions the aggregate dimensions need to the search request parameters.
+    """
+    from searchtweets import AGGREGATE_FIELDS
+    for dimension in dimensions:
+        for parameter, value in zip(('tweet.fields', 'expansions'), AGGREGATE_FIELDS[dimension]):
+            values = [v for v in request_parameters.get(parameter, '').split(',') if v]
+            if value is not None and value not in values:
+                request_parameters[parameter] = ','.join(values + [value])
+    return request_parameters
+
+def write_ranked_output(ranked_tweets, filepath):
+    """
+    Streams ranked Tweets ({id, score, ...}, best first) to an NDJSON file, one per line.
+    Returns how many were written.
+    """
+    n_written = 0
+    with open(filepath, 'w') as f:
+        for rank, tweet in enumerate(ranked_tweets, start=1):
+            f.write(json.dumps(dict(tweet, rank=rank)) + '\n')
+            n_written = rank
+    return n_written
+
 def write_output(tweets, filepath):
     # Let's write JSON, so make a conversion.
     contents = json.dumps(tweets)
@@ -273,60 +658,73 @@ def write_output(tweets, filepath):
         logging.error(message)
         print(message)
 
-def write_to_database(top_tweets):
+def write_to_database(top_tweets, partial=False, storage=None, query_id=DEFAULT_QUERY_ID, window=DEFAULT_WINDOW,
+                      metric=DEFAULT_METRIC):
 
     """
     Receive a (short?) list of 'top Tweets', ranked by public metrics accumulative 'score.'
-    Writes this list to the snowbot:top_tweets table.
-    Table is wiped clean each time...?
+    Writes this list to the top_tweets table of the storage backend (see storage.py), under
+    (query_id, window, metric). Only ranks that changed since the last cycle are written.
 
+    partial: True when the collection cycle was cut short by its time budget.
+    storage: an open storage backend; by default the one configured by STORAGE_URL / DATABASE_*.
+    """
 
-    INSERT INTO top_tweets
+    return write_rankings_to_database({(window, metric): top_tweets}, partial, storage, query_id)
 
-    VALUES
-    {tweet['tweet_id']}
-    {tweet['score']}
-    {tweet['likes']}
-    {tweet['retweets']}
-    {tweet['replies']}
-    {tweet['quotes']}
-    time.now()
+def write_rankings_to_database(rankings, partial=False, storage=None, query_id=DEFAULT_QUERY_ID):
+    """
+    Writes several top Tweet lists, {(window, metric): top_tweets}, as write_to_database does one,
+    in a single transaction.
     """
 
     success = False
-
-    # TODO: Delete the top_tweets table, about to refresh.
+    close_storage = storage is None
 
     try:
+        if storage is None:
+            storage = open_backend()
 
-        #Create database connection.
-        con = psycopg2.connect(database=DATABASE_NAME, user=DATABASE_USER, password=DATABASE_PASSWORD, host=DATABASE_HOST, port="5432")
-        cur = con.cursor()
-
-        # Delete current top tweets:
-        sql = 'DELETE FROM top_tweets;'
-        cur.execute(sql)
-        con.commit()
-        # print("Deleted contents of top_tweet table...")
-
-        for tweet in top_tweets:
-            sql = f"INSERT INTO top_tweets (tweet_id,score,likes,retweets,replies,quotes,updated_at) VALUES ({tweet['id']},{tweet['score']},{tweet['likes']},{tweet['retweets']},{tweet['replies']},{tweet['quotes']},'{strftime('%Y-%m-%d %H:%M:%S', gmtime())}');"
-            # print(sql)
-            cur.execute(sql)
-            con.commit()
-            success = True
+        n_changed = storage.publish_ranking_set(rankings, query_id, partial=partial)
+        success = True
 
-        print('Wrote top Tweets to database top_tweets table... ')
+        print(f'Wrote top Tweets to database top_tweets table ({n_changed} rows changed)... ')
 
     except Exception as e:
         message = f"Error with INSERT: {e}"
         print(message)
         success = False
 
-    con.close()
+    if close_storage and storage is not None:
+        storage.close()
 
     return success
 
+def write_entities_to_database(entities, storage, query_id=DEFAULT_QUERY_ID, window=DEFAULT_WINDOW):
+    """
+    Replaces the top authors, hashtags, mentions and media ({dimension: ranked entities}) of
+    (query_id, window) in the top_entities table.
+    """
+    try:
+        n_rows = storage.publish_entities(entities, query_id, window)
+    except Exception as e:
+        print(f"Error writing top entities: {e}")
+        return False
+    print(f'Wrote {n_rows} top entities to database top_entities table... ')
+    return True
+
+def write_stats_to_database(stats, storage):
+    """
+    Appends this cycle's stats rows (see STATS_COLUMNS in storage.py) to the top_tweet_stats
+    table, in one batched insert. A failure here is reported, but doesn't fail the cycle.
+    """
+    try:
+        storage.write_stats(stats)
+    except Exception as e:
+        print(f"Error writing cycle stats: {e}")
+        return False
+    return True
+
 def main():
     # The usage pattern here is to make one daily request, aligned to midnight PST, requesting at 3 AM.
     # So, set up the start and end times.
@@ -336,6 +734,9 @@ def main():
     # end_time = f"{ts.year}-{ts.month}-{ts.day-2}T{ts.hour - 3}:00:00Z"
     # print(f"Collecting matched Tweets from {start_time} to {end_time}")
 
+    # Any time budget covers the whole cycle, set-up included.
+    cycle_started = time.time()
+
     # Doing some house-keeping, setting up logging, reading in config file, and loading creds.
     args_dict = vars(parse_cmd_args().parse_args())
     max_top_tweets = MAX_TOP_TWEETS
@@ -344,33 +745,204 @@ def main():
 
     stream_params = do_set_up(args_dict)
 
-    # Create an object that will return Tweets.
-    rs = ResultStream(tweetify=False, **stream_params)
+    # Compiled once, shared by the early stop and the ranking.
+    scorer = compile_formula(args_dict['score_formula'] or os.getenv('score_formula', DEFAULT_FORMULA))
+
+    time_budget = stream_params.pop('time_budget', None)
+    if time_budget is not None:
+        stream_params['deadline'] = cycle_started + time_budget
+        if stream_params.get('reserve_seconds') is None:
+            stream_params['reserve_seconds'] = PUBLISH_RESERVE_SECONDS
+
+    two_phase = args_dict['two_phase'] or os.getenv('two_phase', '').lower() in ('1', 'true')
+    if two_phase:
+        search_parameters, hydration_fields = split_two_phase_parameters(stream_params['request_parameters'], scorer,
+                                                                         args_dict['collapse_retweets'])
+        stream_params['request_parameters'] = search_parameters
+
+    # Create an object that will return Tweets. Queries over the length limit are split up.
+    request_parameters = stream_params['request_parameters']
+    if isinstance(request_parameters, str):
+        request_parameters = json.loads(request_parameters)
+
+    # Several windows come from one fetch, covering the widest of them.
+    windows = parse_windows(args_dict['windows'] or os.getenv('windows'))
+    if windows and not request_parameters.get('start_time'):
+        request_parameters['start_time'] = strftime('%Y-%m-%dT%H:%M:%SZ', gmtime(cycle_started - max(windows.values())))
+        stream_params['request_parameters'] = request_parameters
+    decay = make_decay(args_dict['decay'] or os.getenv('decay'))
+    if windows:
+        window_ranker = WindowedTopK(int(max_top_tweets), windows,
+                                     ranking_metrics(args_dict['metrics'] or os.getenv('metrics'), decay, cycle_started),
+                                     now=cycle_started)
+
+
+    # Top authors, hashtags, mentions and media are counted in the same pass as the top Tweets.
+    aggregates = [a.strip() for a in (args_dict['aggregates'] or os.getenv('aggregates', '')).split(',') if a.strip()]
+    if aggregates:
+        if 'tweets' in aggregates:
+            raise ValueError("Top Tweets are always ranked; --aggregates takes authors, hashtags, mentions and media.")
+        from searchtweets import Aggregator # Only needed with --aggregates.
+        aggregator = Aggregator(int(max_top_tweets), aggregates, by=args_dict['aggregate_by'],
+                                sketch_epsilon=args_dict['sketch_epsilon'] or float(os.getenv('sketch_epsilon', 0)) or None)
+        stream_params['request_parameters'] = add_aggregate_fields(request_parameters, ['tweets'] + aggregates)
+
+    if len(request_parameters['query']) > args_dict['max_query_length']:
+        from searchtweets import SplitQueryStream # Only needed for queries over the length limit.
+        rs = SplitQueryStream(max_length=args_dict['max_query_length'], **stream_params)
+    else:
+        rs = ResultStream(tweetify=False, **stream_params)
+        if request_parameters.get('sort_order') == 'relevancy' and args_dict['early_stop_margin'] is not None and not rs.workers:
+            # Pages are judged by the score the Tweets will be ranked by, so decayed when decay is on.
+            score_func = scorer.score_tweet
+            if decay is not None:
+                score_func = lambda tweet: decay.value(scorer.score_tweet(tweet), snowflake_seconds(tweet['id']),
+                                                       cycle_started)
+            rs.early_stop = EarlyStop(int(max_top_tweets),
+                                      score_func=score_func,
+                                      margin=args_dict['early_stop_margin'],
+                                      patience=args_dict['early_stop_patience'])
     logger.debug(str(rs))
 
     stream = rs.stream()
 
-    engaged_tweets = []  # {id,engagements}
+    # Big rankings are sorted externally, spilling to disk, rather than as an in-memory list.
+    ranked_output = args_dict['ranked_output']
+    spill_mb = args_dict['spill_mb'] or float(os.getenv('spill_mb', 0)) or (SPILL_MEMORY_MB if ranked_output else None)
+    spill_ranker = None
+    if spill_mb and not windows:
+        from searchtweets import ExternalRanker # Only needed to rank candidates on disk.
+        spill_ranker = ExternalRanker(spill_mb)
+    snapshot_path = args_dict['snapshots'] or os.getenv('snapshot_store')
+
+    # Each cycle's Tweets can be archived, compactly, for analyses across cycles (say, week over week).
+    archive_prefix = args_dict['archive_prefix'] or os.getenv('archive_prefix')
+    if archive_prefix:
+        from searchtweets import ArchiveWriter, ARCHIVE_SUFFIX # Only needed with --archive.
+        archive = ArchiveWriter(f"{archive_prefix}_{strftime('%Y-%m-%dT%H_%M_%S', gmtime(cycle_started))}{ARCHIVE_SUFFIX}",
+                                metadata={'query': request_parameters['query'],
+                                          'query_id': args_dict['query_id'] or os.getenv('query_id', DEFAULT_QUERY_ID)},
+                                text=False)
+
+    engaged_tweets = []  # {id,engagements}; not kept when they are spilled, unless snapshotted.
+    n_candidates = 0
     total_tweets = 0
+    total_pages = 0
+    # Tweet IDs already ranked, so a Tweet (or, collapsing Retweets, its original) is only counted once.
+    seen_ids = SeenIds()
+
+    # Time spent ranking pages is timed on its own; the rest of the collect stage is waiting on requests.
+    collect_started = time.time()
+    rank_seconds = 0
 
     # Parse response, and iterate through Tweet array.
     for response in stream:
         tweets = response['data']
         total_tweets = total_tweets + len(tweets)
+        total_pages += 1
         print(f"{len(tweets)} Tweets in response. ")
 
-        engaged_tweets = add_up_engagements(tweets)
-
+        rank_started = time.time()
+        tweets = list(dedupe_tweets(tweets, seen_ids,
+                                    collapse_retweets=args_dict['collapse_retweets'],
+                                    includes=response.get('includes')))
+
+        if archive_prefix:
+            archive.add_tweets(tweets)
+        scores = scorer.score_tweets(tweets)
+        if aggregates:
+            aggregator.add_tweets(tweets, response.get('includes'), scores)
+        page_tweets = add_up_engagements(tweets, scorer, scores)
+        if windows:
+            for tweet in page_tweets:
+                window_ranker.add(tweet)
+        if spill_ranker is not None:
+            for tweet in page_tweets:
+                spill_ranker.add(tweet, tweet['score'] if decay is None else
+                                 decay.value(tweet['score'], snowflake_seconds(tweet['id']), cycle_started))
+        if spill_ranker is None or snapshot_path:
+            engaged_tweets.extend(page_tweets)
+        n_candidates += len(page_tweets)
+        rank_seconds += time.time() - rank_started
+
+    collect_seconds = time.time() - collect_started
     print(f"Collected {total_tweets} Tweets.")
-    sorted_tweets = sort_tweets(engaged_tweets)
+    if getattr(rs, 'n_cache_hits', 0):
+        print(f"Read {rs.n_cache_hits} pages from the cache, and requested {rs.n_requests}.")
+    if getattr(rs, 'stopped_early', False):
+        print(f"Stopped paging early after {rs.n_requests} requests; later pages were no longer improving the top Tweets.")
+    if rs.partial:
+        print("Ran out of time budget, publishing the best-so-far ranking as partial.")
+    if archive_prefix:
+        print(f"Archived {len(archive)} Tweets ({archive.close()} bytes) to {archive.filename}.")
+    rank_started = time.time()
+    if windows:
+        rankings = window_rankings(window_ranker)
+        # The widest window's first metric stands for the cycle, in logs and stats.
+        window = max(windows, key=windows.get)
+        top_tweets = next(top for (label, _), top in rankings.items() if label == window)
+    elif spill_ranker is not None:
+        print(f"{n_candidates} Tweets with at least {ENGAGEMENTS_MINIMUM} engagements, {spill_ranker.n_spilled} spilled to disk.")
+        if ranked_output:
+            print(f"Wrote {write_ranked_output(spill_ranker.ranked(), ranked_output)} ranked Tweets to {ranked_output}.")
+        top_tweets = [dict(tweet, score=float(f"{tweet['score']:.6g}")) for tweet in spill_ranker.ranked(int(max_top_tweets))]
+        spill_ranker.close()
+    elif decay is not None:
+        top_tweets = decay_tweets(engaged_tweets, decay, int(max_top_tweets), now=cycle_started)
+    else:
+        sorted_tweets = sort_tweets(engaged_tweets)
+        top_tweets = sorted_tweets[:int(max_top_tweets)]
+    rank_seconds += time.time() - rank_started
 
-    top_tweets = sorted_tweets[:int(max_top_tweets)]
+    hydrate_started = time.time()
+    if two_phase:
+        # With --windows, the Tweets of every ranking are looked up together.
+        hydrate_top_tweets([tweet for ranked in (rankings.values() if windows else [top_tweets]) for tweet in ranked],
+                           hydration_fields, stream_params)
+    hydrate_seconds = time.time() - hydrate_started
 
     logger.debug(f"Top {max_top_tweets} Tweets:")
     for tweet in top_tweets:
         logger.debug(f"{tweet['score']} engagements: https://twitter.com/author/status/{tweet['id']}")
 
-    write_to_database(top_tweets)
+    retention_days = args_dict['snapshot_retention_days'] or float(os.getenv('snapshot_retention_days', SNAPSHOT_RETENTION_DAYS))
+    query_id = args_dict['query_id'] or os.getenv('query_id', DEFAULT_QUERY_ID)
+    if not windows:
+        window = args_dict['window'] or os.getenv('window', DEFAULT_WINDOW)
+        rankings = {(window, DEFAULT_METRIC): top_tweets}
+
+    if snapshot_path:
+        rank_started = time.time()
+        rankings[(window, 'rising')] = rising_tweets(snapshot_path, engaged_tweets, cycle_started, int(max_top_tweets),
+                                                     args_dict['rising_cycles'])
+        rank_seconds += time.time() - rank_started
+
+    publish_started = time.time()
+    storage = open_backend(args_dict['storage_url'], snapshot_retention_days=retention_days)
+    write_rankings_to_database(rankings, partial=rs.partial, storage=storage, query_id=query_id)
+    if aggregates:
+        write_entities_to_database(aggregator.results(), storage, query_id, window)
+    storage.expire_snapshots()
+    publish_seconds = time.time() - publish_started
+
+    write_stats_to_database([{'search_query': request_parameters['query'],
+                              'query_id': query_id,
+                              'time_window': window,
+                              'tweet_volume_cycle': total_tweets,
+                              'candidates_cycle': n_candidates,
+                              'top_tweets_cycle': len(top_tweets),
+                              'pages_cycle': total_pages,
+                              'requests_cycle': rs.n_requests,
+                              'retries_cycle': rs.n_retries,
+                              'bytes_cycle': rs.n_bytes,
+                              'partial': rs.partial,
+                              'collect_seconds': round(collect_seconds - rank_seconds, 3),
+                              'rank_seconds': round(rank_seconds, 3),
+                              'hydrate_seconds': round(hydrate_seconds, 3),
+                              'publish_seconds': round(publish_seconds, 3),
+                              'cycle_seconds': round(time.time() - cycle_started, 3),
+                              'updated_at': strftime('%Y-%m-%d %H:%M:%S', gmtime())}], storage)
+    storage.close()
     # write_output(sorted_tweets, f"{FILE_DIR}/{FILE_NAME}")
 
 if __name__ == '__main__':